@@ -0,0 +1,63 @@
+from table import table
+
+from dataclasses import dataclass
+from os import remove
+from os.path import exists
+from time import perf_counter
+import unittest
+
+
+DB = "compact_benchmark.db"
+ROWS = 200000
+CUSTOMERS = 2000
+SCANS = 500
+
+
+@dataclass
+class Purchase:
+    customer_id: int
+    amount: float
+    note: str
+
+
+class TestCompact(unittest.TestCase):
+    def setUp(self) -> None:
+        if exists(DB):
+            remove(DB)
+
+    def tearDown(self) -> None:
+        self.setUp()
+
+    def scan(self, purchases) -> float:
+        stmt = "select sum(amount) as total from purchase where customer_id = ?"
+        start = perf_counter()
+        for i in range(SCANS):
+            purchases.query(stmt, (i * 7 % CUSTOMERS,))
+        return perf_counter() - start
+
+    def test_range_scans_before_and_after(self):
+        print()
+        purchases = table(Purchase, DB)
+        purchases.insert(
+            [
+                Purchase(i % CUSTOMERS, i / 100, "x" * 100)
+                for i in range(ROWS)
+            ]
+        )
+        purchases.index_column("customer_id")
+        # a small page cache, so scattered rows cost reads
+        purchases.query("pragma cache_size = 50")
+
+        before = self.scan(purchases)
+        report = purchases.compact(
+            order_by=["customer_id"]
+        )
+        purchases.query("pragma cache_size = 50")
+        after = self.scan(purchases)
+
+        print(
+            f"  pages: {report['before']} -> {report['after']}"
+        )
+        print(f" before: {SCANS / before:7.0f} scans/s")
+        print(f"  after: {SCANS / after:7.0f} scans/s")
+        self.assertLess(after, before)
@@ -0,0 +1,83 @@
+from table import table
+
+from dataclasses import dataclass, field
+from os import remove
+from os.path import exists, getsize
+from time import perf_counter
+import json
+import unittest
+
+
+ROWS = 5000
+DB = ".bench_compression.db"
+
+
+def payload(i: int) -> str:
+    # a few KB of repetitive JSON, like an event payload
+    return json.dumps(
+        {
+            "id": i,
+            "tags": ["alpha", "beta", "gamma"] * 20,
+            "readings": [
+                {"sensor": s, "value": (i * s) % 97}
+                for s in range(40)
+            ],
+        }
+    )
+
+
+def make_class(codec):
+    metadata = {"compress": codec} if codec else {}
+
+    @dataclass
+    class Event:
+        id: int
+        payload: str = field(metadata=metadata)
+
+    return Event
+
+
+def run(codec):
+    Event = make_class(codec)
+    events = table(Event, DB)
+
+    start = perf_counter()
+    events.insert(
+        [Event(i, payload(i)) for i in range(ROWS)]
+    )
+    write = perf_counter() - start
+    events.close()
+    size = getsize(DB)
+
+    start = perf_counter()
+    rows = events.query("select * from event").rows
+    scan = perf_counter() - start
+    assert len(rows) == ROWS
+
+    events.close()
+    return size, write, scan
+
+
+class TestCompression(unittest.TestCase):
+    def setUp(self) -> None:
+        if exists(DB):
+            remove(DB)
+
+    def tearDown(self) -> None:
+        self.setUp()
+
+    def test_file_size_and_scan(self):
+        print()
+        sizes = {}
+        for codec in (None, "zlib", "lzma"):
+            self.setUp()
+            size, write, scan = run(codec)
+            sizes[codec] = size
+            print(
+                f"{str(codec):>5}: {size / 2**20:6.2f}MiB, "
+                f"insert {ROWS / write:9.0f} rows/s, "
+                f"scan {ROWS / scan:9.0f} rows/s"
+            )
+
+        self.assertLess(sizes["zlib"], sizes[None] / 2)
+        self.assertLess(sizes["lzma"], sizes[None] / 2)
@@ -0,0 +1,46 @@
+from table import table
+
+from dataclasses import dataclass, field
+from time import perf_counter
+import json
+import unittest
+
+
+ROWS = 200000
+WORKERS = 4
+
+
+# module level, so the worker processes can unpickle it
+@dataclass
+class Event:
+    id: int
+    kind: str
+    payload: str = field(metadata={"compress": "zlib"})
+
+
+def events():
+    for i in range(ROWS):
+        payload = json.dumps({"id": i, "tags": ["a"] * 20})
+        yield Event(i, f"kind_{i % 10}", payload)
+
+
+class TestParallelLoad(unittest.TestCase):
+    def test_insert_vs_parallel_load(self):
+        print()
+        timings = {}
+
+        serial = table(Event)
+        start = perf_counter()
+        serial.insert(list(events()))
+        timings["insert"] = perf_counter() - start
+
+        parallel = table(Event)
+        start = perf_counter()
+        loaded = parallel.parallel_load(
+            events(), workers=WORKERS
+        )
+        timings["parallel_load"] = perf_counter() - start
+        self.assertEqual(loaded, ROWS)
+
+        for name, secs in timings.items():
+            print(f"{name:>14}: {ROWS / secs:9.0f} rows/s")
@@ -0,0 +1,45 @@
+from table import table
+
+from dataclasses import dataclass
+from time import perf_counter
+import unittest
+
+
+ROWS = 10000
+CALLS = 50000
+
+
+@dataclass
+class Person:
+    id: int
+    name: str
+    age: int
+
+
+class TestPrepare(unittest.TestCase):
+    def test_query_vs_prepare(self):
+        print()
+        people = table(Person)
+        people.insert(
+            [
+                Person(i, f"n{i}", i % 90)
+                for i in range(ROWS)
+            ]
+        )
+        people.index_column("id")
+        stmt = "select name, age from person where id = ?"
+
+        start = perf_counter()
+        for i in range(CALLS):
+            people.query(stmt, (i % ROWS,))
+        query = perf_counter() - start
+
+        by_id = people.prepare(stmt)
+        start = perf_counter()
+        for i in range(CALLS):
+            by_id((i % ROWS,))
+        prepared = perf_counter() - start
+
+        print(f"  query: {CALLS / query:9.0f} calls/s")
+        print(f"prepare: {CALLS / prepared:9.0f} calls/s")
+        self.assertLess(prepared, query)
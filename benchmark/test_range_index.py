@@ -0,0 +1,59 @@
+from table import table
+
+from dataclasses import dataclass
+from random import Random
+from time import perf_counter
+import unittest
+
+
+ROWS = 200000
+QUERIES = 200
+
+
+@dataclass
+class Place:
+    name: str
+    lat: float
+    lon: float
+
+
+class TestRangeIndex(unittest.TestCase):
+    def test_btree_vs_rtree(self):
+        print()
+        rng = Random(42)
+        places = table(Place)
+        places.insert(
+            [
+                Place(
+                    f"p{i}",
+                    rng.uniform(-90, 90),
+                    rng.uniform(-180, 180),
+                )
+                for i in range(ROWS)
+            ]
+        )
+        boxes = [
+            (rng.uniform(-89, 89), rng.uniform(-179, 179))
+            for _ in range(QUERIES)
+        ]
+
+        places.index_column("lat")
+        stmt = "select * from place where lat between ? and ? and lon between ? and ?"
+        start = perf_counter()
+        for lat, lon in boxes:
+            places.query(
+                stmt, (lat, lat + 1, lon, lon + 1)
+            )
+        btree = perf_counter() - start
+
+        places.index_range(["lat", "lon"])
+        start = perf_counter()
+        for lat, lon in boxes:
+            places.within(
+                lat=(lat, lat + 1), lon=(lon, lon + 1)
+            )
+        rtree = perf_counter() - start
+
+        print(f" B-tree: {QUERIES / btree:7.0f} boxes/s")
+        print(f" R*Tree: {QUERIES / rtree:7.0f} boxes/s")
+        self.assertLess(rtree, btree)
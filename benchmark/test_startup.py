@@ -0,0 +1,82 @@
+from os.path import abspath, dirname
+from statistics import median
+from subprocess import check_output
+import sys
+import unittest
+
+
+ROOT = dirname(dirname(abspath(__file__)))
+RUNS = 7
+
+# generous ceilings (in seconds) meant to catch regressions
+# such as an eager heavy import, not to measure precisely
+IMPORT_BUDGET = 0.05
+FIRST_QUERY_BUDGET = 0.1
+
+
+IMPORT = """
+from time import perf_counter
+start = perf_counter()
+import table
+print(perf_counter() - start)
+"""
+
+FIRST_QUERY = """
+from dataclasses import dataclass
+from time import perf_counter
+
+@dataclass
+class Foo:
+    letters: str
+    number: int
+
+start = perf_counter()
+from table import table
+foo = table(Foo)
+foo.insert(Foo("abc", 1))
+foo.query("select * from foo")
+print(perf_counter() - start)
+"""
+
+UNUSED_TABLES = """
+from dataclasses import dataclass
+from time import perf_counter
+
+@dataclass
+class Foo:
+    letters: str
+    number: int
+
+start = perf_counter()
+from table import table
+tables = [table(Foo) for _ in range(1000)]
+print(perf_counter() - start)
+"""
+
+
+def timed(code: str) -> float:
+    runs = [
+        float(
+            check_output([sys.executable, "-c", code], cwd=ROOT)
+        )
+        for _ in range(RUNS)
+    ]
+    return median(runs)
+
+
+class TestStartup(unittest.TestCase):
+    def test_import_time(self):
+        elapsed = timed(IMPORT)
+        print(f"\nimport table: {elapsed * 1000:.2f}ms")
+        self.assertLess(elapsed, IMPORT_BUDGET)
+
+    def test_first_query_latency(self):
+        elapsed = timed(FIRST_QUERY)
+        print(f"\nfirst query: {elapsed * 1000:.2f}ms")
+        self.assertLess(elapsed, FIRST_QUERY_BUDGET)
+
+    def test_unused_tables_are_free(self):
+        # tables that are never used never connect
+        elapsed = timed(UNUSED_TABLES)
+        print(f"\n1000 unused tables: {elapsed * 1000:.2f}ms")
+        self.assertLess(elapsed, FIRST_QUERY_BUDGET)
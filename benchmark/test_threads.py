@@ -0,0 +1,76 @@
+from table import table
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from os import cpu_count, remove
+from os.path import exists
+from time import perf_counter
+import unittest
+
+
+ROWS = 20000
+OPS = 400
+WRITE_EVERY = 10  # one write per this many operations
+THREADS = (1, 2, 4, 8)
+DB = ".bench_threads.db"
+
+
+@dataclass
+class Reading:
+    sensor: int
+    value: float
+
+
+def work(readings, idx: int) -> None:
+    if idx % WRITE_EVERY == 0:
+        readings.insert(
+            [Reading(idx % 50, i / 7) for i in range(10)]
+        )
+    else:
+        # time spent inside SQLite, which releases the GIL
+        readings.query(
+            "select sensor, avg(value) as avg from reading where sensor between ? and ? group by sensor",
+            (idx % 40, idx % 40 + 10),
+        )
+
+
+def throughput(readings, threads: int) -> float:
+    start = perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        list(
+            pool.map(
+                lambda idx: work(readings, idx), range(OPS)
+            )
+        )
+    return OPS / (perf_counter() - start)
+
+
+class TestThreads(unittest.TestCase):
+    def setUp(self) -> None:
+        for suffix in ("", "-wal", "-shm"):
+            if exists(DB + suffix):
+                remove(DB + suffix)
+
+    def tearDown(self) -> None:
+        self.setUp()
+
+    def test_scaling(self):
+        print(f"\n{cpu_count()} CPUs")
+        for location in (None, DB):
+            readings = table(
+                Reading, location, threadsafe=True
+            )
+            readings.insert(
+                [
+                    Reading(i % 50, i / 3)
+                    for i in range(ROWS)
+                ]
+            )
+
+            kind = "file" if location else "memory"
+            for threads in THREADS:
+                ops = throughput(readings, threads)
+                print(
+                    f"{kind:>6}, {threads} threads: {ops:8.0f} ops/s"
+                )
+            readings.close()
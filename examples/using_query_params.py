@@ -40,3 +40,35 @@ person.query(
 # +----------+-----+---------------+--------------+----------------------------+
 # | Bill Bob |  60 | 111 Cool Town | bill@bob.com | 2021-11-21 21:23:27.863117 |
 # +----------+-----+---------------+--------------+----------------------------+
+
+
+"""
+`LIMIT ? OFFSET ?` is fine for small tables, but SQLite still
+has to walk past every skipped row, so each page gets slower
+the deeper you go. To page through a large table, use the
+`paginate` method instead. It hands back a `cursor` marking
+where the page ended, and the next page seeks straight to it,
+so every page costs the same.
+"""
+
+person.index_column("age")  # lets each page seek on `age`
+
+page = person.paginate(order_by=["age"], page_size=2)
+page.rows
+# +--------------+-----+-----------------+---------------+----------------------------+
+# |     name     | age |     address     |     email     |         timestamp          |
+# +--------------+-----+-----------------+---------------+----------------------------+
+# | Yackley Yoot |  25 | Bumblefartville |          None | 2021-11-21 21:23:27.863117 |
+# |    Joe Schmo |  40 |    100 Place Ln | joe@schmo.com | 2021-11-21 21:23:27.863117 |
+# +--------------+-----+-----------------+---------------+----------------------------+
+
+page = person.paginate(order_by=["age"], page_size=2, after=page.cursor)
+page.rows
+# +----------+-----+---------------+--------------+----------------------------+
+# |   name   | age |    address    |    email     |         timestamp          |
+# +----------+-----+---------------+--------------+----------------------------+
+# | Bill Bob |  60 | 111 Cool Town | bill@bob.com | 2021-11-21 21:23:27.863117 |
+# +----------+-----+---------------+--------------+----------------------------+
+
+page.cursor
+# None, there are no more pages
@@ -1,3 +1,8 @@
-from table.table import table
+from table.table import (
+    federate,
+    memory_limits,
+    statement_cache,
+    table,
+)
 
 __version__ = "0.1.0"
@@ -0,0 +1,224 @@
+"""
+Helpers for splitting simple aggregates into partial states
+that can be computed independently (per file, per batch,
+per insert) and combined afterwards.
+
+Only the decomposable functions are supported: `count`,
+`sum`, `min`, `max` and `avg` (carried as a sum and count).
+"""
+
+
+from table.errors import TableError
+
+import re
+from collections import namedtuple
+from typing import (
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+)
+
+
+__all__ = [
+    "Aggregate",
+    "AggregateQuery",
+    "combine",
+    "parse_aggregate",
+    "parse_aggregates",
+    "parse_query",
+    "partial_terms",
+]
+
+
+AGGREGATE = re.compile(
+    r"^\s*(count|sum|min|max|avg)\s*\(\s*(\*|\w+)\s*\)\s*$",
+    re.IGNORECASE,
+)
+
+
+QUERY = re.compile(
+    r"^\s*select\s+(?P<select>.+?)\s+from\s+(?P<table>\w+)"
+    r"(?:\s+where\s+(?P<where>.+?))?"
+    r"(?:\s+group\s+by\s+(?P<group_by>\w+(?:\s*,\s*\w+)*))?"
+    r"\s*;?\s*$",
+    re.IGNORECASE | re.DOTALL,
+)
+TERM = re.compile(
+    r"^\s*(?P<expr>.+?)(?:\s+as\s+(?P<alias>\w+))?\s*$",
+    re.IGNORECASE | re.DOTALL,
+)
+
+
+Aggregate = namedtuple(
+    "Aggregate", ["func", "column", "alias"]
+)
+
+
+# `columns` holds the output names in SELECT order
+AggregateQuery = namedtuple(
+    "AggregateQuery",
+    [
+        "table",
+        "group_by",
+        "aggregates",
+        "columns",
+        "where",
+    ],
+)
+
+
+def parse_aggregate(
+    alias: str, expression: str
+) -> Aggregate:
+    match = AGGREGATE.match(expression)
+    if not match:
+        msg = f"Unsupported aggregate '{expression}'; expected one of count/sum/min/max/avg over a single column"
+        raise TableError(msg)
+
+    func, column = match.groups()
+    func = func.lower()
+    if column == "*" and func != "count":
+        msg = f"'{func}' requires a column, received '*'"
+        raise TableError(msg)
+
+    return Aggregate(func, column.lower(), alias)
+
+
+def parse_aggregates(
+    aggregates: Dict[str, str]
+) -> List[Aggregate]:
+    return [
+        parse_aggregate(alias, expression)
+        for alias, expression in aggregates.items()
+    ]
+
+
+def parse_query(sql: str) -> AggregateQuery:
+    """
+    Parse `SELECT <columns/aggregates> FROM <table>
+    [WHERE <filter>] [GROUP BY <columns>]`, where every selected plain column
+    is grouped on and every aggregate is decomposable
+    """
+    match = QUERY.match(sql)
+    if not match:
+        msg = f"Unsupported query shape: '{sql}'"
+        raise TableError(msg)
+
+    group_by = []
+    if match["group_by"]:
+        group_by = [
+            col.strip().lower()
+            for col in match["group_by"].split(",")
+        ]
+
+    aggregates = []
+    columns = []
+    for term in match["select"].split(","):
+        expr, alias = TERM.match(term).groups()
+
+        if re.fullmatch(r"\w+", expr):
+            col = expr.lower()
+            if col not in group_by or (
+                alias and alias.lower() != col
+            ):
+                msg = f"Column '{expr}' must appear in GROUP BY"
+                raise TableError(msg)
+            columns.append(col)
+            continue
+
+        agg = parse_aggregate(alias or "", expr)
+        if not alias:
+            name = agg.func
+            if agg.column != "*":
+                name += f"_{agg.column}"
+            agg = agg._replace(alias=name)
+
+        aggregates.append(agg)
+        columns.append(agg.alias)
+
+    if not aggregates:
+        msg = f"Query has no aggregates: '{sql}'"
+        raise TableError(msg)
+
+    table = match["table"].lower()
+    return AggregateQuery(
+        table,
+        group_by,
+        aggregates,
+        columns,
+        match["where"],
+    )
+
+
+def partial_terms(aggregate: Aggregate) -> List[str]:
+    func, column, _ = aggregate
+    if func == "avg":
+        return [f"sum({column})", f"count({column})"]
+    return [f"{func}({column})"]
+
+
+def combine(
+    aggregates: List[Aggregate],
+    groups: int,
+    partials: Iterable[tuple],
+) -> List[tuple]:
+    """
+    Merge partial rows of the form (*group_values,
+    *partial_terms) into one final row per group
+    """
+    widths = [len(partial_terms(a)) for a in aggregates]
+    states: Dict[tuple, List[Optional[list]]] = {}
+
+    for row in partials:
+        key = tuple(row[:groups])
+        values = row[groups:]
+
+        state = states.setdefault(
+            key, [None] * len(aggregates)
+        )
+        offset = 0
+        for idx, (agg, width) in enumerate(
+            zip(aggregates, widths)
+        ):
+            end = offset + width
+            chunk = list(values[offset:end])
+            offset = end
+            if state[idx] is None:
+                state[idx] = chunk
+            else:
+                state[idx] = [
+                    _merge(agg.func, old, new)
+                    for old, new in zip(state[idx], chunk)
+                ]
+
+    return [
+        key
+        + tuple(
+            _finalize(agg, value)
+            for agg, value in zip(aggregates, state)
+        )
+        for key, state in states.items()
+    ]
+
+
+def _merge(func: str, left, right):
+    if left is None:
+        return right
+    if right is None:
+        return left
+    if func == "min":
+        return min(left, right)
+    if func == "max":
+        return max(left, right)
+    return left + right
+
+
+def _finalize(aggregate: Aggregate, state: Tuple):
+    if aggregate.func != "avg":
+        return state[0]
+    total, count = state
+    if not count:
+        return None
+    return total / count
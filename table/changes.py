@@ -0,0 +1,87 @@
+"""
+SQL for the change feed.
+
+Without a log, the feed is the table itself: rows come back
+in rowid order, so the watermark is simply the last rowid
+seen. SQLite hands out the largest rowid plus one, though,
+so once the last row is deleted its rowid is given to the
+next insert, which falls at or below a watermark already
+past it and is never reported. `track_changes` adds a log
+table filled by triggers, which also captures updates and
+deletes; its AUTOINCREMENT key is then the watermark and is
+never reused.
+"""
+
+
+from table.db import TYPES
+
+from collections import namedtuple
+from typing import Dict, List
+
+
+__all__ = [
+    "Change",
+    "changes_statement",
+    "log_name",
+    "track_statements",
+]
+
+
+Change = namedtuple("Change", ["token", "op", "record"])
+
+
+def log_name(table: str) -> str:
+    return f"_changes_{table}"
+
+
+def track_statements(
+    table: str,
+    schema: Dict[str, type],
+    updates: bool = True,
+    deletes: bool = True,
+) -> List[str]:
+    log = log_name(table)
+    col_defs = ", ".join(
+        f"{col} {TYPES[typ]}"
+        for col, typ in schema.items()
+    )
+    stmts = [
+        f"CREATE TABLE IF NOT EXISTS {log} (_seq INTEGER PRIMARY KEY AUTOINCREMENT, _op TEXT, {col_defs})"
+    ]
+
+    events = [("INSERT", "NEW")]
+    if updates:
+        events.append(("UPDATE", "NEW"))
+    if deletes:
+        events.append(("DELETE", "OLD"))
+
+    cols = ", ".join(schema)
+    for event, row in events:
+        trigger = f"{log}_a{event[0].lower()}"
+        values = ", ".join(
+            f"{row}.{col}" for col in schema
+        )
+        stmts += [
+            f"DROP TRIGGER IF EXISTS {trigger}",
+            f"CREATE TRIGGER {trigger} AFTER {event} ON {table} "
+            f"BEGIN INSERT INTO {log} (_op, {cols}) "
+            f"VALUES ('{event.lower()}', {values}); END",
+        ]
+
+    return stmts
+
+
+def changes_statement(
+    table: str, schema: Dict[str, type], logged: bool
+) -> str:
+    cols = ", ".join(schema)
+    if logged:
+        log = log_name(table)
+        return (
+            f"SELECT _seq AS change_token, _op AS change_op, {cols} FROM {log} "
+            "WHERE _seq > ? ORDER BY _seq LIMIT ?"
+        )
+    return (
+        f"SELECT rowid AS change_token, 'insert' AS change_op, {cols} FROM {table} "
+        "WHERE rowid > ? ORDER BY rowid LIMIT ?"
+    )
@@ -0,0 +1,128 @@
+"""
+Checksums over ranges of rows.
+
+Each row is hashed (sha1, truncated to 64 bits) and a range's
+checksum is the sum of its rows' hashes, modulo 2**64. Being
+a sum, the checksum of a range is also the sum of its
+sub-ranges' checksums, so the ranges form a hash tree
+without any hashing beyond the rows themselves: two copies of
+a table are compared from the top, descending only into the
+sub-ranges whose checksums differ.
+
+Ranges are over the rowid, or an integer key column when
+the copies were loaded in different orders. The hashing runs
+inside SQLite, as the `row_checksum` aggregate.
+"""
+
+
+from collections import namedtuple
+from typing import List, Tuple
+
+
+__all__ = [
+    "AGGREGATES",
+    "HASH_FUNCTIONS",
+    "Diff",
+    "RangeChecksum",
+    "RowChecksum",
+    "bucket_statement",
+    "combine",
+    "range_statement",
+    "record_hash",
+    "split",
+]
+
+
+# sub-ranges per level when descending, and the widest range
+# whose rows are compared directly
+FANOUT = 16
+LEAF_SPAN = 512
+
+MODULUS = 2 ** 64
+EMPTY = f"{0:016x}"
+
+RangeChecksum = namedtuple(
+    "RangeChecksum", ["low", "high", "rows", "digest"]
+)
+
+# keys only in the first table, only in the second, and in
+# both with different values
+Diff = namedtuple("Diff", ["missing", "extra", "changed"])
+
+
+def row_digest(values: tuple, signed: bool = False) -> int:
+    from hashlib import sha1
+
+    digest = sha1(repr(values).encode()).digest()
+    return int.from_bytes(digest[:8], "big", signed=signed)
+
+
+def record_hash(*values) -> int:
+    """
+    SQL function: a row's hash, as a (signed) SQLite integer
+    """
+    return row_digest(values, signed=True)
+
+
+class RowChecksum:
+    """
+    SQL aggregate: the checksum of the rows in a group,
+    passing every column of each row
+    """
+
+    def __init__(self) -> None:
+        self.total = 0
+
+    def step(self, *values) -> None:
+        self.total = (
+            self.total + row_digest(values)
+        ) % MODULUS
+
+    def finalize(self) -> str:
+        return f"{self.total:016x}"
+
+
+def combine(digests: List[str]) -> str:
+    total = sum(int(d, 16) for d in digests) % MODULUS
+    return f"{total:016x}"
+
+
+def split(
+    low: int, high: int, parts: int
+) -> Tuple[int, List[Tuple[int, int]]]:
+    """
+    The bucket width and (low, high) bounds splitting
+    `low`..`high` (inclusive) into at most `parts` ranges
+    """
+    span = high - low + 1
+    width = max(-(-span // parts), 1)
+    bounds = [
+        (start, min(start + width - 1, high))
+        for start in range(low, high + 1, width)
+    ]
+    return width, bounds
+
+
+def bucket_statement(
+    source: str, key: str, columns: List[str]
+) -> str:
+    """
+    The count and checksum of each of the equal width
+    buckets between two keys, bound as (low, width, low,
+    high)
+    """
+    args = ", ".join([key] + columns)
+    return f"SELECT ({key} - ?) / ? AS bucket, count(*) AS rows, row_checksum({args}) AS digest FROM {source} WHERE {key} BETWEEN ? AND ? GROUP BY bucket"
+
+
+def range_statement(
+    source: str, key: str, columns: List[str]
+) -> str:
+    cols = ", ".join(columns)
+    return f"SELECT {key} AS range_key, {cols} FROM {source} WHERE {key} BETWEEN ? AND ?"
+
+
+# (name, number of arguments, class or function), for use
+# in SQL
+AGGREGATES = [("row_checksum", -1, RowChecksum)]
+HASH_FUNCTIONS = [("record_hash", -1, record_hash)]
@@ -0,0 +1,73 @@
+"""
+SQL for compacting a table.
+
+A table's b-tree is keyed by rowid, so rows sit on disk in
+the order they arrived. `compact` copies them to a TEMP
+table in `order_by` order, empties the table and fills it
+again from the copy: rowids are handed out afresh in sorted
+order, and rows adjacent in that order now share pages.
+
+The table's indexes and triggers are dropped first, so that
+neither slows the copy down nor sees it (a change log would
+otherwise record every row as deleted and inserted again),
+and created again afterwards from their DDL. Full-text and
+range indexes refer to rows by rowid, so they are rebuilt.
+"""
+
+
+from table.db import qualified_ddl, text_index_name
+from table.ranges import rebuild_statements
+
+from typing import Dict, List, Tuple
+
+
+__all__ = ["compact_statements", "DEPENDENTS_STATEMENT"]
+
+
+DEPENDENTS_STATEMENT = "SELECT type, name, sql FROM main.sqlite_master WHERE tbl_name = ? AND type IN ('index', 'trigger') AND sql IS NOT NULL"
+
+
+def compact_statements(
+    table: str,
+    schema: Dict[str, type],
+    order_by: List[str],
+    dependents: List[Tuple[str, str, str]],
+    text_indexed: bool = False,
+    range_pairs: List[Tuple[str, str]] = (),
+) -> List[str]:
+    scratch = f"_compact_{table}"
+    cols = ", ".join(schema)
+    order = ", ".join(order_by) or "rowid"
+
+    stmts = [
+        f"DROP TABLE IF EXISTS temp.{scratch}",
+        f"CREATE TEMP TABLE {scratch} AS SELECT {cols} FROM main.{table} ORDER BY {order}",
+    ]
+    stmts += [
+        f"DROP {typ.upper()} main.{name}"
+        for typ, name, _ in dependents
+    ]
+    stmts += [
+        # without triggers, a plain DELETE truncates
+        f"DELETE FROM main.{table}",
+        f"INSERT INTO main.{table} ({cols}) SELECT {cols} FROM temp.{scratch} ORDER BY rowid",
+        f"DROP TABLE temp.{scratch}",
+    ]
+    # indexes first: built from sorted rows, and before the
+    # triggers that may rely on them
+    stmts += [
+        qualified_ddl(sql)
+        for typ, _, sql in sorted(
+            dependents, key=lambda d: d[0] != "index"
+        )
+    ]
+    if text_indexed:
+        fts = text_index_name(table)
+        stmts.append(
+            f"INSERT INTO main.{fts} ({fts}) VALUES ('rebuild')"
+        )
+    if range_pairs:
+        stmts += rebuild_statements(
+            table, schema, list(range_pairs)
+        )
+    return stmts
@@ -0,0 +1,179 @@
+"""
+Columns stored compressed.
+
+A `str` or `bytes` field declared with
+`field(metadata={"compress": "zlib"})` (or "lzma") is kept
+in the database as a compressed BLOB. Its schema type is
+swapped for one of the marker types below, which tells
+`Database.insert` to compress it and gives the column a
+declared type (ZTEXT or ZBLOB) whose sqlite3 converter
+inflates it again when the column is read back.
+
+Compressed values start with a byte no UTF-8 text starts
+with, so values written by plain SQL (`INSERT ... VALUES`,
+prepared statements) are told apart and read back as they
+are (bytes too, unless they happen to start with that
+byte). Both codecs are recognized from the data itself, so
+the codec of a field can change without rewriting old rows.
+Only whole-column reads are decompressed automatically:
+within SQL the value is a BLOB, which the `decompress`,
+`decompress_text` and `compress` functions can work with.
+"""
+
+
+from table.errors import TableError
+
+from typing import Callable, Dict, List, Tuple, Union
+import zlib
+
+
+__all__ = [
+    "CODECS",
+    "CONVERTERS",
+    "FUNCTIONS",
+    "MARKERS",
+    "Compressed",
+    "compress",
+    "compress_rows",
+    "compressed_type",
+    "decompress",
+    "decompress_text",
+    "is_compressed",
+]
+
+
+CODECS = ("zlib", "lzma")
+DECLTYPES = {str: "ZTEXT", bytes: "ZBLOB"}
+
+# https://tukaani.org/xz/xz-file-format.txt
+XZ_MAGIC = b"\xfd7zXZ\x00"
+# leads every compressed value; never the first byte of
+# UTF-8 text
+MAGIC = b"\xff"
+
+
+class Compressed:
+    """
+    Base of the marker types standing in for compressed
+    columns in a table's schema
+    """
+
+    codec: str
+    base: type
+    decltype: str
+
+
+def _marker(base: type, codec: str) -> type:
+    name = f"{codec.title()}{base.__name__.title()}"
+    attrs = {
+        "codec": codec,
+        "base": base,
+        "decltype": DECLTYPES[base],
+    }
+    return type(name, (Compressed,), attrs)
+
+
+MARKERS: Dict[Tuple[type, str], type] = {
+    (base, codec): _marker(base, codec)
+    for base in DECLTYPES
+    for codec in CODECS
+}
+
+
+def compressed_type(typ: type, codec: str) -> type:
+    if codec not in CODECS:
+        msg = f"Unknown codec '{codec}', choose from {list(CODECS)}"
+        raise TableError(msg)
+    if typ not in DECLTYPES:
+        msg = f"Only str and bytes fields can be compressed, not {typ}"
+        raise TableError(msg)
+    return MARKERS[(typ, codec)]
+
+
+def compress(
+    value: Union[str, bytes], codec: str
+) -> bytes:
+    if isinstance(value, str):
+        value = value.encode()
+    if codec == "lzma":
+        # rarely used and slower to import than zlib
+        import lzma
+
+        return MAGIC + lzma.compress(value)
+    return MAGIC + zlib.compress(value)
+
+
+def is_compressed(value: Union[str, bytes]) -> bool:
+    return isinstance(value, bytes) and value.startswith(
+        MAGIC
+    )
+
+
+def decompress(
+    value: Union[str, bytes]
+) -> Union[str, bytes]:
+    """
+    Inflate a compressed value; anything else, such as a
+    value stored by plain SQL, is returned as it is
+    """
+    if not is_compressed(value):
+        return value
+    value = value[1:]  # past MAGIC
+    if value.startswith(XZ_MAGIC):
+        import lzma
+
+        return lzma.decompress(value)
+    return zlib.decompress(value)
+
+
+def compress_rows(
+    schema: Dict[str, type],
+    data: Union[tuple, List[tuple]],
+) -> Union[tuple, List[tuple]]:
+    codecs = [
+        (idx, typ.codec)
+        for idx, typ in enumerate(schema.values())
+        if issubclass(typ, Compressed)
+    ]
+    if not codecs:
+        return data
+
+    def compress_row(row: tuple) -> tuple:
+        row = list(row)
+        for idx, codec in codecs:
+            if row[idx] is not None:
+                row[idx] = compress(row[idx], codec)
+        return tuple(row)
+
+    if isinstance(data, list):
+        return list(map(compress_row, data))
+    return compress_row(data)
+
+
+def decompress_text(value: Union[str, bytes]) -> str:
+    value = decompress(value)
+    if isinstance(value, bytes):
+        return value.decode()
+    return value
+
+
+def _nullsafe(fnc: Callable) -> Callable:
+    def wrapper(value, *args):
+        if value is None:
+            return None
+        return fnc(value, *args)
+
+    return wrapper
+
+
+CONVERTERS = {
+    "ZTEXT": decompress_text,
+    "ZBLOB": decompress,
+}
+
+# (name, number of arguments, function), for use in SQL
+FUNCTIONS = [
+    ("compress", 2, _nullsafe(compress)),
+    ("decompress", 1, _nullsafe(decompress)),
+    ("decompress_text", 1, _nullsafe(decompress_text)),
+]
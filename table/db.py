@@ -8,29 +8,70 @@ need to support others was deemed unnecessary.
 """
 
 
+from table.compression import (
+    CONVERTERS,
+    FUNCTIONS,
+    MARKERS,
+    compress_rows,
+)
+from table.checksums import AGGREGATES, HASH_FUNCTIONS
+from table.dedupe import staging_statements
+from table.dictionary import Dictionary
+from table.ranges import range_index_name
+
 import logging
 from collections import namedtuple
+from contextlib import contextmanager, nullcontext
 from datetime import date, datetime
 from functools import partial, lru_cache, wraps
-from hashlib import sha1
+from itertools import count
+from threading import Lock, RLock, local
+from time import monotonic
 from typing import (
     Callable,
     Dict,
+    Iterator,
     List,
     Optional,
     Tuple,
     Union,
 )
+from os.path import abspath
+import re
 import sqlite3
 from sqlite3 import Connection, Error
 
 
 LOGGER = logging.getLogger(__name__)
 SQLiteType = Union[bytes, float, int, str]
+MAX_ATTACHED = 125  # https://www.sqlite.org/limits.html
+ANALYZE_LOG = "_analyzed"
+
+# compiled statements kept per connection (sqlite3's own
+# default is 128), see `statement_cache`
+CACHED_STATEMENTS = 256
+
+# statements that `is_read` can't tell apart from reads by
+# their first word
+WRITES = re.compile(
+    r"\b(INSERT|UPDATE|DELETE|REPLACE)\b", re.IGNORECASE
+)
+
+# names the in-memory `SharedDatabase`s
+SHARED_IDS = count()
+
+# VM instructions between checks for a timeout, step limit
+# or cancellation
+PROGRESS_INTERVAL = 1000
+
+# bounds on the Python-side caches, least recently used
+# entries are evicted past these
+ROW_CACHE_SIZE = 1024
+SCHEMA_CACHE_SIZE = 256
 
 
 TYPES = {
-    bytes: "TEXT",
+    bytes: "BLOB",
     bool: "NUMERIC",
     date: "DATE",
     datetime: "TIMESTAMP",
@@ -38,6 +79,28 @@ TYPES = {
     int: "INTEGER",
     str: "TEXT",
 }
+# compressed str/bytes columns, see table.compression
+TYPES.update(
+    {typ: typ.decltype for typ in MARKERS.values()}
+)
+# dictionary encoded str columns, see table.dictionary
+TYPES[Dictionary] = Dictionary.decltype
+
+
+# pages per table and index
+STORAGE_STATEMENT = """
+SELECT
+    s.name AS name,
+    coalesce(m.type, 'table') AS type,
+    coalesce(m.tbl_name, s.name) AS tbl,
+    count(*) AS pages,
+    sum(s.pgsize) AS bytes,
+    sum(s.unused) AS unused
+FROM dbstat('main') AS s
+LEFT JOIN sqlite_master AS m ON m.name = s.name
+GROUP BY s.name
+ORDER BY bytes DESC
+"""
 
 
 class DatabaseError(Exception):
@@ -48,18 +111,182 @@ class DatabaseWarning(Warning):
     pass
 
 
+class MemoryLimitError(DatabaseError):
+    pass
+
+
+class QueryInterruptedError(DatabaseError):
+    pass
+
+
+def converted(converter: Callable) -> Callable:
+    # raised from within a fetch, so `fwdexception` never
+    # sees what went wrong
+    @wraps(converter)
+    def wrapper(value: bytes):
+        try:
+            return converter(value)
+        except Exception as e:
+            msg = f"Cannot convert stored value: {e}"
+            raise DatabaseError(msg) from e
+
+    return wrapper
+
+
+for decltype, converter in CONVERTERS.items():
+    sqlite3.register_converter(
+        decltype, converted(converter)
+    )
+
+
+class PreparedQuery:
+    """
+    A parameterized query that is run many times.
+
+    It keeps a cursor of its own, and resolves its columns
+    and row type on the first run that returns rows, so a
+    call costs little more than sqlite3's `execute` (the
+    compiled statement itself comes from the connection's
+    statement cache, see `statement_cache`).
+
+    >>> by_name = db.prepare("SELECT * FROM foo WHERE name = ?")
+    >>> by_name(("Joe",))
+    >>> insert = db.prepare("INSERT INTO foo VALUES (?, ?)")
+    >>> insert.many([("Joe", 30), ("Bob", 40)])
+    """
+
+    def __init__(
+        self,
+        db: "Database",
+        query: str,
+        wrap: Optional[Callable] = None,
+        limits: Optional[Callable] = None,
+    ) -> None:
+        self.query = query
+        self._db = db
+        self._cursors: Dict[
+            Connection, sqlite3.Cursor
+        ] = {}
+        self._guard = db._guard(query)
+        self._row: Optional[Callable] = None
+        # e.g. `Results`, and a context manager factory such
+        # as `interruptible` run around each call
+        self._wrap = wrap
+        self._limits = limits
+
+    def __call__(self, bind: Optional[tuple] = None):
+        if self._limits is None:
+            rows = self._execute(bind or ())
+        else:
+            with self._limits():
+                rows = self._execute(bind or ())
+        if self._wrap is None:
+            return rows
+        return self._wrap(rows)
+
+    def many(self, binds: List[tuple]) -> Union[int, list]:
+        """
+        Run the query once per set of parameters. A write
+        runs in one transaction and returns the number of
+        rows changed; a read returns a result per set
+        """
+        if is_read(self.query):
+            return [self(bind) for bind in binds]
+        with self._db._writing():
+            return execute_many(
+                self._cur(), self.query, binds
+            )
+
+    def close(self) -> None:
+        for cur in self._cursors.values():
+            cur.close()
+
+    def _cur(self) -> sqlite3.Cursor:
+        # one per connection: the database may have
+        # reconnected since (see `Database.move`), or have
+        # one for each thread (see `SharedDatabase`)
+        con = self._db._con
+        cur = self._cursors.get(con)
+        if cur is None:
+            cur = self._cursors[con] = con.cursor()
+        return cur
+
+    def _execute(self, bind: tuple) -> List[tuple]:
+        cur = self._cur()
+        if self._guard is None:
+            rows = execute_prepared(cur, self.query, bind)
+        else:
+            with self._guard:
+                rows = execute_prepared(
+                    cur, self.query, bind
+                )
+
+        if self._row is None:
+            if cur.description is None:
+                return []
+            nt = nt_builder(get_cols(cur.description))
+            self._row = nt._make
+        return list(map(self._row, rows))
+
+
+class Cancellation:
+    """
+    Cancels the queries it is passed to, from any thread.
+
+    >>> cancel = Cancellation()
+    >>> threading.Timer(5, cancel.cancel).start()
+    >>> tbl.query("SELECT ...", cancel=cancel)
+
+    Once cancelled it stays cancelled, so later queries
+    using it fail straight away.
+    """
+
+    def __init__(self) -> None:
+        self.cancelled = False
+        self._running: List[Connection] = []
+        self._lock = Lock()
+
+    def cancel(self) -> None:
+        with self._lock:
+            self.cancelled = True
+            # stops a statement between progress checks too
+            for con in self._running:
+                con.interrupt()
+
+    def _watch(self, con: Connection) -> None:
+        with self._lock:
+            self._running.append(con)
+
+    def _unwatch(self, con: Connection) -> None:
+        with self._lock:
+            self._running.remove(con)
+
+
 class Database:
     def __init__(
         self,
         db: Optional[str] = None,
         db_size: Optional[int] = None,
+        readonly: bool = False,
+        immutable: bool = False,
+        cached_statements: Optional[int] = None,
     ) -> None:
         self.db = db or ":memory:"
         self.db_size = db_size or 268435456
-
-        self._in_mem = not db
+        self.readonly = readonly or immutable
+        self.immutable = immutable
+        self.cached_statements = (
+            CACHED_STATEMENTS
+            if cached_statements is None
+            else cached_statements
+        )
+
+        self._in_mem = self.db == ":memory:"
         self._con = None
         self._tables: Dict[str, Dict[str, type]] = {}
+        self._functions: List[
+            Callable[[Connection], None]
+        ] = []
 
         self._connect()
 
@@ -102,6 +329,12 @@ class Database:
         self, table: str, column: str
     ) -> bool:
         create_index(self._con, table, column)
+        # an index without statistics next to ones with them
+        # throws the planner off, so catch it up
+        if self.analyzed(table)[0] is not None:
+            analyze(
+                self._con, column_index_name(table, column)
+            )
         return True
 
     def insert(
@@ -111,15 +344,46 @@ class Database:
         data: Union[tuple, List[tuple]],
     ) -> bool:
         stmt = insert_statement_from_schema(table, schema)
+        data = compress_rows(schema, data)
         execute(self._con, stmt, data)
         return True
 
+    def insert_distinct(
+        self,
+        table: str,
+        schema: dict,
+        data: List[tuple],
+        database: str = "main",
+    ) -> int:
+        """
+        Insert the rows of `data` whose hash is not already
+        in the table's hashes (see `table.dedupe`), returning
+        how many were inserted
+        """
+        decltypes = {
+            col: TYPES[typ] for col, typ in schema.items()
+        }
+        stmts = staging_statements(
+            table, decltypes, database
+        )
+        data = compress_rows(schema, data)
+        return insert_distinct(self._con, stmts, data)
+
     def execute(
         self, query: str, bind: Optional[tuple] = None
     ) -> List[Optional[tuple]]:
         return execute(self._con, query, bind)
 
-    @lru_cache(maxsize=None)
+    def execute_statements(
+        self,
+        statements: List[
+            Union[str, Tuple[str, List[tuple]]]
+        ],
+    ) -> bool:
+        execute_statements(self._con, statements)
+        return True
+
+    @lru_cache(maxsize=SCHEMA_CACHE_SIZE)
     def schema(self, tablename: str) -> List[dict]:
         return get_schema(self._con, tablename)
 
@@ -127,20 +391,493 @@ class Database:
         backup(self._con, location)
         return True
 
+    def restore(self, location: str) -> bool:
+        """
+        Replace this database with a copy of the file at
+        `location`, which is only read
+        """
+        restore(self._con, location)
+        return True
+
+    def version(self) -> Tuple[int, int]:
+        """
+        Moves whenever this connection changes rows or the
+        schema, so a copy made earlier can be compared
+        """
+        schema = execute(
+            self._con, "PRAGMA schema_version"
+        )
+        return (
+            self._con.total_changes,
+            schema[0].schema_version,
+        )
+
+    def register_function(
+        self,
+        name: str,
+        fnc: Callable,
+        nargs: int,
+        deterministic: bool = True,
+    ) -> bool:
+        register = partial(
+            create_function,
+            name=name,
+            nargs=nargs,
+            fnc=fnc,
+            deterministic=deterministic,
+        )
+        return self._register(register)
+
+    def register_aggregate(
+        self, name: str, cls: type, nargs: int
+    ) -> bool:
+        register = partial(
+            create_aggregate,
+            name=name,
+            nargs=nargs,
+            cls=cls,
+        )
+        return self._register(register)
+
+    def register_window(
+        self, name: str, cls: type, nargs: int
+    ) -> bool:
+        register = partial(
+            create_window_function,
+            name=name,
+            nargs=nargs,
+            cls=cls,
+        )
+        return self._register(register)
+
+    def data_version(self) -> Tuple[int, int]:
+        # `data_version` only moves for commits made by other
+        # connections, `total_changes` covers our own
+        version = execute(self._con, "PRAGMA data_version")
+        return (
+            version[0].data_version,
+            self._con.total_changes,
+        )
+
+    def create_temp_view(
+        self, name: str, select: str
+    ) -> bool:
+        register = partial(
+            create_temp_view, name=name, select=select
+        )
+        return self._register(register)
+
+    def analyze(self, table: str) -> bool:
+        analyze(self._con, table)
+        log_analyze(self._con, table)
+        return True
+
+    def analyzed(
+        self, table: str
+    ) -> Tuple[Optional[int], Optional[datetime]]:
+        """
+        Rows the planner believes `table` has, and when it
+        was last analyzed (both `None` if never)
+        """
+        rows = None
+        if self.table_exists("sqlite_stat1"):
+            stats = execute(
+                self._con,
+                "SELECT stat FROM sqlite_stat1 WHERE tbl = ?",
+                (table,),
+            )
+            counts = [
+                stat_counts(row.stat)[0] for row in stats
+            ]
+            rows = max(counts, default=None)
+
+        when = None
+        if self.table_exists(ANALYZE_LOG):
+            log = execute(
+                self._con,
+                f"SELECT analyzed_at FROM {ANALYZE_LOG} WHERE tbl = ?",
+                (table,),
+            )
+            when = log[0].analyzed_at if log else None
+
+        return rows, when
+
+    def index_stats(
+        self, table: str
+    ) -> Dict[str, Tuple[List[str], Optional[float]]]:
+        """
+        The columns of each index on `table`, with the share
+        of rows an equality match on its first column hits
+        (per the last ANALYZE, `None` if there is none)
+        """
+        stats = {}
+        if self.table_exists("sqlite_stat1"):
+            rows = execute(
+                self._con,
+                "SELECT idx, stat FROM sqlite_stat1 WHERE tbl = ? AND idx IS NOT NULL",
+                (table,),
+            )
+            for row in rows:
+                counts = stat_counts(row.stat)
+                if counts[0] and len(counts) > 1:
+                    stats[row.idx] = counts[1] / counts[0]
+
+        indexes = {}
+        for idx in execute(
+            self._con, f"PRAGMA main.index_list({table})"
+        ):
+            info = execute(
+                self._con,
+                f"PRAGMA main.index_info({idx.name})",
+            )
+            columns = [
+                col.name or "<expr>" for col in info
+            ]
+            indexes[idx.name] = (
+                columns,
+                stats.get(idx.name),
+            )
+        return indexes
+
+    def optimize(
+        self, schema: Optional[str] = None
+    ) -> bool:
+        # https://www.sqlite.org/lang_analyze.html#req
+        if not self.readonly:
+            optimize(self._con, schema)
+        return True
+
+    def storage(self) -> List[tuple]:
+        """
+        Pages and bytes used by each table and index, from
+        the dbstat virtual table
+        """
+        return execute(self._con, STORAGE_STATEMENT)
+
+    def memory(self) -> Dict[str, int]:
+        """
+        Bytes held by this connection that can be accounted
+        for: the database itself when it lives in memory,
+        TEMP objects, and the page cache's limit
+        """
+        # negative sizes are in KiB, positive ones in pages
+        cache = execute(
+            self._con,
+            "SELECT cache_size, page_size FROM pragma_cache_size, pragma_page_size",
+        )[0]
+        if cache.cache_size < 0:
+            limit = -cache.cache_size * 1024
+        else:
+            limit = cache.cache_size * cache.page_size
+
+        return {
+            "database": self.size() if self._in_mem else 0,
+            "temp": self.size("temp"),
+            "page_cache_limit": limit,
+        }
+
+    def pages(self) -> Dict[str, int]:
+        """
+        Pages in the database file, and how many of those
+        are free (left behind by deletes, reused by inserts)
+        """
+        return dict(
+            execute(
+                self._con,
+                "SELECT page_count AS pages, freelist_count AS free FROM pragma_page_count, pragma_freelist_count",
+            )[0]._asdict()
+        )
+
+    def vacuum(self) -> bool:
+        vacuum(self._con)
+        return True
+
+    def size(self, schema: str = "main") -> int:
+        size = execute(
+            self._con,
+            f"SELECT page_count * page_size AS size FROM pragma_page_count('{schema}'), pragma_page_size('{schema}')",
+        )
+        return size[0].size
+
+    def set_pragma(self, pragma: str, value) -> bool:
+        register = partial(
+            set_pragma, pragma=pragma, value=value
+        )
+        return self._register(register)
+
+    def move(
+        self, location: str, db_size: Optional[int] = None
+    ) -> bool:
+        """
+        Copy the database to the file at `location` and
+        carry on from there, with every function, TEMP view
+        and pragma registered so far
+        """
+        backup(self._con, location)
+        self._con.close()
+
+        self.db = location
+        self.db_size = db_size or self.db_size
+        self._in_mem = False
+        self._connect()
+        return True
+
+    def prepare(
+        self,
+        query: str,
+        wrap: Optional[Callable] = None,
+        limits: Optional[Callable] = None,
+    ) -> "PreparedQuery":
+        return PreparedQuery(self, query, wrap, limits)
+
+    def interruptible(
+        self,
+        timeout: Optional[float] = None,
+        max_vm_steps: Optional[int] = None,
+        cancel: Optional[Cancellation] = None,
+    ):
+        return interruptible(
+            self._con, timeout, max_vm_steps, cancel
+        )
+
+    def close(self) -> bool:
+        self.optimize()
+        self._con.close()
+        return True
+
+    def attach(self, location: str, alias: str) -> bool:
+        attach(self._con, location, alias)
+        return True
+
+    def detach(self, alias: str) -> bool:
+        detach(self._con, alias)
+        return True
+
+    def attach_limit(self) -> int:
+        return attach_limit(self._con)
+
+    def create_text_index(
+        self,
+        table: str,
+        columns: List[str],
+        tokenize: Optional[str] = None,
+    ) -> bool:
+        create_text_index(
+            self._con, table, columns, tokenize
+        )
+        return True
+
+    def text_index_columns(self, table: str) -> List[str]:
+        fts = text_index_name(table)
+        if not self.table_exists(fts):
+            return []
+        return [
+            col["name"]
+            for col in get_schema(self._con, fts)
+        ]
+
+    def range_index_columns(self, table: str) -> List[str]:
+        rtree = range_index_name(table)
+        if not self.table_exists(rtree):
+            return []
+        return [
+            col["name"]
+            for col in get_schema(self._con, rtree)
+        ]
+
+    def text_search(
+        self,
+        table: str,
+        columns: List[str],
+        term: str,
+        limit: Optional[int] = None,
+    ) -> List[tuple]:
+        stmt = text_search_statement(table, columns)
+        limit = -1 if limit is None else limit
+        return execute(self._con, stmt, (term, limit))
+
     def _connect(self):
         self._pre_config()
-        self._con = create_db(self.db)
+        self._con = create_db(
+            self.db,
+            self.readonly,
+            self.immutable,
+            self.cached_statements,
+        )
         self._post_config()
 
     def _pre_config(self):
         pass
 
+    def _writing(self):
+        # see `SharedDatabase`, which serializes writes
+        return nullcontext()
+
+    def _guard(self, query: str):
+        return None
+
     def _post_config(self):
         if not self._in_mem:
             config_mmap(self._con, self.db_size)
+        for name, nargs, fnc in FUNCTIONS + HASH_FUNCTIONS:
+            create_function(self._con, name, nargs, fnc)
+        for name, nargs, cls in AGGREGATES:
+            create_aggregate(self._con, name, nargs, cls)
+        for register in self._functions:
+            register(self._con)
+
+    def _register(
+        self, register: Callable[[Connection], None]
+    ) -> bool:
+        # kept so every new connection gets them (functions,
+        # TEMP views and pragmas) as well
+        register(self._con)
+        self._functions.append(register)
+        return True
+
+
+def serialized(method: Callable) -> Callable:
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._writing():
+            return method(self, *args, **kwargs)
+
+    return wrapper
+
+
+class SharedDatabase(Database):
+    """
+    A database that can be used from many threads at once.
+
+    Every thread gets a connection of its own, the first
+    time it uses the database. In-memory databases are
+    shared between them through SQLite's `memdb` VFS (the
+    supported successor of shared-cache mode), and file
+    databases switch to WAL, so reads run concurrently with
+    each other and with a writer. Writes are serialized by
+    a lock, so writers never fail on each other's locks.
+
+    Connections are kept until `close`, so a thread pool
+    (rather than a thread per task) is the way to use it.
+    """
+
+    def __init__(self, *args, **kwargs) -> None:
+        self._local = local()
+        self._writer = RLock()
+        self._connections: List[Connection] = []
+        self._closed = False
+        # https://www.sqlite.org/src/doc/trunk/src/memdb.c
+        self._memdb = (
+            f"file:/table_{next(SHARED_IDS)}?vfs=memdb"
+        )
+        super().__init__(*args, **kwargs)
+
+        if not self._in_mem and not self.readonly:
+            set_pragma(self._con, "journal_mode", "WAL")
+
+    @property
+    def _con(self) -> Optional[Connection]:
+        con = getattr(self._local, "con", None)
+        if con is None and not self._closed:
+            self._connect()
+            con = self._local.con
+        return con
+
+    @_con.setter
+    def _con(self, con: Optional[Connection]) -> None:
+        self._local.con = con
+
+    # every write goes through one of these, or `execute`
+    analyze = serialized(Database.analyze)
+    create_index = serialized(Database.create_index)
+    create_table = serialized(Database.create_table)
+    create_text_index = serialized(
+        Database.create_text_index
+    )
+    drop_table = serialized(Database.drop_table)
+    execute_statements = serialized(
+        Database.execute_statements
+    )
+    insert = serialized(Database.insert)
+    insert_distinct = serialized(Database.insert_distinct)
+    optimize = serialized(Database.optimize)
+    vacuum = serialized(Database.vacuum)
+
+    @serialized
+    def restore(self, location: str) -> bool:
+        # the memdb VFS has no WAL, so a WAL file's copy has
+        # to be told to use a rollback journal instead
+        restore(self._con, location, legacy=self._in_mem)
+        return True
+
+    def execute(
+        self, query: str, bind: Optional[tuple] = None
+    ) -> List[Optional[tuple]]:
+        with self._guard(query) or nullcontext():
+            return super().execute(query, bind)
+
+    def version(self) -> Tuple[int, int]:
+        # changes are counted per connection
+        total, schema = super().version()
+        with self._writer:
+            total = sum(
+                con.total_changes
+                for con in self._connections
+            )
+        return total, schema
+
+    def move(
+        self, location: str, db_size: Optional[int] = None
+    ) -> bool:
+        msg = "Shared databases cannot be moved"
+        raise DatabaseError(msg)
+
+    def attach(self, location: str, alias: str) -> bool:
+        # it would only be attached to one thread's
+        msg = "Shared databases cannot attach others"
+        raise DatabaseError(msg)
+
+    def close(self) -> bool:
+        with self._writer:
+            self.optimize()
+            for con in self._connections:
+                con.close()
+            self._connections = []
+            self._closed = True
+        return True
+
+    def _connect(self) -> None:
+        with self._writer:
+            self._pre_config()
+            self._con = create_db(
+                self._memdb if self._in_mem else self.db,
+                self.readonly,
+                self.immutable,
+                self.cached_statements,
+                shared=True,
+            )
+            self._connections.append(self._con)
+            self._post_config()
+
+    def _writing(self):
+        return self._writer
+
+    def _guard(self, query: str):
+        return None if is_read(query) else self._writer
+
+    def _register(
+        self, register: Callable[[Connection], None]
+    ) -> bool:
+        with self._writer:
+            for con in self._connections:
+                register(con)
+            self._functions.append(register)
+        return True
 
 
 # ---------------------------------------------------------
+
+
 def fwdexception(fnc: Callable):
     @wraps(fnc)
     def wrapper(*args, **kwargs):
@@ -148,10 +885,81 @@ def fwdexception(fnc: Callable):
             return fnc(*args, **kwargs)
         except Error as e:
             raise DatabaseError from e
+        except MemoryError as e:
+            # how sqlite3 reports SQLITE_NOMEM, which mostly
+            # means the hard heap limit was hit
+            msg = "SQLite ran out of memory, see `table.memory_limits`"
+            raise MemoryLimitError(msg) from e
 
     return wrapper
 
 
+@contextmanager
+def interruptible(
+    con: Connection,
+    timeout: Optional[float] = None,
+    max_vm_steps: Optional[int] = None,
+    cancel: Optional[Cancellation] = None,
+) -> Iterator[None]:
+    """
+    Interrupt the statements run within, raising
+    `QueryInterruptedError`, once they take longer than
+    `timeout` seconds or `max_vm_steps` SQLite virtual
+    machine instructions, or `cancel` is cancelled
+    """
+    limits = (timeout, max_vm_steps, cancel)
+    if all(limit is None for limit in limits):
+        yield
+        return
+    if cancel is not None and cancel.cancelled:
+        raise QueryInterruptedError("Query cancelled")
+
+    interval = min(
+        PROGRESS_INTERVAL,
+        max_vm_steps or PROGRESS_INTERVAL,
+    )
+    deadline = monotonic() + (timeout or 0)
+    steps = 0
+    reason = None
+
+    def progress() -> bool:
+        nonlocal steps, reason
+        steps += interval
+        if cancel is not None and cancel.cancelled:
+            reason = "cancelled"
+        elif (
+            max_vm_steps is not None
+            and steps > max_vm_steps
+        ):
+            reason = f"exceeded {max_vm_steps} VM steps"
+        elif (
+            timeout is not None and monotonic() > deadline
+        ):
+            reason = f"timed out after {timeout:.3g}s"
+        # anything truthy interrupts the statement
+        return reason is not None
+
+    con.set_progress_handler(progress, interval)
+    if cancel is not None:
+        cancel._watch(con)
+    try:
+        yield
+    except DatabaseError as e:
+        # interrupted by `cancel` between progress checks
+        if cancel is not None and cancel.cancelled:
+            reason = reason or "cancelled"
+        if reason is None:
+            raise
+        if con.in_transaction:
+            con.rollback()
+        msg = f"Query {reason}"
+        raise QueryInterruptedError(msg) from e
+    finally:
+        if cancel is not None:
+            cancel._unwatch(con)
+        con.set_progress_handler(None, 0)
+
+
 @fwdexception
 def execute(
     con: Connection,
@@ -185,6 +993,76 @@ def execute(
     return nt_output
 
 
+@fwdexception
+def execute_prepared(
+    cur: sqlite3.Cursor, query: str, bind: tuple
+) -> List[tuple]:
+    cur.execute(query, bind)
+    rows = cur.fetchall()
+    if cur.connection.in_transaction:
+        cur.connection.commit()
+    return rows
+
+
+@fwdexception
+def execute_many(
+    cur: sqlite3.Cursor, query: str, binds: List[tuple]
+) -> int:
+    try:
+        cur.executemany(query, binds)
+    except Error:
+        cur.connection.rollback()
+        raise
+    cur.connection.commit()
+    return cur.rowcount
+
+
+@fwdexception
+def execute_statements(
+    con: Connection,
+    statements: List[Union[str, Tuple[str, List[tuple]]]],
+) -> None:
+    # all or nothing, DDL included; a (statement, binds)
+    # pair runs once per bind
+    con.commit()
+    con.execute("BEGIN")
+    try:
+        for stmt in statements:
+            if isinstance(stmt, tuple):
+                stmt, binds = stmt
+                con.executemany(stmt, binds)
+            else:
+                con.execute(stmt)
+            LOGGER.debug(stmt)
+    except Error:
+        con.rollback()
+        raise
+    con.commit()
+
+
+@fwdexception
+def insert_distinct(
+    con: Connection,
+    statements: Tuple[str, str, str, str, str],
+    data: List[tuple],
+) -> int:
+    ddl, stage, rehash, copy, clear = statements
+    con.commit()
+    con.execute("BEGIN")
+    try:
+        con.execute(ddl)
+        con.executemany(stage, data)
+        con.execute(rehash)
+        inserted = con.execute(copy).rowcount
+        con.execute(clear)
+        LOGGER.debug(copy)
+    except Error:
+        con.rollback()
+        raise
+    con.commit()
+    return inserted
+
+
 @fwdexception
 def table_exists(con: Connection, name: str) -> bool:
     stmt = f"SELECT name FROM sqlite_master WHERE type='table' AND name='{name}'"
@@ -232,12 +1110,11 @@ def create_index(
     table: str,
     column: str,
 ) -> None:
-    stmt = "CREATE INDEX {idx_nm} ON {tbl_nm} ({col})"
-
-    idx_nm = f"idx_{table}_{column}"
+    # qualified, as a TEMP view may shadow the table
+    stmt = "CREATE INDEX main.{idx_nm} ON {tbl_nm} ({col})"
 
     stmt = stmt.format(
-        idx_nm=idx_nm,
+        idx_nm=column_index_name(table, column),
         tbl_nm=table,
         col=column,
     )
@@ -245,6 +1122,60 @@ def create_index(
     LOGGER.debug(stmt)
 
 
+@fwdexception
+def create_text_index(
+    con: Connection,
+    table: str,
+    columns: List[str],
+    tokenize: Optional[str] = None,
+) -> None:
+    # https://www.sqlite.org/fts5.html#external_content_tables
+    stmts = text_index_ddl(table, columns, tokenize)
+    execute_statements(con, stmts)
+
+
+@fwdexception
+def create_temp_view(
+    con: Connection, name: str, select: str
+) -> None:
+    stmt = f"CREATE TEMP VIEW IF NOT EXISTS {name} AS {select}"
+    con.execute(stmt)
+    LOGGER.debug(stmt)
+
+
+@fwdexception
+def create_function(
+    con: Connection,
+    name: str,
+    nargs: int,
+    fnc: Callable,
+    deterministic: bool = True,
+) -> None:
+    # only deterministic functions may be used by indexes
+    # and generated columns
+    con.create_function(
+        name, nargs, fnc, deterministic=deterministic
+    )
+    LOGGER.debug(f"Function registered [{name}]")
+
+
+@fwdexception
+def create_aggregate(
+    con: Connection, name: str, nargs: int, cls: type
+) -> None:
+    con.create_aggregate(name, nargs, cls)
+    LOGGER.debug(f"Aggregate registered [{name}]")
+
+
+@fwdexception
+def create_window_function(
+    con: Connection, name: str, nargs: int, cls: type
+) -> None:
+    # https://www.sqlite.org/windowfunctions.html#udfwinfunc
+    con.create_window_function(name, nargs, cls)
+    LOGGER.debug(f"Window function registered [{name}]")
+
+
 @fwdexception
 def get_schema(
     con: Connection, tablename: str
@@ -263,9 +1194,30 @@ def get_schema(
 
 
 @fwdexception
-def create_db(db: str) -> Connection:
+def create_db(
+    db: str,
+    readonly: bool = False,
+    immutable: bool = False,
+    cached_statements: int = CACHED_STATEMENTS,
+    shared: bool = False,
+) -> Connection:
+    uri = False
+    if readonly or immutable:
+        # https://www.sqlite.org/uri.html
+        db = readonly_uri(db, immutable)
+        uri = True
+    elif shared and db.startswith("file:"):
+        # an in-memory `SharedDatabase`
+        uri = True
+
     con = sqlite3.connect(
-        db, detect_types=sqlite3.PARSE_DECLTYPES
+        db,
+        detect_types=sqlite3.PARSE_DECLTYPES,
+        uri=uri,
+        cached_statements=cached_statements,
+        # a shared database reaches into every thread's
+        # connection to register functions and to close
+        check_same_thread=not shared,
     )
 
     LOGGER.debug(f"Database created [{db}]")
@@ -274,6 +1226,114 @@ def create_db(db: str) -> Connection:
     return con
 
 
+@fwdexception
+def attach(
+    con: Connection, location: str, alias: str
+) -> None:
+    stmt = "ATTACH DATABASE ? AS {alias}".format(
+        alias=alias
+    )
+    con.execute(stmt, (location,))
+    LOGGER.debug(f"{stmt} [{location}]")
+
+
+@fwdexception
+def detach(con: Connection, alias: str) -> None:
+    stmt = f"DETACH DATABASE {alias}"
+    con.execute(stmt)
+    LOGGER.debug(stmt)
+
+
+def attach_limit(con: Connection) -> int:
+    # `getlimit`/`setlimit` only exist on Python 3.11+, older
+    # interpreters get SQLite's compiled-in default
+    if not hasattr(con, "getlimit"):
+        return 10
+    con.setlimit(
+        sqlite3.SQLITE_LIMIT_ATTACHED, MAX_ATTACHED
+    )
+    return con.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED)
+
+
+@fwdexception
+def analyze(con: Connection, name: str) -> None:
+    stmt = f"ANALYZE main.{name}"
+    con.execute(stmt)
+    con.commit()
+    LOGGER.debug(stmt)
+
+
+@fwdexception
+def log_analyze(con: Connection, table: str) -> None:
+    con.execute(
+        f"CREATE TABLE IF NOT EXISTS {ANALYZE_LOG} "
+        "(tbl TEXT PRIMARY KEY, analyzed_at TIMESTAMP)"
+    )
+    con.execute(
+        f"INSERT OR REPLACE INTO {ANALYZE_LOG} VALUES (?, ?)",
+        (table, datetime.now()),
+    )
+    con.commit()
+
+
+@fwdexception
+def optimize(
+    con: Connection, schema: Optional[str] = None
+) -> None:
+    stmt = "PRAGMA optimize"
+    if schema is not None:
+        stmt = f"PRAGMA {schema}.optimize"
+    con.execute(stmt)
+    LOGGER.debug(stmt)
+
+
+@fwdexception
+def vacuum(con: Connection) -> None:
+    # rebuilds the file, dropping free pages and laying out
+    # each table's pages in order
+    con.commit()
+    con.execute("VACUUM")
+    LOGGER.debug("VACUUM")
+
+
+@fwdexception
+def heap_limits(
+    soft: Optional[int] = None, hard: Optional[int] = None
+) -> Tuple[int, int]:
+    # the limits are process-wide, any connection will do
+    con = sqlite3.connect(":memory:")
+    try:
+        if hard is not None:
+            con.execute(
+                f"PRAGMA hard_heap_limit={int(hard)}"
+            )
+        if soft is not None:
+            con.execute(
+                f"PRAGMA soft_heap_limit={int(soft)}"
+            )
+        soft = con.execute("PRAGMA soft_heap_limit")
+        hard = con.execute("PRAGMA hard_heap_limit")
+        return soft.fetchone()[0], hard.fetchone()[0]
+    finally:
+        con.close()
+
+
+def statement_cache(size: Optional[int] = None) -> int:
+    global CACHED_STATEMENTS
+    if size is not None:
+        CACHED_STATEMENTS = size
+    return CACHED_STATEMENTS
+
+
+@fwdexception
+def set_pragma(
+    con: Connection, pragma: str, value
+) -> None:
+    stmt = f"PRAGMA {pragma}={value}"
+    con.execute(stmt)
+    LOGGER.debug(stmt)
+
+
 @fwdexception
 def config_mmap(con: Connection, page_size: int) -> None:
     # https://www.sqlite.org/mmap.html
@@ -290,6 +1350,48 @@ def backup(con: Connection, location: str) -> None:
     LOGGER.debug(f"Database dumpted [{location}]")
 
 
+@fwdexception
+def restore(
+    con: Connection, location: str, legacy: bool = False
+) -> None:
+    src_con = sqlite3.connect(
+        readonly_uri(location), uri=True
+    )
+    try:
+        if legacy and is_wal(src_con):
+            src_con = legacy_copy(src_con)
+        src_con.backup(con)
+    finally:
+        src_con.close()
+    LOGGER.debug(f"Database loaded [{location}]")
+
+
+def is_wal(con: Connection) -> bool:
+    mode = con.execute("PRAGMA journal_mode").fetchone()
+    return mode[0] == "wal"
+
+
+def legacy_copy(con: Connection) -> Connection:
+    """
+    An in-memory copy of `con`'s database, marked as using
+    a rollback journal rather than WAL, closing `con`
+    """
+    # `serialize` only exists on Python 3.11+
+    if not hasattr(con, "serialize"):
+        con.close()
+        msg = "Loading a WAL database into a shared one needs Python 3.11+"
+        raise DatabaseError(msg)
+
+    # https://www.sqlite.org/fileformat.html#file_format_version_numbers
+    image = bytearray(con.serialize())
+    image[18:20] = b"\x01\x01"
+    con.close()
+
+    copy = sqlite3.connect(":memory:")
+    copy.deserialize(bytes(image))
+    return copy
+
+
 # ---------------------------------------------------------
 def schema_definition(
     columns: List[str],
@@ -341,7 +1443,76 @@ def _placeholder_def(schema: Dict[type, str]) -> str:
     return ", ".join(["?"] * len(schema))
 
 
-@lru_cache(maxsize=None)
+def readonly_uri(db: str, immutable: bool = False) -> str:
+    # immutable files are never locked or checked for
+    # changes, so they must not change while opened
+    from urllib.parse import quote
+
+    uri = f"file:{quote(abspath(db))}?mode=ro"
+    if immutable:
+        uri += "&immutable=1"
+    return uri
+
+
+def qualified_ddl(sql: str) -> str:
+    # SQLite keeps index and trigger DDL without the schema
+    # name, which would otherwise resolve to a TEMP view
+    # shadowing the table (see `table.dictionary`)
+    return re.sub(
+        r"\b(INDEX|TRIGGER)\s+(IF\s+NOT\s+EXISTS\s+)?",
+        lambda m: m.group(0) + "main.",
+        sql,
+        count=1,
+        flags=re.IGNORECASE,
+    )
+
+
+def text_index_name(table: str) -> str:
+    return f"{table}_fts"
+
+
+def text_index_ddl(
+    table: str,
+    columns: List[str],
+    tokenize: Optional[str] = None,
+) -> List[str]:
+    fts = text_index_name(table)
+    cols = ", ".join(columns)
+    new = ", ".join(f"new.{col}" for col in columns)
+    old = ", ".join(f"old.{col}" for col in columns)
+    opts = f", tokenize = '{tokenize}'" if tokenize else ""
+
+    insert = f"INSERT INTO {fts} (rowid, {cols}) VALUES (new.rowid, {new});"
+    delete = f"INSERT INTO {fts} ({fts}, rowid, {cols}) VALUES ('delete', old.rowid, {old});"
+
+    return [
+        f"DROP TRIGGER IF EXISTS {fts}_ai",
+        f"DROP TRIGGER IF EXISTS {fts}_ad",
+        f"DROP TRIGGER IF EXISTS {fts}_au",
+        f"DROP TABLE IF EXISTS {fts}",
+        f"CREATE VIRTUAL TABLE {fts} USING fts5({cols}, content = '{table}'{opts})",
+        f"CREATE TRIGGER {fts}_ai AFTER INSERT ON {table} BEGIN {insert} END",
+        f"CREATE TRIGGER {fts}_ad AFTER DELETE ON {table} BEGIN {delete} END",
+        f"CREATE TRIGGER {fts}_au AFTER UPDATE ON {table} BEGIN {delete} {insert} END",
+        f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')",
+    ]
+
+
+def text_search_statement(
+    table: str, columns: List[str]
+) -> str:
+    # `rank` is bm25() unless configured otherwise, and
+    # FTS5 can satisfy ORDER BY rank from the index itself
+    fts = text_index_name(table)
+    cols = ", ".join(f"t.{col}" for col in columns)
+    return (
+        f"SELECT {cols} FROM {fts} "
+        f"JOIN {table} AS t ON t.rowid = {fts}.rowid "
+        f"WHERE {fts} MATCH ? ORDER BY {fts}.rank LIMIT ?"
+    )
+
+
+@lru_cache(maxsize=ROW_CACHE_SIZE)
 def nt_builder(columns: Tuple[str]):
     # TODO: this chokes when doing things like summing
     # without an alias: select sum(age) from...
@@ -349,12 +1520,43 @@ def nt_builder(columns: Tuple[str]):
     return nt
 
 
+def column_index_name(table: str, column: str) -> str:
+    if not column.isidentifier():
+        # an expression, such as `lower(name)`
+        return f"idx_{table}_{short_hash(column)}"
+    return f"idx_{table}_{column}"
+
+
+def stat_counts(stat: str) -> List[int]:
+    # "<rows> <rows per key of first column> ...", see
+    # https://www.sqlite.org/fileformat2.html#stat1tab
+    nums = [
+        int(num) for num in stat.split() if num.isdigit()
+    ]
+    return nums[:2]
+
+
 def index_name(table: str) -> str:
-    short_hash = sha1(table.encode()).hexdigest()[:10]
-    name = f"{table}_{short_hash}"
+    name = f"{table}_{short_hash(table)}"
     return name
 
 
+def is_read(query: str) -> bool:
+    # anything unrecognized counts as a write, which is
+    # only ever slower
+    words = query.lstrip().split(None, 1)
+    first = words[0].upper() if words else ""
+    if first == "WITH":
+        return not WRITES.search(query)
+    return first in ("SELECT", "EXPLAIN", "VALUES")
+
+
+def short_hash(value: str) -> str:
+    from hashlib import sha1
+
+    return sha1(value.encode()).hexdigest()[:10]
+
+
 def get_cols(description):
     return tuple([d[0] for d in description])
 
@@ -0,0 +1,104 @@
+"""
+SQL for deduplicating inserts.
+
+`insert(..., dedupe=True)` keeps the `record_hash` of every
+row in a side table, whose INTEGER PRIMARY KEY makes each
+lookup a seek on its own b-tree. Triggers keep it in line
+with the table from then on, whatever writes to it. Records
+are staged in a TEMP table first and hashed there; only the
+first of any repeats within the batch, and only those not
+already hashed, are copied over.
+
+Hashes are over the values as stored (codes for dictionary
+encoded columns, compressed bytes), so the rows already in
+the table are hashed in SQL when the side table is created.
+"""
+
+
+from collections import namedtuple
+from typing import Dict, List, Tuple
+
+
+__all__ = [
+    "Inserted",
+    "hash_statements",
+    "hashes_name",
+    "staging_statements",
+]
+
+
+Inserted = namedtuple("Inserted", ["inserted", "skipped"])
+
+
+def hashes_name(table: str) -> str:
+    return f"_hashes_{table}"
+
+
+def hash_statements(
+    table: str,
+    schema: Dict[str, type],
+    database: str = "main",
+) -> List[str]:
+    # idempotent, so safe to run on every connection
+    hashes = hashes_name(table)
+    cols = ", ".join(schema)
+
+    def row_hash(row: str) -> str:
+        values = ", ".join(
+            f"{row}.{col}" for col in schema
+        )
+        return f"record_hash({values})"
+
+    add = f"INSERT OR IGNORE INTO {hashes} (hash) VALUES ({row_hash('NEW')});"
+    remove = f"DELETE FROM {hashes} WHERE hash = {row_hash('OLD')};"
+
+    stmts = [
+        f"CREATE TABLE IF NOT EXISTS {database}.{hashes} (hash INTEGER PRIMARY KEY)",
+        # the rows from before the first deduplicated insert
+        f"INSERT OR IGNORE INTO {database}.{hashes} (hash) SELECT record_hash({cols}) FROM {database}.{table} WHERE NOT EXISTS (SELECT 1 FROM {database}.{hashes})",
+    ]
+    for event, body in [
+        ("INSERT", add),
+        ("DELETE", remove),
+        ("UPDATE", remove + " " + add),
+    ]:
+        trigger = f"{hashes}_a{event[0].lower()}"
+        stmts.append(
+            f"CREATE TRIGGER IF NOT EXISTS {database}.{trigger} AFTER {event} ON {table} "
+            f"BEGIN {body} END"
+        )
+    return stmts
+
+
+def staging_statements(
+    table: str,
+    decltypes: Dict[str, str],
+    database: str = "main",
+) -> Tuple[str, str, str, str, str]:
+    """
+    Create the staging table, stage a row, hash the staged
+    rows, copy the new ones over, clear the staging table.
+
+    The staging columns have the table's declared types, so
+    values are converted (e.g. an int in a REAL column) just
+    as they are once stored, and hash the same
+    """
+    staging = f"_staging_{table}"
+    hashes = hashes_name(table)
+    cols = ", ".join(decltypes)
+    col_defs = ", ".join(
+        f"{col} {typ}" for col, typ in decltypes.items()
+    )
+    holdr = ", ".join(["?"] * len(decltypes))
+
+    return (
+        f"CREATE TEMP TABLE IF NOT EXISTS {staging} (hash INTEGER, {col_defs})",
+        f"INSERT INTO temp.{staging} ({cols}) VALUES ({holdr})",
+        f"UPDATE temp.{staging} SET hash = record_hash({cols})",
+        # the first of any repeats, in the order given as a
+        # plain insert would be
+        f"INSERT INTO {database}.{table} ({cols}) SELECT {cols} FROM temp.{staging} "
+        f"WHERE rowid IN (SELECT min(rowid) FROM temp.{staging} GROUP BY hash) "
+        f"AND hash NOT IN (SELECT hash FROM {database}.{hashes}) ORDER BY rowid",
+        f"DELETE FROM temp.{staging}",
+    )
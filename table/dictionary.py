@@ -0,0 +1,86 @@
+"""
+Dictionary encoded columns.
+
+A `str` field declared with
+`field(metadata={"encoding": "dictionary"})` is stored as a
+small integer code, with the distinct values kept once each
+in a side table, `_dict_<table>_<column>`. A TEMP view named
+after the table shadows it on every connection and joins
+the values back in, so queries (filters included) see plain
+strings. Statements that write, or that need the rowid,
+target `main.<table>` directly instead.
+"""
+
+
+from table.errors import TableError
+
+from typing import Dict
+
+
+__all__ = [
+    "Dictionary",
+    "decoding_select",
+    "dictionary_ddl",
+    "dictionary_name",
+    "encoded_type",
+]
+
+
+ENCODINGS = ("dictionary",)
+
+
+class Dictionary:
+    """
+    Marker type standing in for a dictionary encoded column
+    in a table's schema
+    """
+
+    base = str
+    decltype = "DICTIONARY"
+
+
+def encoded_type(typ: type, encoding: str) -> type:
+    if encoding not in ENCODINGS:
+        msg = f"Unknown encoding '{encoding}', choose from {list(ENCODINGS)}"
+        raise TableError(msg)
+    if typ is not str:
+        msg = f"Only str fields can be dictionary encoded, not {typ}"
+        raise TableError(msg)
+    return Dictionary
+
+
+def dictionary_name(table: str, column: str) -> str:
+    return f"_dict_{table}_{column}"
+
+
+def dictionary_ddl(table: str, column: str) -> str:
+    name = dictionary_name(table, column)
+    return f"CREATE TABLE IF NOT EXISTS {name} (code INTEGER PRIMARY KEY, value TEXT NOT NULL UNIQUE)"
+
+
+def decoding_select(
+    table: str,
+    schema: Dict[str, type],
+    rowid: bool = False,
+) -> str:
+    # LEFT JOINs keep NULLs, and a filter on a decoded value
+    # still lets the planner start from the dictionary
+    cols = ["t.rowid AS rowid"] if rowid else []
+    joins = []
+    for idx, (col, typ) in enumerate(schema.items()):
+        if typ is not Dictionary:
+            cols.append(f"t.{col} AS {col}")
+            continue
+        alias = f"d{idx}"
+        name = dictionary_name(table, col)
+        cols.append(f"{alias}.value AS {col}")
+        joins.append(
+            f"LEFT JOIN main.{name} AS {alias} ON {alias}.code = t.{col}"
+        )
+
+    stmt = (
+        f"SELECT {', '.join(cols)} FROM main.{table} AS t"
+    )
+    if joins:
+        stmt += " " + " ".join(joins)
+    return stmt
@@ -0,0 +1,203 @@
+"""
+Parallel bulk loading.
+
+`Table.parallel_load` fans its input out to a pool of worker
+processes. Each worker does the Python side of an insert
+(`format_insert`, type adaptation, compression) and writes
+the rows to a shard database of its own. The parent then
+attaches the shards and copies them into the table with
+`INSERT ... SELECT`, which never leaves SQLite.
+
+Dictionary encoded columns are written to the shards as
+plain strings and encoded during the merge, since the codes
+have to come from the target's dictionaries.
+"""
+
+
+from table.db import Database
+from table.dictionary import Dictionary, dictionary_name
+from table.tables.base import (
+    Dataclass,
+    dataclass_schema,
+    format_insert,
+)
+
+from collections import defaultdict
+from itertools import islice
+from os import cpu_count, getpid
+from os.path import join
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
+
+
+__all__ = [
+    "load_shards",
+    "merge_statements",
+]
+
+
+# records per task when loading from an iterable
+CHUNK_SIZE = 10000
+
+# this worker process's shard: (database, dataclass, table,
+# schema), set up by `init_worker`
+_shard: Optional[tuple] = None
+
+
+def shard_schema(
+    schema: Dict[str, type]
+) -> Dict[str, type]:
+    return {
+        col: str if typ is Dictionary else typ
+        for col, typ in schema.items()
+    }
+
+
+def init_worker(directory: str, dclass: Dataclass) -> None:
+    global _shard
+    name = dclass.__name__.lower()
+    schema = shard_schema(dataclass_schema(dclass))
+
+    db = Database(join(directory, f"shard_{getpid()}.db"))
+    # a scratch file, deleted once merged
+    db.set_pragma("synchronous", "OFF")
+    db.create_table(name, schema)
+    _shard = (db, dclass, name, schema)
+
+
+def load_records(
+    records: List[Dataclass],
+) -> Tuple[str, int]:
+    db, dclass, name, schema = _shard
+    rows = [format_insert(dclass, r) for r in records]
+    db.insert(name, schema, rows)
+    return db.db, len(rows)
+
+
+def load_file(
+    loader: Callable[[str], Iterable[Dataclass]], path: str
+) -> Tuple[str, int]:
+    count = 0
+    for chunk in chunks(loader(path), CHUNK_SIZE):
+        count += load_records(chunk)[1]
+    return _shard[0].db, count
+
+
+def chunks(
+    records: Iterable[Dataclass], size: int
+) -> Iterator[List[Dataclass]]:
+    records = iter(records)
+    while chunk := list(islice(records, size)):
+        yield chunk
+
+
+def load_shards(
+    directory: str,
+    dclass: Dataclass,
+    source: Iterable,
+    workers: Optional[int] = None,
+    loader: Optional[Callable] = None,
+) -> Dict[str, int]:
+    """
+    Load `source` into shard databases under `directory`,
+    returning the number of rows in each shard
+    """
+    from concurrent.futures import (
+        FIRST_COMPLETED,
+        ProcessPoolExecutor,
+        wait,
+    )
+
+    workers = workers or cpu_count() or 1
+    counts: Dict[str, int] = defaultdict(int)
+
+    def collect(futures) -> None:
+        for future in futures:
+            shard, count = future.result()
+            counts[shard] += count
+
+    with ProcessPoolExecutor(
+        workers,
+        initializer=init_worker,
+        initargs=(directory, dclass),
+    ) as pool:
+        if loader is None:
+            tasks = (
+                pool.submit(load_records, chunk)
+                for chunk in chunks(source, CHUNK_SIZE)
+            )
+        else:
+            tasks = (
+                pool.submit(load_file, loader, path)
+                for path in source
+            )
+
+        # a couple of tasks queued per worker, so a large
+        # iterable is never held in memory all at once
+        pending = set()
+        for task in tasks:
+            pending.add(task)
+            if len(pending) >= 2 * workers:
+                done, pending = wait(
+                    pending, return_when=FIRST_COMPLETED
+                )
+                collect(done)
+        collect(pending)
+
+    return {
+        shard: count
+        for shard, count in counts.items()
+        if count
+    }
+
+
+def merge_statements(
+    table: str,
+    schema: Dict[str, type],
+    aliases: List[str],
+) -> List[str]:
+    encoded = [
+        col
+        for col, typ in schema.items()
+        if typ is Dictionary
+    ]
+    columns = ", ".join(schema)
+
+    statements = []
+    for alias in aliases:
+        if not encoded:
+            statements.append(
+                f"INSERT INTO main.{table} ({columns}) SELECT {columns} FROM {alias}.{table}"
+            )
+            continue
+
+        # new values first, in order of appearance so the
+        # codes match what `insert` would have assigned
+        for col in encoded:
+            name = dictionary_name(table, col)
+            statements.append(
+                f"INSERT OR IGNORE INTO main.{name} (value) SELECT {col} FROM {alias}.{table} WHERE {col} IS NOT NULL ORDER BY rowid"
+            )
+
+        exprs, joins = [], []
+        for idx, (col, typ) in enumerate(schema.items()):
+            if typ is not Dictionary:
+                exprs.append(f"s.{col}")
+                continue
+            name = dictionary_name(table, col)
+            exprs.append(f"d{idx}.code")
+            joins.append(
+                f"LEFT JOIN main.{name} AS d{idx} ON d{idx}.value = s.{col}"
+            )
+        statements.append(
+            f"INSERT INTO main.{table} ({columns}) SELECT {', '.join(exprs)} FROM {alias}.{table} AS s {' '.join(joins)} ORDER BY s.rowid"
+        )
+
+    return statements
@@ -0,0 +1,293 @@
+"""
+SQL for materialized aggregates.
+
+Queries that `table.aggregates.parse_query` understands are
+maintained incrementally: their partial states live in a
+side table (`_mv_<name>`) that an insert trigger folds each
+new row into, and a view named `<name>` turns those states
+into the final values. Delete and update triggers take the
+OLD row back out of its group's counts and sums (hidden
+counts tell when a group or a sum is left empty); a min or
+max is only recomputed, within the group, when OLD held it.
+
+Anything else is stored as a plain table that is rebuilt
+on `refresh`.
+"""
+
+
+from table.aggregates import AggregateQuery, partial_terms
+from table.db import TYPES
+
+from typing import Dict, List
+
+
+__all__ = [
+    "REGISTRY",
+    "materialize_statements",
+    "refresh_statements",
+    "state_name",
+]
+
+
+REGISTRY = "_materialized"
+REGISTRY_DDL = f"CREATE TABLE IF NOT EXISTS {REGISTRY} (name TEXT PRIMARY KEY, sql TEXT, incremental INTEGER)"
+
+# a constant group for queries without a GROUP BY
+GLOBAL_KEY = "_all"
+
+
+def state_name(name: str) -> str:
+    return f"_mv_{name}"
+
+
+def materialize_statements(
+    name: str,
+    sql: str,
+    query: AggregateQuery,
+    schema: Dict[str, type],
+) -> List[str]:
+    if query is None:
+        return [
+            REGISTRY_DDL,
+            f"CREATE TABLE {name} AS {sql}",
+        ]
+
+    state = state_name(name)
+    keys = _keys(query)
+    terms = _terms(query)
+
+    key_defs = [
+        f"{col} {TYPES[schema[col]]}"
+        if col in schema
+        else col
+        for col in keys
+    ]
+    term_defs = [f"p{idx}" for idx in range(len(terms))]
+    cols = ", ".join(keys + term_defs)
+
+    add = _add(state, query, cols, terms)
+    remove = _remove(state, query, terms)
+    return [
+        REGISTRY_DDL,
+        f"CREATE TABLE {state} ({', '.join(key_defs + term_defs)})",
+        f"CREATE INDEX {state}_keys ON {state} ({', '.join(keys)})",
+        f"CREATE VIEW {name} AS SELECT {_finals(query)} FROM {state}",
+        *_populate(state, query),
+        f"CREATE TRIGGER {state}_ai AFTER INSERT ON {query.table} "
+        f"BEGIN {add} END",
+        f"CREATE TRIGGER {state}_ad AFTER DELETE ON {query.table} "
+        f"BEGIN {remove} END",
+        f"CREATE TRIGGER {state}_au AFTER UPDATE ON {query.table} "
+        f"BEGIN {remove} {add} END",
+    ]
+
+
+def refresh_statements(
+    name: str,
+    sql: str,
+    query: AggregateQuery,
+) -> List[str]:
+    if query is None:
+        return [
+            f"DELETE FROM {name}",
+            f"INSERT INTO {name} {sql}",
+        ]
+    return _populate(state_name(name), query)
+
+
+# ---------------------------------------------------------
+def _keys(query: AggregateQuery) -> List[str]:
+    return query.group_by or [GLOBAL_KEY]
+
+
+def _terms(query: AggregateQuery) -> List[tuple]:
+    """
+    The (column, term) of every partial state: those of the
+    aggregates, then the hidden counts of rows and of the
+    values in each sum, needed to take rows back out
+    """
+    terms = [
+        (agg.column, term)
+        for agg in query.aggregates
+        for term in partial_terms(agg)
+    ]
+    hidden = ["*"] + [
+        agg.column
+        for agg in query.aggregates
+        if agg.func in ("sum", "avg")
+    ]
+    for column in hidden:
+        term = f"count({column})"
+        if (column, term) not in terms:
+            terms.append((column, term))
+    return terms
+
+
+def _finals(query: AggregateQuery) -> str:
+    positions = {}
+    idx = 0
+    for agg in query.aggregates:
+        positions[agg.alias] = idx
+        idx += len(partial_terms(agg))
+
+    finals = []
+    for col in query.columns:
+        if col not in positions:
+            finals.append(col)
+            continue
+
+        pos = positions[col]
+        agg = next(
+            a for a in query.aggregates if a.alias == col
+        )
+        if agg.func == "avg":
+            expr = f"CAST(p{pos} AS REAL) / nullif(p{pos + 1}, 0)"
+        else:
+            expr = f"p{pos}"
+        finals.append(f"{expr} AS {col}")
+
+    return ", ".join(finals)
+
+
+def _populate(
+    state: str,
+    query: AggregateQuery,
+) -> List[str]:
+    """
+    Recompute the states of every group
+    """
+    keys = _keys(query)
+    terms = [term for _, term in _terms(query)]
+
+    if query.group_by:
+        select = ", ".join(query.group_by + terms)
+        group_by = f" GROUP BY {', '.join(query.group_by)}"
+    else:
+        select = ", ".join(["0"] + terms)
+        group_by = ""
+
+    # the key columns share their names across both tables
+    cols = ", ".join(
+        keys + [f"p{i}" for i in range(len(terms))]
+    )
+    return [
+        f"DELETE FROM {state}",
+        f"INSERT INTO {state} ({cols}) SELECT {select} FROM {query.table}{group_by}",
+    ]
+
+
+def _match(query: AggregateQuery, row: str) -> str:
+    if not query.group_by:
+        return f"{GLOBAL_KEY} = 0"
+    return " AND ".join(
+        f"{col} IS {row}.{col}" for col in query.group_by
+    )
+
+
+def _add(
+    state: str,
+    query: AggregateQuery,
+    cols: str,
+    terms: List[tuple],
+) -> str:
+    if query.group_by:
+        new_keys = [f"NEW.{col}" for col in query.group_by]
+    else:
+        new_keys = ["0"]
+    match = _match(query, "NEW")
+
+    # seed the group with an empty state, then fold NEW in
+    empty = [
+        "0" if term.startswith("count") else "NULL"
+        for _, term in terms
+    ]
+    seed = (
+        f"INSERT INTO {state} ({cols}) "
+        f"SELECT {', '.join(new_keys + empty)} "
+        f"WHERE NOT EXISTS (SELECT 1 FROM {state} WHERE {match});"
+    )
+
+    updates = []
+    for idx, (column, term) in enumerate(terms):
+        col = f"p{idx}"
+        updates.append(
+            f"{col} = {_fold(col, column, term)}"
+        )
+    fold = (
+        f"UPDATE {state} SET {', '.join(updates)} "
+        f"WHERE {match};"
+    )
+    return f"{seed} {fold}"
+
+
+def _remove(
+    state: str,
+    query: AggregateQuery,
+    terms: List[tuple],
+) -> str:
+    match = _match(query, "OLD")
+    position = {
+        term: idx for idx, (_, term) in enumerate(terms)
+    }
+
+    updates = []
+    extremes = []
+    for idx, (column, term) in enumerate(terms):
+        col = f"p{idx}"
+        value = f"OLD.{column}"
+        if term.startswith("count"):
+            if column == "*":
+                updates.append(f"{col} = {col} - 1")
+            else:
+                updates.append(
+                    f"{col} = {col} - ({value} IS NOT NULL)"
+                )
+        elif term.startswith("sum"):
+            # NULL again once no values are left
+            count = f"p{position[f'count({column})']}"
+            updates.append(
+                f"{col} = CASE WHEN {count} - ({value} IS NOT NULL) > 0 "
+                f"THEN {col} - coalesce({value}, 0) END"
+            )
+        else:
+            # the row is gone by now, so this finds the next
+            # smallest/largest, but only if OLD held this one
+            func = term.split("(")[0]
+            group = (
+                " WHERE " + _match(query, "OLD")
+                if query.group_by
+                else ""
+            )
+            extremes.append(
+                f"UPDATE {state} SET {col} = "
+                f"(SELECT {func}({column}) FROM {query.table}{group}) "
+                f"WHERE {match} AND {col} IS {value};"
+            )
+
+    stmts = [
+        f"UPDATE {state} SET {', '.join(updates)} "
+        f"WHERE {match};",
+        *extremes,
+    ]
+    if query.group_by:
+        rows = f"p{position['count(*)']}"
+        stmts.append(
+            f"DELETE FROM {state} WHERE {match} AND {rows} = 0;"
+        )
+    return " ".join(stmts)
+
+
+def _fold(col: str, column: str, term: str) -> str:
+    if term.startswith("count"):
+        if column == "*":
+            return f"{col} + 1"
+        return f"{col} + (NEW.{column} IS NOT NULL)"
+
+    value = f"NEW.{column}"
+    if term.startswith("sum"):
+        return f"coalesce({col} + {value}, {col}, {value})"
+
+    func = term.split("(")[0]
+    return (
+        f"coalesce({func}({col}, {value}), {col}, {value})"
+    )
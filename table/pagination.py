@@ -0,0 +1,98 @@
+"""
+Keyset ("seek") pagination.
+
+Rather than skipping `OFFSET` rows on every page, each page
+starts strictly after the sort key of the previous page's
+last row, which an index (or the rowid itself) can seek to
+directly. The rowid is always appended to the sort key as
+a tie-breaker, so the order is total.
+"""
+
+
+from table.errors import TableError
+
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as DecodeError
+from collections import namedtuple
+from datetime import date
+import json
+from typing import List, Optional
+
+
+__all__ = [
+    "Page",
+    "decode_cursor",
+    "encode_cursor",
+    "page_statement",
+]
+
+
+Page = namedtuple("Page", ["rows", "cursor"])
+
+
+def page_statement(
+    table: str,
+    columns: List[str],
+    order_by: List[str],
+    after: bool,
+    where: Optional[str] = None,
+    descending: bool = False,
+) -> str:
+    keys = order_by + ["rowid"]
+    aliases = [
+        f"{key} AS page_key{i}"
+        for i, key in enumerate(keys)
+    ]
+    cmp, direction = (
+        ("<", "DESC") if descending else (">", "ASC")
+    )
+
+    filters = []
+    if where:
+        filters.append(f"({where})")
+    if after:
+        holdr = ", ".join(["?"] * len(keys))
+        filters.append(
+            f"({', '.join(keys)}) {cmp} ({holdr})"
+        )
+
+    stmt = f"SELECT {', '.join(columns + aliases)} FROM {table}"
+    if filters:
+        stmt += " WHERE " + " AND ".join(filters)
+    stmt += " ORDER BY " + ", ".join(
+        f"{key} {direction}" for key in keys
+    )
+    stmt += " LIMIT ?"
+    return stmt
+
+
+def encode_cursor(
+    order_by: List[str], values: tuple
+) -> str:
+    # dates are stored as text, so they are compared as text
+    values = [
+        str(value) if isinstance(value, date) else value
+        for value in values
+    ]
+    raw = json.dumps(
+        [order_by, values], separators=(",", ":")
+    )
+    return urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(
+    cursor: str, order_by: List[str]
+) -> tuple:
+    try:
+        keys, values = json.loads(
+            urlsafe_b64decode(cursor)
+        )
+    except (DecodeError, TypeError, ValueError):
+        msg = f"Invalid cursor '{cursor}'"
+        raise TableError(msg)
+
+    if keys != order_by:
+        msg = f"Cursor was created for order_by={keys}"
+        raise TableError(msg)
+
+    return tuple(values)
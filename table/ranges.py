@@ -0,0 +1,174 @@
+"""
+SQL for range indexes.
+
+A B-tree index narrows a search down on one column only, so
+a filter on a box (lat/lon) or on intervals overlapping a
+window still reads every row matching its first condition.
+An R*Tree keeps a bounding box per row instead, over up to
+five (min, max) column pairs, and finds the boxes
+overlapping a query box directly.
+
+The R*Tree is a virtual table keyed by the table's rowid and
+kept in sync by triggers. It stores 32-bit floats, rounded
+outwards, so what it finds is checked against the table's
+own values. Dates and datetimes are stored as days since
+1970, where 32 bits still resolve a few minutes.
+"""
+
+
+from datetime import date, datetime
+from typing import Dict, List, Optional, Tuple
+
+
+__all__ = [
+    "MAX_PAIRS",
+    "RANGE_TYPES",
+    "range_index_ddl",
+    "range_index_name",
+    "range_pairs",
+    "rebuild_statements",
+    "within_statement",
+]
+
+
+# an R*Tree has at most five dimensions
+MAX_PAIRS = 5
+RANGE_TYPES = (int, float, date, datetime)
+
+Pair = Tuple[str, str]
+
+# the Julian day of 1970-01-01
+EPOCH = 2440587.5
+
+
+def range_index_name(table: str) -> str:
+    return f"{table}_range"
+
+
+def rtree_columns(pairs: List[Pair]) -> List[str]:
+    cols = []
+    for low, high in pairs:
+        cols += [f"{low}_min", f"{high}_max"]
+    return cols
+
+
+def range_pairs(rtree_cols: List[str]) -> List[Pair]:
+    """
+    The (min, max) column pairs of an existing R*Tree,
+    given its columns (the first of which is the rowid)
+    """
+    names = rtree_cols[1:]
+    return [
+        (low[: -len("_min")], high[: -len("_max")])
+        for low, high in zip(names[::2], names[1::2])
+    ]
+
+
+def days(expr: str) -> str:
+    return f"(julianday({expr}) - {EPOCH})"
+
+
+def value(
+    row: str, col: str, schema: Dict[str, type]
+) -> str:
+    if schema[col] in (date, datetime):
+        return days(f"{row}.{col}")
+    return f"{row}.{col}"
+
+
+def bounds(
+    row: str, schema: Dict[str, type], pairs: List[Pair]
+) -> Tuple[List[str], str]:
+    """
+    The R*Tree coordinates of a row, and the condition for
+    it to have any (NULLs are left out of the index)
+    """
+    coords, conds = [], []
+    for low, high in pairs:
+        lo = value(row, low, schema)
+        hi = value(row, high, schema)
+        coords += [f"min({lo}, {hi})", f"max({lo}, {hi})"]
+        conds += [f"{lo} IS NOT NULL", f"{hi} IS NOT NULL"]
+    return coords, " AND ".join(conds)
+
+
+def range_index_ddl(
+    table: str,
+    schema: Dict[str, type],
+    pairs: List[Pair],
+) -> List[str]:
+    rtree = range_index_name(table)
+    cols = ", ".join(rtree_columns(pairs))
+    new, new_ok = bounds("NEW", schema, pairs)
+
+    add = f"INSERT INTO {rtree} SELECT NEW.rowid, {', '.join(new)} WHERE {new_ok};"
+    remove = f"DELETE FROM {rtree} WHERE id = OLD.rowid;"
+
+    return [
+        f"DROP TRIGGER IF EXISTS main.{rtree}_ai",
+        f"DROP TRIGGER IF EXISTS main.{rtree}_ad",
+        f"DROP TRIGGER IF EXISTS main.{rtree}_au",
+        f"DROP TABLE IF EXISTS main.{rtree}",
+        f"CREATE VIRTUAL TABLE main.{rtree} USING rtree(id, {cols})",
+        f"CREATE TRIGGER main.{rtree}_ai AFTER INSERT ON {table} BEGIN {add} END",
+        f"CREATE TRIGGER main.{rtree}_ad AFTER DELETE ON {table} BEGIN {remove} END",
+        f"CREATE TRIGGER main.{rtree}_au AFTER UPDATE ON {table} BEGIN {remove} {add} END",
+    ] + rebuild_statements(table, schema, pairs)
+
+
+def rebuild_statements(
+    table: str,
+    schema: Dict[str, type],
+    pairs: List[Pair],
+) -> List[str]:
+    rtree = range_index_name(table)
+    coords, ok = bounds("t", schema, pairs)
+    return [
+        f"DELETE FROM main.{rtree}",
+        f"INSERT INTO main.{rtree} SELECT t.rowid, {', '.join(coords)} FROM main.{table} AS t WHERE {ok}",
+    ]
+
+
+def within_statement(
+    source: str,
+    table: str,
+    schema: Dict[str, type],
+    pairs: List[Pair],
+    given: List[
+        Tuple[Pair, Optional[object], Optional[object]]
+    ],
+) -> Tuple[str, tuple]:
+    """
+    The rows whose (min, max) overlaps the (low, high) given
+    for each pair (either may be `None`), and the binds
+    """
+    rtree = range_index_name(table)
+    coords, _ = bounds(table, schema, pairs)
+    cols = ", ".join(f"{table}.{col}" for col in schema)
+
+    rough, exact, binds = [], [], []
+    for pair, low, high in given:
+        idx = pairs.index(pair)
+        lo_col, hi_col = rtree_columns([pair])
+        temporal = schema[pair[0]] in (date, datetime)
+        param = days("?") if temporal else "?"
+        # the R*Tree's min is never above the true min, nor
+        # its max below the true max, so it misses nothing
+        if high is not None:
+            rough.append(f"r.{lo_col} <= {param}")
+            exact.append(f"{coords[2 * idx]} <= {param}")
+            binds.append(high)
+        if low is not None:
+            rough.append(f"r.{hi_col} >= {param}")
+            exact.append(
+                f"{coords[2 * idx + 1]} >= {param}"
+            )
+            binds.append(low)
+
+    where = " AND ".join(rough + exact) or "1"
+    stmt = (
+        f"SELECT {cols} FROM main.{rtree} AS r "
+        f"JOIN {source} ON {table}.rowid = r.id "
+        f"WHERE {where} ORDER BY r.id"
+    )
+    return stmt, tuple(binds) * 2
@@ -0,0 +1,189 @@
+"""
+Random sampling by rowid probing.
+
+Rows are sampled by drawing random rowids between the
+table's smallest and largest (both found straight from the
+rowid b-tree) and fetching whichever of them exist, so the
+work done is proportional to the sample, not the table.
+Every row is equally likely to be picked; gaps left by
+deleted rows only cost extra probes.
+
+The same probes give unbiased estimates of count/sum/avg
+over the whole table, with normal-approximation confidence
+intervals that shrink as more rows are probed.
+"""
+
+
+from table.aggregates import Aggregate
+
+from collections import namedtuple
+from math import log, sqrt
+from typing import List, Optional, Set, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from random import Random
+
+
+__all__ = [
+    "MAX_PROBES",
+    "MIN_HITS",
+    "Estimate",
+    "estimate",
+    "probe_statement",
+    "random_rowids",
+    "seeded_random",
+    "within_error",
+]
+
+
+# stays well under SQLite's bound parameter limit
+PROBE_BATCH = 500
+# below this many matching rows, the sample's spread says
+# too little about the table's to stop on
+MIN_HITS = 30
+# a filter matching (almost) nothing would otherwise have
+# every rowid probed
+MAX_PROBES = 100_000
+
+
+Estimate = namedtuple(
+    "Estimate", ["name", "value", "low", "high"]
+)
+
+
+def seeded_random(seed: Optional[int] = None) -> "Random":
+    # random is only imported once something is sampled
+    from random import Random
+
+    return Random(seed)
+
+
+def random_rowids(
+    rng: "Random",
+    low: int,
+    high: int,
+    count: int,
+    seen: Set[int],
+) -> List[int]:
+    """
+    Draw up to `count` rowids in [low, high] that are not
+    in `seen` (which is updated with them)
+    """
+    span = high - low + 1
+    count = min(count, span - len(seen))
+
+    rowids = []
+    while len(rowids) < count:
+        rowid = rng.randint(low, high)
+        if rowid not in seen:
+            seen.add(rowid)
+            rowids.append(rowid)
+    return rowids
+
+
+def probe_statement(
+    table: str,
+    columns: List[str],
+    probes: int,
+    where: Optional[str] = None,
+) -> str:
+    holdr = ", ".join(["?"] * probes)
+    cols = ", ".join(columns + ["rowid AS sample_rowid"])
+    if where is not None:
+        cols += f", ({where}) AS sample_hit"
+    return f"SELECT {cols} FROM {table} WHERE rowid IN ({holdr})"
+
+
+def estimate(
+    aggregate: Aggregate,
+    rows: List[tuple],
+    probes: int,
+    span: int,
+    confidence: float,
+) -> Estimate:
+    """
+    Estimate `aggregate` from the `rows` that were hit
+    (existed and matched the filter) out of all `probes`
+    made over a rowid range of size `span`
+    """
+    func, column, alias = aggregate
+    if not probes:
+        value = 0 if func == "count" else None
+        return Estimate(alias, value, value, value)
+
+    # statistics is slow to import and rarely needed here
+    from statistics import NormalDist
+
+    z = NormalDist().inv_cdf((1 + confidence) / 2)
+    # finite population correction, 0 once every rowid
+    # has been probed and the answer is exact
+    fpc = (
+        sqrt((span - probes) / (span - 1))
+        if span > 1
+        else 0
+    )
+
+    if column == "*":
+        values = [1] * len(rows)
+    else:
+        values = [getattr(row, column) for row in rows]
+        values = [v for v in values if v is not None]
+
+    if func == "avg":
+        if not values:
+            return Estimate(alias, None, None, None)
+        mean, sd = _mean_sd(values)
+        err = _error(z * sd / sqrt(len(values)), fpc)
+        return Estimate(
+            alias, mean, mean - err, mean + err
+        )
+
+    # count and sum are totals: every probe contributes
+    # its value (1 per row for count), or 0 on a miss
+    if func == "count":
+        per_probe = [1] * len(values)
+    else:
+        per_probe = list(values)
+    per_probe += [0] * (probes - len(per_probe))
+
+    mean, sd = _mean_sd(per_probe)
+    value = mean * span
+    if func == "count" and not values:
+        # no spread to go on: at most -ln(1 - confidence)
+        # / probes of rows can match and still be missed
+        # that often (the "rule of three" at 95%)
+        high = _error(
+            span * -log(1 - confidence) / probes, fpc
+        )
+        return Estimate(alias, value, value, high)
+    err = _error(z * span * sd / sqrt(probes), fpc)
+    return Estimate(alias, value, value - err, value + err)
+
+
+def within_error(est: Estimate, error: float) -> bool:
+    """
+    Whether the interval is within `error` of the value,
+    relative to it, or within `error` of 0 if that is the
+    value. Estimates with nothing to go on (no rows to
+    average) never are
+    """
+    if est.value is None:
+        return False
+    half_width = (est.high - est.low) / 2
+    return half_width <= error * (abs(est.value) or 1)
+
+
+def _error(err: float, fpc: float) -> float:
+    # an exhaustive sample is exact, however few values
+    # it has (and inf * 0 is nan)
+    return err * fpc if fpc else 0.0
+
+
+def _mean_sd(values: List[float]) -> tuple:
+    n = len(values)
+    mean = sum(values) / n
+    if n < 2:
+        # one value says nothing about the spread
+        return mean, float("inf")
+    var = sum((v - mean) ** 2 for v in values) / (n - 1)
+    return mean, sqrt(var)
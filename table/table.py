@@ -1,15 +1,34 @@
 """
-There are two types of `Table`s that can be created:
+There are five types of `Table`s that can be created:
   (1) in-memory, which is the simplest
   (2) persistent, which is durable and more complex
+  (3) partitioned, which is persistent and split into one
+      file per period of a date/datetime column
+  (4) hybrid, which is in-memory until it grows past a
+      size, then moves itself to a temporary file
+  (5) shared memory, a read-only view of a table another
+      process published to /dev/shm
+
+The table classes (and with them `sqlite3`) are only
+imported once a table is actually created, which keeps
+`import table` cheap.
 """
 
 
-from table.tables.base import Table
-from table.tables.in_memory import InMemoryTable
-from table.tables.persistent import PersistentTable
+from table.errors import TableError
+
+from typing import (
+    TYPE_CHECKING,
+    List,
+    Optional,
+    Tuple,
+    TypeVar,
+)
 
-from typing import Optional, TypeVar
+
+if TYPE_CHECKING:
+    from table.tables.base import Table
+    from table.tables.federated import FederatedTable
 
 
 Dataclass = TypeVar("Dataclass")
@@ -18,22 +37,185 @@ Dataclass = TypeVar("Dataclass")
 def table(
     dclass: Dataclass,
     location: Optional[str] = None,
-) -> Table:
+    partition_by: Optional[str] = None,
+    period: str = "month",
+    readonly: bool = False,
+    immutable: bool = False,
+    spill_at: Optional[int] = None,
+    preload: bool = False,
+    write_back: Optional[float] = None,
+    checkpoint_on_exit: bool = False,
+    threadsafe: bool = False,
+    shared_memory: Optional[str] = None,
+) -> "Table":
     """
     Create a table!
 
     If `location` is specified, the table will be created
     locally on disk (or loaded from disk, if it already
     exists). Otherwise, an in-memory table will be created.
+
+    If `partition_by` is also given, `location` is treated
+    as a directory and rows are split into one file per
+    `period` ("day", "month" or "year") of that date or
+    datetime field.
+
+    Persistent tables can be opened `readonly`, which skips
+    every CREATE and defers schema checks until first use.
+    `immutable` additionally promises SQLite the file will
+    not change while open, so it is never locked, letting
+    any number of reader processes share it freely.
+
+    With `preload`, a persistent table is copied into memory
+    when first used and queried from there. Changes are
+    written back to the file by `sync` and on `close`, also
+    every `write_back` seconds (checked after inserts and
+    queries) and on interpreter exit if `checkpoint_on_exit`.
+
+    An in-memory table given `spill_at` (in bytes) moves
+    itself to a temporary file once it grows that large,
+    so it can outgrow the memory it was expected to fit in.
+
+    A `threadsafe` table can be shared by many threads: each
+    gets its own connection, reads run concurrently and
+    writes are serialized (see `table.db.SharedDatabase`).
+
+    `shared_memory` opens, read-only, a table another
+    process `publish`ed under that name, and follows it
+    when it is published again. Every process reading it
+    shares one copy in memory.
     """
+    if preload and (partition_by or not location):
+        msg = "Only persistent tables can be preloaded"
+        raise TableError(msg)
+
+    if shared_memory is not None:
+        if location or partition_by or spill_at or preload:
+            msg = "`shared_memory` tables have no other `location` or mode"
+            raise TableError(msg)
+
+        from table.tables.shared_memory import (
+            SharedMemoryTable,
+        )
+
+        return SharedMemoryTable(
+            dclass=dclass,
+            name=shared_memory,
+            threadsafe=threadsafe,
+        )
+
+    if threadsafe and (partition_by or spill_at):
+        msg = "Partitioned and hybrid tables cannot be `threadsafe`"
+        raise TableError(msg)
+
+    if partition_by:
+        from table.tables.partitioned import (
+            PartitionedTable,
+        )
+
+        if not location:
+            msg = "Partitioned tables require a `location`"
+            raise TableError(msg)
+        return PartitionedTable(
+            dclass=dclass,
+            location=location,
+            partition_by=partition_by,
+            period=period,
+        )
+
+    if (readonly or immutable) and not location:
+        msg = "Only persistent tables can be read-only"
+        raise TableError(msg)
+
+    if spill_at is not None and location:
+        msg = "`spill_at` only applies to in-memory tables"
+        raise TableError(msg)
+
+    if spill_at is not None:
+        from table.tables.hybrid import HybridTable
+
+        return HybridTable(
+            dclass=dclass, spill_at=spill_at
+        )
+
     if not location:
+        from table.tables.in_memory import InMemoryTable
+
         location = ":memory:"
         return InMemoryTable(
             dclass=dclass,
             location=location,
+            threadsafe=threadsafe,
         )
     else:
+        from table.tables.persistent import PersistentTable
+
         return PersistentTable(
             dclass=dclass,
             location=location,
+            readonly=readonly,
+            immutable=immutable,
+            preload=preload,
+            write_back=write_back,
+            checkpoint_on_exit=checkpoint_on_exit,
+            threadsafe=threadsafe,
         )
+
+
+def federate(
+    dclass: Dataclass,
+    paths: List[str],
+    workers: Optional[int] = None,
+) -> "FederatedTable":
+    """
+    Query many persistent table files as if they were one.
+
+    Every file in `paths` must have been created with
+    `table(dclass, path)`. Aggregates are pushed down to
+    each file (in a pool of `workers` processes, if given)
+    and combined, see `FederatedTable.aggregate`.
+    """
+    from table.tables.federated import FederatedTable
+
+    return FederatedTable(
+        dclass=dclass,
+        paths=paths,
+        workers=workers,
+    )
+
+
+def memory_limits(
+    soft: Optional[int] = None,
+    hard: Optional[int] = None,
+) -> Tuple[int, int]:
+    """
+    Set SQLite's heap limits, in bytes, for the whole
+    process (every table shares one heap).
+
+    Past the `soft` limit SQLite frees cached pages to stay
+    under it. Past the `hard` limit allocations fail, and
+    the statement raises `table.db.MemoryLimitError` rather
+    than growing until the process is killed. A limit of 0
+    means none, and `None` leaves a limit as it is. SQLite
+    only allows the hard limit to be lowered once set.
+
+    Returns the (soft, hard) limits now in effect.
+    """
+    from table.db import heap_limits
+
+    return heap_limits(soft, hard)
+
+
+def statement_cache(size: Optional[int] = None) -> int:
+    """
+    Set how many compiled statements each connection keeps
+    (sqlite3's `cached_statements`), for tables that have
+    not connected yet. Raise it when many distinct queries
+    would otherwise evict those run over and over, such as
+    the ones `Table.prepare`d.
+
+    Returns the size now in effect.
+    """
+    from table.db import statement_cache as set_size
+
+    return set_size(size)
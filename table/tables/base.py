@@ -1,17 +1,90 @@
 from table.db import (
+    Cancellation,
     Database,
     DatabaseError,
+    PreparedQuery,
+    SharedDatabase,
+    nt_builder,
+    qualified_ddl,
+)
+from table.aggregates import parse_query
+from table.changes import (
+    Change,
+    changes_statement,
+    log_name,
+    track_statements,
+)
+from table.checksums import (
+    EMPTY,
+    FANOUT,
+    LEAF_SPAN,
+    Diff,
+    RangeChecksum,
+    bucket_statement,
+    range_statement,
+    split,
+)
+from table.compression import (
+    compress_rows,
+    compressed_type,
+)
+from table.dedupe import Inserted, hash_statements
+from table.dictionary import (
+    Dictionary,
+    decoding_select,
+    dictionary_ddl,
+    dictionary_name,
+    encoded_type,
 )
 from table.errors import TableError
+from table.materialized import (
+    REGISTRY,
+    materialize_statements,
+    refresh_statements,
+)
+from table.pagination import (
+    Page,
+    decode_cursor,
+    encode_cursor,
+    page_statement,
+)
+from table.ranges import (
+    MAX_PAIRS,
+    RANGE_TYPES,
+    range_index_ddl,
+    range_pairs,
+    within_statement,
+)
 from table.results import Results
+from table.sampling import (
+    MAX_PROBES,
+    MIN_HITS,
+    PROBE_BATCH,
+    Estimate,
+    estimate,
+    probe_statement,
+    random_rowids,
+    seeded_random,
+    within_error,
+)
 
 import logging
-from abc import ABC, abstractstaticmethod
-from dataclasses import is_dataclass
+from abc import ABC, abstractmethod
+from dataclasses import fields, is_dataclass
+from datetime import date, datetime
 from functools import partial
+from inspect import Parameter, signature
+from operator import methodcaller
+from threading import Lock
+from time import monotonic, sleep
 from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
     List,
     Optional,
+    Tuple,
     TypeVar,
     Union,
 )
@@ -23,12 +96,18 @@ __all__ = ["Table"]
 LOGGER = logging.getLogger(__name__)
 Dataclass = TypeVar("Dataclass")
 
+# re-ANALYZE once a table has grown by this share since its
+# last ANALYZE, but never for fewer than ANALYZE_MIN_ROWS
+ANALYZE_THRESHOLD = 0.1
+ANALYZE_MIN_ROWS = 1000
+
 
 class Table(ABC):
     def __init__(
         self,
         dclass: Dataclass,
         location: str,
+        threadsafe: bool = False,
     ) -> None:
         if not is_dataclass(dclass):
             typ = type(dclass)
@@ -37,19 +116,88 @@ class Table(ABC):
 
         self.dclass = dclass
         self.location = location
+        self.threadsafe = threadsafe
 
         self._name = dclass.__name__.lower()
-        self._schema = {
-            col.lower(): typ
-            for col, typ in dclass.__dict__[
-                "__annotations__"
-            ].items()
-        }
+        self._schema = dataclass_schema(dclass)
+
+        # dictionary encoded columns, and the value => code
+        # mappings seen so far for each
+        self._encoded = [
+            col
+            for col, typ in self._schema.items()
+            if typ is Dictionary
+        ]
+        self._dictionaries: Dict[str, Dict[str, int]] = {}
+
+        # connecting (and any DDL) waits until first use
+        self._database: Optional[Database] = None
+        self._connecting = Lock()
+
+        # `None` turns automatic ANALYZE off
+        self.analyze_threshold = ANALYZE_THRESHOLD
+        self._analyzed_rows: Optional[int] = None
+        self._inserted = 0
 
-        self._db: Database = self._connect(
-            self.location, self._name, self._schema
+        # the databases set up for `insert(dedupe=True)`
+        self._hashed: set = set()
+
+        # Python functions registered from SQL, replayed on
+        # every (re)connect
+        self._registered: List[
+            Callable[[Database], bool]
+        ] = []
+
+        # defaults for `query`, `None` is unlimited
+        self.timeout: Optional[float] = None
+        self.max_vm_steps: Optional[int] = None
+
+    @property
+    def _db(self) -> Database:
+        if self._database is None:
+            # threads racing to connect would each create
+            # the database
+            with self._connecting:
+                if self._database is None:
+                    db = self._connect(
+                        self.location,
+                        self._name,
+                        self._schema,
+                    )
+                    self._validate(db)
+                    self._prepare(db)
+                    self._database = db
+        return self._database
+
+    @property
+    def _database_class(self) -> type:
+        return (
+            SharedDatabase if self.threadsafe else Database
         )
 
+    @property
+    def _storage(self) -> str:
+        """
+        The table itself, even when a decoding view shadows
+        it (see `table.dictionary`)
+        """
+        if self._encoded:
+            return f"main.{self._name}"
+        return self._name
+
+    @property
+    def _source(self) -> str:
+        """
+        What to select from when the rowid is needed along
+        with the (decoded) columns
+        """
+        if self._encoded:
+            select = decoding_select(
+                self._name, self._schema, rowid=True
+            )
+            return f"({select}) AS {self._name}"
+        return self._name
+
     @property
     def schema(self) -> dict:
         """
@@ -63,10 +211,24 @@ class Table(ABC):
         return full
 
     def insert(
-        self, data: Union[Dataclass, List[Dataclass]]
-    ) -> int:
+        self,
+        data: Union[Dataclass, List[Dataclass]],
+        dedupe: bool = False,
+    ) -> Union[bool, Inserted]:
         """
-        Insert one or more records into the table
+        Insert one or more records into the table.
+
+        With `dedupe`, records already in the table (or
+        repeated in `data`) are skipped, and the counts of
+        records `inserted` and `skipped` are returned:
+
+        >>> tbl.insert(records, dedupe=True)
+        Inserted(inserted=950, skipped=50)
+
+        Records are told apart by a 64-bit hash of their
+        values, kept in a side table from the first
+        deduplicated insert on. Creating it hashes the rows
+        already in the table, once.
         """
         dclass_to_row = partial(format_insert, self.dclass)
 
@@ -77,19 +239,82 @@ class Table(ABC):
             xformer = dclass_to_row
             count = 1
 
-        records = xformer(data)
-        count = self._db.insert(
-            table=self._name,
+        records = self._encode(xformer(data))
+        if dedupe:
+            if not isinstance(records, list):
+                records = [records]
+            self._hash_rows()
+            inserted = self._db.insert_distinct(
+                self._name, self._schema, records
+            )
+            self._track_growth(inserted)
+            return Inserted(inserted, count - inserted)
+
+        inserted = self._db.insert(
+            table=self._storage,
             schema=self._schema,
             data=records,
         )
+        self._track_growth(count)
+
+        return inserted
+
+    def parallel_load(
+        self,
+        source: Iterable,
+        workers: Optional[int] = None,
+        loader: Optional[
+            Callable[[str], Iterable[Dataclass]]
+        ] = None,
+    ) -> int:
+        """
+        Insert many records using a pool of `workers`
+        processes (default: one per CPU), returning the
+        number loaded.
+
+        `source` is an iterable of records, handed to the
+        workers in chunks, or with `loader`, a list of files
+        that each worker reads with `loader(path)`. Either
+        way the dataclass (and `loader`) must be defined at
+        module level, so the workers can import them.
+
+        Each worker writes to a shard database of its own,
+        and the shards are then merged into the table in one
+        transaction (per `attach_limit` shards). Rows arrive
+        in no particular order. When the load outgrows the
+        rows already in the table, its indexes are dropped
+        for the merge and built again afterwards.
+        """
+        from table.loading import load_shards
 
+        from shutil import rmtree
+        from tempfile import mkdtemp
+
+        directory = mkdtemp(prefix=f"{self._name}_")
+        try:
+            shards = load_shards(
+                directory,
+                self.dclass,
+                source,
+                workers,
+                loader,
+            )
+            count = sum(shards.values())
+            if count:
+                self._merge(list(shards), count)
+        finally:
+            rmtree(directory, ignore_errors=True)
+
+        self._track_growth(count)
         return count
 
     def query(
         self,
         querystring: str,
         variables: Optional[tuple] = None,
+        timeout: Optional[float] = None,
+        max_vm_steps: Optional[int] = None,
+        cancel: Optional[Cancellation] = None,
     ) -> List[Optional[Dataclass]]:
         """
         Execute a table query.
@@ -103,11 +328,475 @@ class Table(ABC):
                 "SELECT * FROM foo LIMIT ? OFFSET ?",
                 (5, 10)
             )
+
+        A query running longer than `timeout` seconds or
+        `max_vm_steps` SQLite instructions (defaulting to
+        the table's `timeout`/`max_vm_steps` attributes), or
+        whose `cancel` token is cancelled from another
+        thread, is interrupted with `QueryInterruptedError`.
         """
-        output = self._db.execute(querystring, variables)
+        with self._interruptible(
+            timeout, max_vm_steps, cancel
+        ):
+            output = self._db.execute(
+                querystring, variables
+            )
         results = Results(output)
         return results
 
+    def prepare(self, querystring: str) -> PreparedQuery:
+        """
+        Prepare a query to be run many times, with different
+        `variables` each time:
+
+        >>> older_than = tbl.prepare(
+                "SELECT * FROM foo WHERE age > ?"
+            )
+        >>> older_than((30,))
+
+        Calls return `Results`, just like `query`, but the
+        columns and row type are only worked out once. Writes
+        can also be run in a batch, in one transaction:
+
+        >>> add = tbl.prepare("INSERT INTO foo VALUES (?, ?)")
+        >>> add.many([("Joe", 30), ("Bob", 40)])
+
+        Reads can be run in a batch too, returning `Results`
+        per set of `variables`.
+
+        If the table has a `timeout` or `max_vm_steps` when
+        the query is prepared, they apply to every call;
+        changing them later does not.
+        """
+        limits = None
+        if (self.timeout, self.max_vm_steps) != (
+            None,
+            None,
+        ):
+            limits = partial(
+                self._db.interruptible,
+                self.timeout,
+                self.max_vm_steps,
+            )
+        return self._db.prepare(
+            querystring, Results, limits
+        )
+
+    def publish(self, name: str) -> str:
+        """
+        Copy the table to shared memory (`/dev/shm`) as
+        `name`, for other processes to read with
+        `table(dclass, shared_memory=name)`. Publishing again
+        swaps the new version in atomically.
+
+        Returns the path of the published file, which stays
+        until it is removed
+        """
+        from table.tables.shared_memory import publish
+
+        return publish(self._db, self._name, name)
+
+    def analyze(self) -> bool:
+        """
+        Gather the statistics SQLite's query planner uses to
+        choose between indexes.
+
+        This happens on its own once the table has grown by
+        `analyze_threshold` (10% by default) since it was
+        last analyzed, and `close` runs `PRAGMA optimize`,
+        so calling it directly is rarely needed.
+        """
+        self._db.analyze(self._name)
+        self._analyzed_rows = self._db.analyzed(
+            self._name
+        )[0]
+        self._inserted = 0
+        return True
+
+    def stats(self) -> dict:
+        """
+        Row count, planner statistics and indexes of the
+        table. An index's `selectivity` is the share of rows
+        an equality match on its first column is expected to
+        hit (lower is better); it is `None` until analyzed
+        """
+        rows = self._db.execute(
+            f"SELECT count(*) AS n FROM {self._storage}"
+        )[0].n
+        analyzed_rows, analyzed_at = self._db.analyzed(
+            self._name
+        )
+        indexes = {
+            name: {"columns": cols, "selectivity": sel}
+            for name, (cols, sel) in self._db.index_stats(
+                self._name
+            ).items()
+        }
+        return {
+            "table": self._name,
+            "rows": rows,
+            "analyzed_rows": analyzed_rows,
+            "analyzed_at": analyzed_at,
+            "indexes": indexes,
+        }
+
+    def storage_report(self) -> dict:
+        """
+        Pages and bytes on disk (or in memory) for every
+        table and index in the database, largest first, as
+        measured by the dbstat virtual table. `unused` is
+        free space within those pages
+        """
+        objects = {
+            row.name: {
+                "type": row.type,
+                "table": row.tbl,
+                "pages": row.pages,
+                "bytes": row.bytes,
+                "unused": row.unused,
+            }
+            for row in self._db.storage()
+        }
+        return {
+            "table": self._name,
+            "bytes": sum(
+                o["bytes"] for o in objects.values()
+            ),
+            "objects": objects,
+        }
+
+    def compact(
+        self,
+        order_by: Optional[List[str]] = None,
+        online: bool = False,
+    ) -> dict:
+        """
+        Rewrite the table in `order_by` order (or rowid order,
+        to just defragment it), then VACUUM the database to
+        give back free pages. Returns the database's `pages`
+        and `free` pages `before` and `after`:
+
+        >>> tbl.compact(order_by=["customer_id"])
+        {'table': 'orders', 'before': {'pages': 5120, 'free': 1400}, 'after': {'pages': 3650, 'free': 0}}
+
+        Range scans on the leading `order_by` column then
+        read adjacent pages rather than pages scattered over
+        the file. The order is not kept up as rows arrive, so
+        compact again every so often. Rowids are renumbered,
+        so `changes` tokens taken before (on a table without
+        `track_changes`) no longer apply. Dictionary encoded
+        columns sort by code, which still groups equal values.
+
+        The rewrite is one transaction, so other connections
+        see the table either before or after. With `online`,
+        a file database is switched to WAL, where readers are
+        never blocked by a writer, and the VACUUM (which
+        rewrites the whole file) is skipped: pages freed by
+        the rewrite are reused by later inserts.
+        """
+        from table.compaction import (
+            DEPENDENTS_STATEMENT,
+            compact_statements,
+        )
+
+        order_by = [col.lower() for col in order_by or []]
+        bad = [
+            c for c in order_by if c not in self._schema
+        ]
+        if bad:
+            msg = f"Cannot order by unknown columns {bad}"
+            raise TableError(msg)
+
+        if online and self._db.db != ":memory:":
+            self._db.set_pragma("journal_mode", "WAL")
+
+        before = self._db.pages()
+        analyzed = self._db.analyzed(self._name)[0]
+        dependents = self._db.execute(
+            DEPENDENTS_STATEMENT, (self._name,)
+        )
+        stmts = compact_statements(
+            self._name,
+            self._schema,
+            order_by,
+            [tuple(dep) for dep in dependents],
+            bool(self._db.text_index_columns(self._name)),
+            range_pairs(
+                self._db.range_index_columns(self._name)
+            ),
+        )
+        self._db.execute_statements(stmts)
+
+        if not online:
+            self._vacuum()
+        # the statistics of the indexes went with them
+        if analyzed is not None:
+            self.analyze()
+
+        return {
+            "table": self._name,
+            "before": before,
+            "after": self._db.pages(),
+        }
+
+    def memory_usage(self) -> dict:
+        """
+        Memory held on behalf of this table: the database
+        itself for in-memory tables, TEMP objects, the most
+        the page cache may grow to, and the Python-side
+        caches (`hits`/`misses`/`size` per cache).
+
+        SQLite's own heap can be capped process-wide with
+        `table.memory_limits`.
+        """
+        usage = self._db.memory()
+        usage["python"] = {
+            "rows": cache_usage(nt_builder),
+            "schema": cache_usage(Database.schema),
+            "dictionaries": sum(
+                len(codes)
+                for codes in self._dictionaries.values()
+            ),
+        }
+        return usage
+
+    def close(self) -> bool:
+        """
+        Close the connection, first running
+        `PRAGMA optimize` to refresh any stale statistics.
+        The table reconnects if it is used again, though an
+        in-memory table starts over empty
+        """
+        if self._database is not None:
+            self._database.close()
+            self._database = None
+        # a new in-memory database has no hashes, nor codes
+        self._hashed.clear()
+        self._dictionaries.clear()
+        return True
+
+    def __enter__(self) -> "Table":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def paginate(
+        self,
+        order_by: Optional[List[str]] = None,
+        page_size: int = 100,
+        after: Optional[str] = None,
+        where: Optional[str] = None,
+        variables: Optional[tuple] = None,
+        descending: bool = False,
+    ) -> Page:
+        """
+        Fetch one page of rows, ordered by `order_by` (or
+        insertion order, if not given).
+
+        Returns a `Page` of `rows` and a `cursor`; pass the
+        cursor back as `after` to fetch the next page. The
+        cursor is `None` once there are no more rows:
+
+        >>> page = tbl.paginate(order_by=["age"])
+        >>> while page.cursor:
+                page = tbl.paginate(
+                    order_by=["age"], after=page.cursor
+                )
+
+        Unlike `LIMIT ? OFFSET ?`, every page costs the same
+        no matter how deep it is, as long as `order_by` is
+        indexed (see `index_column`). The `order_by` columns
+        should not contain NULLs. `where` and `variables`
+        filter the rows as they would in `query`.
+        """
+        order_by = [col.lower() for col in order_by or []]
+        columns = list(self._schema)
+        width = len(columns)
+
+        bind = tuple(variables or ())
+        if after:
+            bind += decode_cursor(after, order_by)
+        bind += (page_size + 1,)
+
+        stmt = page_statement(
+            self._source,
+            columns,
+            order_by,
+            bool(after),
+            where,
+            descending,
+        )
+        output = self._db.execute(stmt, bind)
+
+        cursor = None
+        if len(output) > page_size:
+            output = output[:page_size]
+            keys = output[-1][width:]
+            cursor = encode_cursor(order_by, keys)
+
+        nt = nt_builder(tuple(columns))
+        rows = [nt(*row[:width]) for row in output]
+        return Page(Results(rows), cursor)
+
+    def sample(
+        self,
+        n: Optional[int] = None,
+        fraction: Optional[float] = None,
+        seed: Optional[int] = None,
+    ) -> List[Dataclass]:
+        """
+        Fetch `n` random rows, or roughly `fraction` of them,
+        in random order. A `seed` makes the sample repeatable.
+
+        Rows are found by probing random rowids rather than
+        `ORDER BY random()`, so only the sampled rows are
+        read, however large the table is:
+
+        >>> tbl.sample(100, seed=42)
+        >>> tbl.sample(fraction=0.01)
+        """
+        if (n is None) == (fraction is None):
+            msg = "Pass exactly one of `n` or `fraction`"
+            raise TableError(msg)
+        if fraction is not None and not 0 <= fraction <= 1:
+            msg = "`fraction` must be between 0 and 1"
+            raise TableError(msg)
+
+        low, high = self._rowid_range()
+        if low is None:
+            return Results([])
+        span = high - low + 1
+
+        # each rowid is probed at most once, so either every
+        # row is equally likely (`n`), or each row is kept
+        # with probability `fraction`
+        rng = seeded_random(seed)
+        seen = set()
+        rows = []
+        probes = round(fraction * span) if fraction else 0
+        while len(seen) < span:
+            if fraction is not None:
+                want = probes - len(seen)
+            else:
+                needed = n - len(rows)
+                if needed <= 0:
+                    break
+                # scale up by the share of rowids that miss
+                rate = len(rows) / len(seen) if rows else 1
+                want = round(needed / rate)
+
+            want = min(want, PROBE_BATCH)
+            if want <= 0:
+                break
+            rowids = random_rowids(
+                rng, low, high, want, seen
+            )
+            rows += self._probe(rowids)
+
+        if n is not None:
+            rows = rows[:n]
+        return Results(rows)
+
+    def approx(
+        self,
+        querystring: str,
+        variables: Optional[tuple] = None,
+        error: float = 0.05,
+        confidence: float = 0.95,
+        seed: Optional[int] = None,
+        max_probes: int = MAX_PROBES,
+    ) -> List[Estimate]:
+        """
+        Estimate the count/sum/avg aggregates of
+        `SELECT ... FROM <table> [WHERE ...]` from a random
+        sample, instead of scanning the whole table:
+
+        >>> tbl.approx(
+                "SELECT count(*), avg(age) FROM foo WHERE age > ?",
+                (30,),
+                error=0.01,
+            )
+
+        Returns one `Estimate(name, value, low, high)` per
+        aggregate, where `low`/`high` bound the true value
+        with the given `confidence`. Rows are sampled until
+        at least 30 match and every interval is within
+        `error` (relative) of its value, so the cost depends
+        on `error` and not on the size of the table.
+
+        Filters that match almost nothing need a large
+        sample, so at most `max_probes` rowids are probed;
+        the intervals are then returned as they stand, and
+        may be wider than `error`.
+        """
+        query = parse_query(querystring)
+        if query.table != self._name:
+            msg = f"Query must select from '{self._name}'"
+            raise TableError(msg)
+        if query.group_by:
+            msg = "`approx` does not support GROUP BY"
+            raise TableError(msg)
+        for func, _, alias in query.aggregates:
+            if func not in ("count", "sum", "avg"):
+                msg = f"Cannot estimate '{alias}', only count/sum/avg"
+                raise TableError(msg)
+
+        low, high = self._rowid_range()
+        if low is None:
+            low, high = 1, 0
+        span = high - low + 1
+
+        columns = []
+        for _, col, _ in query.aggregates:
+            if col != "*" and col not in columns:
+                columns.append(col)
+
+        rng = seeded_random(seed)
+        seen = set()
+        hits = []
+        while True:
+            rowids = random_rowids(
+                rng,
+                low,
+                high,
+                min(PROBE_BATCH, max_probes - len(seen)),
+                seen,
+            )
+            if rowids:
+                stmt = probe_statement(
+                    self._source,
+                    columns,
+                    len(rowids),
+                    query.where,
+                )
+                bind = tuple(variables or ()) + tuple(
+                    rowids
+                )
+                hits += [
+                    row
+                    for row in self._db.execute(stmt, bind)
+                    if query.where is None
+                    or row.sample_hit
+                ]
+
+            estimates = [
+                estimate(
+                    agg, hits, len(seen), span, confidence
+                )
+                for agg in query.aggregates
+            ]
+            converged = len(hits) >= MIN_HITS and all(
+                within_error(est, error)
+                for est in estimates
+            )
+            if (
+                converged
+                or not rowids
+                or len(seen) >= max_probes
+            ):
+                return Results(estimates)
+
     def index_column(self, column: str) -> bool:
         """
         Create an "index" on a column.
@@ -124,14 +813,866 @@ class Table(ABC):
         self._db.create_index(self._name, column)
         return True
 
-    @abstractstaticmethod
+    def index_expression(self, expression: str) -> bool:
+        """
+        Create an "index" on an expression, such as
+        `lower(name)` or `my_function(age)`.
+
+        Queries filtering on the exact same expression can
+        then use the index. Python functions must have been
+        registered as deterministic to be used here.
+        """
+        self._db.create_index(self._name, expression)
+        return True
+
+    def register_function(
+        self,
+        fnc: Callable,
+        deterministic: bool = True,
+        name: Optional[str] = None,
+    ) -> bool:
+        """
+        Make a Python function callable from SQL.
+
+        Functions registered as `deterministic` (the same
+        inputs always give the same output) can be used in
+        `index_expression` and in generated columns, so
+        filtering on derived values is backed by an index:
+
+        >>> tbl.register_function(normalize)
+        >>> tbl.index_expression("normalize(email)")
+        >>> tbl.query(
+                "SELECT * FROM foo WHERE normalize(email) = ?",
+                ("joe@schmo.com",),
+            )
+
+        Registrations survive reconnects of the table, but
+        any other process opening the same file has to
+        register them as well.
+        """
+        name = function_name(fnc, name)
+        register = methodcaller(
+            "register_function",
+            name=name,
+            fnc=fnc,
+            nargs=arg_count(fnc),
+            deterministic=deterministic,
+        )
+        return self._register(register)
+
+    def register_aggregate(
+        self, cls: type, name: Optional[str] = None
+    ) -> bool:
+        """
+        Make a Python aggregate callable from SQL.
+
+        `cls` needs a `step` method, called once per row,
+        and a `finalize` method returning the result:
+        https://docs.python.org/3/library/sqlite3.html#sqlite3.Connection.create_aggregate
+        """
+        name = function_name(cls, name)
+        register = methodcaller(
+            "register_aggregate",
+            name=name,
+            cls=cls,
+            nargs=arg_count(cls.step) - 1,
+        )
+        return self._register(register)
+
+    def register_window(
+        self, cls: type, name: Optional[str] = None
+    ) -> bool:
+        """
+        Make a Python aggregate window function callable
+        from SQL.
+
+        On top of `step` and `finalize`, `cls` needs an
+        `inverse` and a `value` method:
+        https://docs.python.org/3/library/sqlite3.html#sqlite3.Connection.create_window_function
+        """
+        name = function_name(cls, name)
+        register = methodcaller(
+            "register_window",
+            name=name,
+            cls=cls,
+            nargs=arg_count(cls.step) - 1,
+        )
+        return self._register(register)
+
+    def _register(
+        self, register: Callable[[Database], bool]
+    ) -> bool:
+        # a closed table connects again on next use, and
+        # `_prepare` registers them with the new database
+        register(self._db)
+        self._registered.append(register)
+        return True
+
+    def index_text(
+        self,
+        column: str,
+        *columns: str,
+        tokenize: Optional[str] = None,
+    ) -> bool:
+        """
+        Create a full-text index on one or more str columns.
+
+        The index is an FTS5 table kept in sync with the
+        table by triggers, so it stays current through
+        inserts, updates and deletes. Indexing another
+        column later on rebuilds the index to cover both.
+        `tokenize` is passed through to FTS5, e.g.
+        "porter unicode61":
+        https://www.sqlite.org/fts5.html#tokenizers
+        """
+        self._check_not_encoded("index_text")
+        given = [
+            col.lower() for col in (column,) + columns
+        ]
+
+        bad = [
+            c
+            for c in given
+            if self._schema.get(c) is not str
+        ]
+        if bad:
+            msg = f"Only str columns can be text indexed, received {bad}"
+            raise TableError(msg)
+
+        existing = self._db.text_index_columns(self._name)
+        cols = existing + [
+            c for c in given if c not in existing
+        ]
+
+        self._db.create_text_index(
+            self._name, cols, tokenize
+        )
+        return True
+
+    def search(
+        self,
+        term: str,
+        limit: Optional[int] = 10,
+    ) -> List[Dataclass]:
+        """
+        Full-text search the columns indexed by `index_text`.
+
+        Returns the matching records, best match first (as
+        ranked by bm25). `term` uses the FTS5 query syntax:
+        https://www.sqlite.org/fts5.html#full_text_query_syntax
+
+        >>> tbl.search("schmo OR bob", limit=5)
+        """
+        if not self._db.text_index_columns(self._name):
+            msg = f"Table '{self._name}' has no text index, see `index_text`"
+            raise TableError(msg)
+
+        rows = self._db.text_search(
+            self._name, list(self._schema), term, limit
+        )
+        return [
+            format_record(self.dclass, r) for r in rows
+        ]
+
+    def index_range(
+        self, columns: List[Union[str, Tuple[str, str]]]
+    ) -> bool:
+        """
+        Create a range index over up to five (min, max)
+        column pairs, such as the `(start, end)` of an
+        interval, or a point's coordinates (a single column
+        stands for itself as min and max):
+
+        >>> tbl.index_range(["lat", "lon"])
+        >>> tbl.index_range([("start", "end")])
+
+        Unlike `index_column`, which only narrows a search
+        down on one column, the index (an R*Tree kept in sync
+        by triggers) finds rows within bounds on all of the
+        pairs at once; see `within`. Columns must be int,
+        float, date or datetime. Indexing again replaces the
+        index.
+        """
+        pairs = [
+            (col, col) if isinstance(col, str) else col
+            for col in columns
+        ]
+        pairs = [
+            (low.lower(), high.lower())
+            for low, high in pairs
+        ]
+        if not 0 < len(pairs) <= MAX_PAIRS:
+            msg = f"A range index covers 1 to {MAX_PAIRS} column pairs, received {len(pairs)}"
+            raise TableError(msg)
+
+        for pair in pairs:
+            types = [self._schema.get(col) for col in pair]
+            temporal = [
+                t in (date, datetime) for t in types
+            ]
+            if (
+                not all(t in RANGE_TYPES for t in types)
+                or temporal[0] != temporal[1]
+            ):
+                msg = f"Cannot range index {pair}, use int, float, date or datetime columns (dates with dates)"
+                raise TableError(msg)
+
+        firsts = [low for low, _ in pairs]
+        if len(set(firsts)) != len(firsts):
+            msg = f"Range index pairs must start with different columns, received {pairs}"
+            raise TableError(msg)
+
+        self._db.execute_statements(
+            range_index_ddl(
+                self._name, self._schema, pairs
+            )
+        )
+        return True
+
+    def within(self, **bounds: tuple) -> List[Dataclass]:
+        """
+        The records within `bounds` on the pairs indexed by
+        `index_range`, keyed by each pair's first column, in
+        insertion order. A record is within (low, high) when
+        its (min, max) overlaps it; either bound may be
+        `None`:
+
+        >>> tbl.within(lat=(40.5, 41.0), lon=(-74.3, -73.7))
+        >>> tbl.within(start=(date(2021, 1, 1), None))
+        """
+        pairs = range_pairs(
+            self._db.range_index_columns(self._name)
+        )
+        if not pairs:
+            msg = f"Table '{self._name}' has no range index, see `index_range`"
+            raise TableError(msg)
+
+        by_first = {pair[0]: pair for pair in pairs}
+        given = []
+        for col, (low, high) in bounds.items():
+            pair = by_first.get(col.lower())
+            if pair is None:
+                msg = f"No range indexed pair starts with '{col}', use one of {list(by_first)}"
+                raise TableError(msg)
+            given.append((pair, low, high))
+
+        stmt, bind = within_statement(
+            self._source,
+            self._name,
+            self._schema,
+            pairs,
+            given,
+        )
+        rows = self._db.execute(stmt, bind)
+        return [
+            format_record(self.dclass, r) for r in rows
+        ]
+
+    def materialize(self, name: str, sql: str) -> bool:
+        """
+        Store the result of an aggregate query as `name`,
+        which can then be queried like any other table.
+
+        Queries of the shape
+
+            SELECT <cols>, count(*) AS n, avg(x) AS mean_x
+            FROM <table> GROUP BY <cols>
+
+        (using any of count/sum/min/max/avg) are kept up to
+        date incrementally as rows are inserted. Any other
+        query is stored as-is and only updated by `refresh`.
+        """
+        try:
+            query = parse_query(sql)
+        except TableError as e:
+            LOGGER.debug(
+                f"Not maintained incrementally: {e}"
+            )
+            query = None
+
+        # triggers cannot see through a decoding view
+        if query and (
+            query.table != self._name
+            or query.where
+            or self._encoded
+        ):
+            query = None
+
+        stmts = materialize_statements(
+            name, sql, query, self._schema
+        )
+        # registered along with the rest, or not at all
+        register = (
+            f"INSERT INTO {REGISTRY} VALUES (?, ?, ?)",
+            [(name, sql, query is not None)],
+        )
+        self._db.execute_statements(stmts + [register])
+        return True
+
+    def refresh(self, name: str) -> bool:
+        """
+        Recompute a table created by `materialize`
+        """
+        rows = self._db.execute(
+            f"SELECT sql, incremental FROM {REGISTRY} WHERE name = ?",
+            (name,),
+        )
+        if not rows:
+            msg = f"'{name}' is not a materialized table"
+            raise TableError(msg)
+
+        sql, incremental = rows[0]
+        query = parse_query(sql) if incremental else None
+
+        stmts = refresh_statements(name, sql, query)
+        self._db.execute_statements(stmts)
+        return True
+
+    def track_changes(
+        self, updates: bool = True, deletes: bool = True
+    ) -> bool:
+        """
+        Log inserted (and optionally updated and deleted)
+        rows for `changes` and `follow`.
+
+        Rows inserted before this is called are not in the
+        log, so enable it before consumers start reading.
+        """
+        self._check_not_encoded("track_changes")
+        stmts = track_statements(
+            self._name, self._schema, updates, deletes
+        )
+        self._db.execute_statements(stmts)
+        return True
+
+    def changes(
+        self,
+        since: Optional[int] = None,
+        batch_size: int = 1000,
+    ) -> Iterator[Change]:
+        """
+        Iterate over the changes made after the `since`
+        watermark, oldest first.
+
+        Each `Change` carries the `op` ("insert", "update"
+        or "delete"), the `record` itself and a `token`.
+        Store the token of the last change processed and
+        pass it back as `since` to pick up where you left
+        off; only the rows after it are ever read:
+
+        >>> for change in tbl.changes(since=token):
+                handle(change.record)
+                token = change.token
+
+        Without `track_changes`, only inserts are reported,
+        and only reliably if rows are never deleted: the
+        token is then the rowid, and SQLite gives the rowid
+        of a deleted last row to the next insert, which a
+        consumer that has already seen that token misses.
+        """
+        logged = self._db.table_exists(
+            log_name(self._name)
+        )
+        stmt = changes_statement(
+            self._source, self._schema, logged
+        )
+
+        token = since or 0
+        while True:
+            rows = self._db.execute(
+                stmt, (token, batch_size)
+            )
+            for row in rows:
+                token, op = row[0], row[1]
+                record = format_record(
+                    self.dclass, row[2:]
+                )
+                yield Change(token, op, record)
+            if len(rows) < batch_size:
+                return
+
+    def follow(
+        self,
+        since: Optional[int] = None,
+        poll_interval: float = 0.5,
+        timeout: Optional[float] = None,
+    ) -> Iterator[Change]:
+        """
+        Like `changes`, but blocks waiting for new commits
+        instead of stopping at the end of the table.
+
+        Commits are detected with a cheap version check
+        every `poll_interval` seconds. The iterator ends if
+        nothing changes for `timeout` seconds (if given).
+        """
+        token = since
+        idle_since = monotonic()
+        version = None
+
+        while True:
+            current = self._db.data_version()
+            if current != version:
+                version = current
+                for change in self.changes(since=token):
+                    token = change.token
+                    idle_since = monotonic()
+                    yield change
+
+            if timeout is not None:
+                if monotonic() - idle_since >= timeout:
+                    return
+            sleep(poll_interval)
+
+    def checksum(
+        self,
+        ranges: Union[int, List[tuple]] = 1,
+        key: Optional[str] = None,
+    ) -> List[RangeChecksum]:
+        """
+        Checksum the rows in `ranges` equal ranges of rowid,
+        or in the given (low, high) ranges, inclusive. Each
+        `RangeChecksum` has the range's bounds, row count and
+        `digest`:
+
+        >>> tbl.checksum()
+        [RangeChecksum(low=1, high=1000, rows=1000, digest='9c1f...')]
+        >>> tbl.checksum(ranges=[(1, 500), (501, 1000)])
+
+        Copies of a table holding the same rows have the same
+        checksums. If the copies were loaded in different
+        orders, range over a unique integer `key` column
+        instead of the rowid.
+        """
+        key = self._range_key(key)
+        if not isinstance(ranges, int):
+            return [
+                self._bucket_checksums(key, low, high, 1)[
+                    0
+                ]
+                for low, high in ranges
+            ]
+
+        low, high = self._key_range(key)
+        if low is None:
+            return []
+        return self._bucket_checksums(
+            key, low, high, ranges
+        )
+
+    def diff(
+        self, other: "Table", key: Optional[str] = None
+    ) -> Diff:
+        """
+        Compare with `other`, a copy of this table, returning
+        the rowids (or `key`s) that are `missing` from it,
+        `extra` in it, and `changed`.
+
+        The copies' range checksums are compared from the top
+        down, and only the ranges that differ are split and
+        compared further, so copies that are mostly the same
+        are compared without reading most of their rows.
+        """
+        return self._diff(other, key)[0]
+
+    def sync_to(
+        self, other: "Table", key: Optional[str] = None
+    ) -> Diff:
+        """
+        Make `other` a copy of this table, transferring only
+        the rows that differ (see `diff`), in one transaction.
+        Returns the `Diff` applied.
+
+        When ranging over the rowid, rows keep their rowids
+        in `other`.
+        """
+        diff, rows = self._diff(other, key)
+        if any(diff):
+            other._apply_diff(
+                diff, rows, self._range_key(key)
+            )
+        return diff
+
+    @abstractmethod
     def _connect(
+        self,
         dbname: str,
         table: str,
         schema: dict,
     ) -> Database:
         pass
 
+    def _validate(self, db: Database) -> None:
+        """
+        Checks run right after connecting, on first use
+        """
+        pass
+
+    def _prepare(self, db: Database) -> None:
+        """
+        Set up what each connection needs, right after
+        `_validate`
+        """
+        for register in self._registered:
+            register(db)
+
+        if not self._encoded:
+            return
+
+        # codes are read again from the database connected to
+        self._dictionaries.clear()
+
+        if not db.readonly:
+            db.execute_statements(
+                [
+                    dictionary_ddl(self._name, col)
+                    for col in self._encoded
+                ]
+            )
+        db.create_temp_view(
+            self._name,
+            decoding_select(self._name, self._schema),
+        )
+
+    def _encode(
+        self, records: Union[tuple, List[tuple]]
+    ) -> Union[tuple, List[tuple]]:
+        """
+        Swap dictionary encoded values for their codes,
+        adding any new values to the dictionaries in bulk
+        """
+        if not self._encoded:
+            return records
+
+        rows = (
+            records
+            if isinstance(records, list)
+            else [records]
+        )
+        rows = [list(row) for row in rows]
+        for idx, col in enumerate(self._schema):
+            if col not in self._encoded:
+                continue
+            # in order of appearance, so codes are repeatable
+            values = dict.fromkeys(
+                row[idx] for row in rows
+            )
+            values.pop(None, None)
+            codes = self._codes(col, list(values))
+            for row in rows:
+                if row[idx] is not None:
+                    row[idx] = codes[row[idx]]
+
+        rows = [tuple(row) for row in rows]
+        return (
+            rows if isinstance(records, list) else rows[0]
+        )
+
+    def _codes(
+        self, column: str, values: List[str]
+    ) -> Dict[str, int]:
+        codes = self._dictionaries.setdefault(column, {})
+        missing = [v for v in values if v not in codes]
+        if missing:
+            name = dictionary_name(self._name, column)
+            self._db.execute(
+                f"INSERT OR IGNORE INTO {name} (value) VALUES (?)",
+                [(value,) for value in missing],
+            )
+            # low cardinality, so reading it all is cheap
+            rows = self._db.execute(
+                f"SELECT code, value FROM {name}"
+            )
+            codes.update(
+                {row.value: row.code for row in rows}
+            )
+        return codes
+
+    def _merge(
+        self, shards: List[str], count: int
+    ) -> None:
+        from table.loading import merge_statements
+
+        low, high = self._rowid_range()
+        existing = 0 if high is None else high - low + 1
+
+        drops, creates = [], []
+        if count > existing:
+            indexes = self._db.execute(
+                "SELECT name, sql FROM main.sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL",
+                (self._name,),
+            )
+            for idx in indexes:
+                drops.append(f"DROP INDEX main.{idx.name}")
+                creates.append(qualified_ddl(idx.sql))
+
+        size = self._db.attach_limit()
+        for start in range(0, len(shards), size):
+            end = start + size
+            aliases = []
+            try:
+                for path in shards[start:end]:
+                    alias = f"shard_{len(aliases)}"
+                    self._db.attach(path, alias)
+                    aliases.append(alias)
+
+                stmts = merge_statements(
+                    self._name, self._schema, aliases
+                )
+                self._db.execute_statements(
+                    drops + stmts + creates
+                )
+            finally:
+                for alias in aliases:
+                    self._db.detach(alias)
+
+    def _interruptible(
+        self,
+        timeout: Optional[float],
+        max_vm_steps: Optional[int],
+        cancel: Optional[Cancellation],
+    ):
+        if timeout is None:
+            timeout = self.timeout
+        if max_vm_steps is None:
+            max_vm_steps = self.max_vm_steps
+        return self._db.interruptible(
+            timeout, max_vm_steps, cancel
+        )
+
+    def _check_not_encoded(self, method: str) -> None:
+        if self._encoded:
+            msg = f"`{method}` is not supported on tables with dictionary encoded columns"
+            raise TableError(msg)
+
+    def _rowid_range(self) -> tuple:
+        # min/max of the rowid are single b-tree seeks
+        stmt = f"SELECT min(rowid) AS low, max(rowid) AS high FROM {self._storage}"
+        return tuple(self._db.execute(stmt)[0])
+
+    def _vacuum(self) -> None:
+        if not self._encoded:
+            self._db.vacuum()
+            return
+
+        # VACUUM replays the table's index DDL, which would
+        # resolve to the decoding view shadowing it
+        self._db.execute(f"DROP VIEW temp.{self._name}")
+        try:
+            self._db.vacuum()
+        finally:
+            select = decoding_select(
+                self._name, self._schema
+            )
+            self._db.execute(
+                f"CREATE TEMP VIEW {self._name} AS {select}"
+            )
+
+    def _hash_rows(self, database: str = "main") -> None:
+        # once per database, as it may hash the whole table
+        if database not in self._hashed:
+            self._db.execute_statements(
+                hash_statements(
+                    self._name, self._schema, database
+                )
+            )
+            self._hashed.add(database)
+
+    def _range_key(self, key: Optional[str]) -> str:
+        if key is None:
+            return "rowid"
+        key = key.lower()
+        if self._schema.get(key) is not int:
+            msg = f"Cannot range over '{key}', use an integer column"
+            raise TableError(msg)
+        return key
+
+    def _key_range(self, key: str) -> tuple:
+        if key == "rowid":
+            return self._rowid_range()
+        stmt = f"SELECT min({key}) AS low, max({key}) AS high FROM {self._storage}"
+        return tuple(self._db.execute(stmt)[0])
+
+    def _bucket_checksums(
+        self, key: str, low: int, high: int, parts: int
+    ) -> List[RangeChecksum]:
+        width, bounds = split(low, high, parts)
+        # decoded, so copies with different dictionary codes
+        # still agree
+        stmt = bucket_statement(
+            self._source, key, list(self._schema)
+        )
+        rows = self._db.execute(
+            stmt, (low, width, low, high)
+        )
+        found = {row.bucket: row for row in rows}
+
+        checksums = []
+        for idx, (start, end) in enumerate(bounds):
+            row = found.get(idx)
+            checksums.append(
+                RangeChecksum(
+                    start,
+                    end,
+                    row.rows if row else 0,
+                    row.digest if row else EMPTY,
+                )
+            )
+        return checksums
+
+    def _range_rows(
+        self, key: str, low: int, high: int
+    ) -> Dict[int, tuple]:
+        stmt = range_statement(
+            self._source, key, list(self._schema)
+        )
+        rows = self._db.execute(stmt, (low, high))
+        return {row[0]: tuple(row[1:]) for row in rows}
+
+    def _diff(
+        self, other: "Table", key: Optional[str]
+    ) -> tuple:
+        """
+        The `Diff` with `other`, and this table's rows for
+        the keys missing from or changed in `other`
+        """
+        if other._schema != self._schema:
+            msg = f"Cannot compare tables '{self._name}' and '{other._name}' with different schemas"
+            raise TableError(msg)
+
+        key = self._range_key(key)
+        spans = [
+            span
+            for span in (
+                self._key_range(key),
+                other._key_range(key),
+            )
+            if span[0] is not None
+        ]
+        missing, extra, changed = [], [], []
+        rows = {}
+
+        pending = []
+        if spans:
+            low = min(span[0] for span in spans)
+            high = max(span[1] for span in spans)
+            pending.append((low, high))
+
+        while pending:
+            low, high = pending.pop()
+            if high - low < LEAF_SPAN:
+                mine = self._range_rows(key, low, high)
+                theirs = other._range_rows(key, low, high)
+                for k, row in mine.items():
+                    if k not in theirs:
+                        missing.append(k)
+                    elif theirs[k] != row:
+                        changed.append(k)
+                    else:
+                        continue
+                    rows[k] = row
+                extra += [
+                    k for k in theirs if k not in mine
+                ]
+                continue
+
+            mine = self._bucket_checksums(
+                key, low, high, FANOUT
+            )
+            theirs = other._bucket_checksums(
+                key, low, high, FANOUT
+            )
+            pending += [
+                (ours.low, ours.high)
+                for ours, its in zip(mine, theirs)
+                if ours != its
+            ]
+
+        diff = Diff(
+            sorted(missing), sorted(extra), sorted(changed)
+        )
+        return diff, rows
+
+    def _apply_diff(
+        self, diff: Diff, rows: Dict[int, tuple], key: str
+    ) -> None:
+        """
+        Bring this table in line with another copy, given
+        their `Diff` and the other copy's differing rows
+        """
+        columns = list(self._schema)
+        if key == "rowid":
+            columns.insert(0, key)
+
+        stmts = []
+        deleted = diff.extra + diff.changed
+        if deleted:
+            stmts.append(
+                (
+                    f"DELETE FROM {self._storage} WHERE {key} = ?",
+                    [(k,) for k in deleted],
+                )
+            )
+
+        inserted = diff.missing + diff.changed
+        if inserted:
+            records = compress_rows(
+                self._schema,
+                self._encode([rows[k] for k in inserted]),
+            )
+            if key == "rowid":
+                records = [
+                    (k,) + record
+                    for k, record in zip(inserted, records)
+                ]
+            holdr = ", ".join(["?"] * len(columns))
+            stmts.append(
+                (
+                    f"INSERT INTO {self._storage} ({', '.join(columns)}) VALUES ({holdr})",
+                    records,
+                )
+            )
+
+        self._db.execute_statements(stmts)
+        self._track_growth(len(inserted))
+
+    def _probe(self, rowids: List[int]) -> List[tuple]:
+        """
+        Fetch the rows at `rowids` that exist, in the order
+        the rowids are given
+        """
+        if not rowids:
+            return []
+        columns = list(self._schema)
+        stmt = probe_statement(
+            self._source, columns, len(rowids)
+        )
+        output = self._db.execute(stmt, tuple(rowids))
+        found = {row.sample_rowid: row for row in output}
+
+        nt = nt_builder(tuple(columns))
+        width = len(columns)
+        return [
+            nt(*found[rowid][:width])
+            for rowid in rowids
+            if rowid in found
+        ]
+
+    def _track_growth(self, count: int) -> None:
+        if self.analyze_threshold is None:
+            return
+
+        if self._analyzed_rows is None:
+            self._analyzed_rows = (
+                self._db.analyzed(self._name)[0] or 0
+            )
+        self._inserted += count
+
+        growth = (
+            self.analyze_threshold * self._analyzed_rows
+        )
+        if self._inserted >= max(ANALYZE_MIN_ROWS, growth):
+            self.analyze()
+
     def _create_index(self):
         try:
             cols = list(self._schema)
@@ -142,6 +1683,27 @@ class Table(ABC):
 
 
 # ---------------------------------------------------------
+def dataclass_schema(dclass: Dataclass) -> Dict[str, type]:
+    schema = {
+        col.lower(): typ
+        for col, typ in dclass.__dict__[
+            "__annotations__"
+        ].items()
+    }
+    # e.g. `field(metadata={"compress": "zlib"})`
+    for fld in fields(dclass):
+        col = fld.name.lower()
+        if codec := fld.metadata.get("compress"):
+            schema[col] = compressed_type(
+                schema[col], codec
+            )
+        if encoding := fld.metadata.get("encoding"):
+            schema[col] = encoded_type(
+                schema[col], encoding
+            )
+    return schema
+
+
 def format_insert(
     model: type,
     record: Dataclass,
@@ -152,3 +1714,42 @@ def format_insert(
 
     r = tuple(record.__dict__.values())
     return r
+
+
+def cache_usage(fnc: Callable) -> dict:
+    info = fnc.cache_info()
+    return {
+        "hits": info.hits,
+        "misses": info.misses,
+        "size": info.currsize,
+        "max_size": info.maxsize,
+    }
+
+
+def format_record(model: type, row: tuple) -> Dataclass:
+    return model(*row)
+
+
+def function_name(
+    fnc: Callable, name: Optional[str]
+) -> str:
+    name = name or fnc.__name__.lower()
+    if not name.isidentifier():
+        msg = (
+            f"Invalid function name '{name}', pass `name`"
+        )
+        raise TableError(msg)
+    return name
+
+
+def arg_count(fnc: Callable) -> int:
+    params = signature(fnc).parameters.values()
+    if any(
+        p.kind == Parameter.VAR_POSITIONAL for p in params
+    ):
+        return -1
+    positional = (
+        Parameter.POSITIONAL_ONLY,
+        Parameter.POSITIONAL_OR_KEYWORD,
+    )
+    return len([p for p in params if p.kind in positional])
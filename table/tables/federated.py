@@ -0,0 +1,406 @@
+from table.aggregates import (
+    Aggregate,
+    combine,
+    parse_aggregates,
+    partial_terms,
+)
+from table.changes import Change
+from table.db import Cancellation, Database, nt_builder
+from table.errors import TableError
+from table.pagination import Page
+from table.results import Results
+from table.sampling import MAX_PROBES, Estimate
+from table.tables.base import Dataclass, Table
+from table.tables.persistent import META_TABLE
+
+from functools import partial
+from os.path import exists
+from time import monotonic
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+)
+
+
+__all__ = ["FederatedTable"]
+
+
+class FederatedTable(Table):
+    """
+    A read-only view over many persistent table files.
+
+    The files are attached in batches no larger than
+    SQLite's attach limit and exposed as a single
+    `UNION ALL` view named after the table.
+    """
+
+    def __init__(
+        self,
+        dclass: Dataclass,
+        paths: List[str],
+        workers: Optional[int] = None,
+    ) -> None:
+        missing = [p for p in paths if not exists(p)]
+        if missing:
+            msg = f"Files do not exist: {missing}"
+            raise TableError(msg)
+
+        self.paths = list(paths)
+        self.workers = workers
+
+        super().__init__(
+            dclass=dclass, location=":memory:"
+        )
+        self._check_not_encoded("federate")
+
+    def insert(self, data, dedupe: bool = False) -> bool:
+        msg = "Federated tables are read-only"
+        raise TableError(msg)
+
+    def prepare(self, querystring: str):
+        # each query runs once per batch of attached files
+        msg = "`prepare` is not supported on federated tables, use `query`"
+        raise TableError(msg)
+
+    def publish(self, name: str) -> str:
+        msg = "`publish` is not supported on federated tables"
+        raise TableError(msg)
+
+    def index_range(self, columns) -> bool:
+        msg = "Federated tables are read-only"
+        raise TableError(msg)
+
+    def compact(self, *args, **kwargs) -> dict:
+        msg = "`compact` is not supported on federated tables"
+        raise TableError(msg)
+
+    def sample(
+        self,
+        n: Optional[int] = None,
+        fraction: Optional[float] = None,
+        seed: Optional[int] = None,
+    ) -> List[Dataclass]:
+        # rowids are probed on a single table
+        msg = (
+            "`sample` is not supported on federated tables"
+        )
+        raise TableError(msg)
+
+    def approx(
+        self,
+        querystring: str,
+        variables: Optional[tuple] = None,
+        error: float = 0.05,
+        confidence: float = 0.95,
+        seed: Optional[int] = None,
+        max_probes: int = MAX_PROBES,
+    ) -> List[Estimate]:
+        msg = (
+            "`approx` is not supported on federated tables"
+        )
+        raise TableError(msg)
+
+    def paginate(
+        self,
+        order_by: Optional[List[str]] = None,
+        page_size: int = 100,
+        after: Optional[str] = None,
+        where: Optional[str] = None,
+        variables: Optional[tuple] = None,
+        descending: bool = False,
+    ) -> Page:
+        msg = "`paginate` is not supported on federated tables"
+        raise TableError(msg)
+
+    def track_changes(
+        self, updates: bool = True, deletes: bool = True
+    ) -> bool:
+        msg = "`track_changes` is not supported on federated tables"
+        raise TableError(msg)
+
+    def changes(
+        self,
+        since: Optional[int] = None,
+        batch_size: int = 1000,
+    ) -> Iterator[Change]:
+        # tokens are rowids of a single table
+        msg = "`changes` is not supported on federated tables"
+        raise TableError(msg)
+
+    def follow(
+        self,
+        since: Optional[int] = None,
+        poll_interval: float = 0.5,
+        timeout: Optional[float] = None,
+    ) -> Iterator[Change]:
+        msg = (
+            "`follow` is not supported on federated tables"
+        )
+        raise TableError(msg)
+
+    def materialize(self, name: str, sql: str) -> bool:
+        # its triggers would sit on a table no rows reach
+        msg = "`materialize` is not supported on federated tables"
+        raise TableError(msg)
+
+    def refresh(self, name: str) -> bool:
+        msg = "`refresh` is not supported on federated tables"
+        raise TableError(msg)
+
+    def index_text(
+        self,
+        column: str,
+        *columns: str,
+        tokenize: Optional[str] = None,
+    ) -> bool:
+        msg = "`index_text` is not supported on federated tables"
+        raise TableError(msg)
+
+    def search(
+        self,
+        term: str,
+        limit: Optional[int] = 10,
+    ) -> List[Dataclass]:
+        msg = (
+            "`search` is not supported on federated tables"
+        )
+        raise TableError(msg)
+
+    def _key_range(self, key: str) -> tuple:
+        # first step of `checksum`, `diff` and `sync_to`
+        msg = "Checksums are not supported on federated tables"
+        raise TableError(msg)
+
+    def parallel_load(
+        self,
+        source: Iterable,
+        workers: Optional[int] = None,
+        loader: Optional[
+            Callable[[str], Iterable[Dataclass]]
+        ] = None,
+    ) -> int:
+        msg = "Federated tables are read-only"
+        raise TableError(msg)
+
+    def index_column(self, column: str) -> bool:
+        msg = "Federated tables are read-only"
+        raise TableError(msg)
+
+    def index_expression(self, expression: str) -> bool:
+        msg = "Federated tables are read-only"
+        raise TableError(msg)
+
+    def query(
+        self,
+        querystring: str,
+        variables: Optional[tuple] = None,
+        timeout: Optional[float] = None,
+        max_vm_steps: Optional[int] = None,
+        cancel: Optional[Cancellation] = None,
+    ) -> Results:
+        """
+        Execute a table query against every file.
+
+        When there are more files than can be attached at
+        once, the query runs per batch and the rows are
+        concatenated. That is exact for row-level queries
+        (filters, projections), but use `aggregate` to
+        combine aggregates across batches.
+
+        `timeout` covers all of the batches together, while
+        `max_vm_steps` applies to each batch on its own.
+        """
+        if timeout is None:
+            timeout = self.timeout
+        deadline = None
+        if timeout is not None:
+            deadline = monotonic() + timeout
+
+        rows = []
+        for aliases in self._attached_batches():
+            union = " UNION ALL ".join(
+                f"SELECT * FROM {alias}.{self._name}"
+                for alias in aliases
+            )
+            self._db.execute(
+                f"CREATE TEMP VIEW {self._name} AS {union}"
+            )
+            remaining = None
+            if deadline is not None:
+                remaining = max(deadline - monotonic(), 0)
+            try:
+                with self._interruptible(
+                    remaining, max_vm_steps, cancel
+                ):
+                    rows += self._db.execute(
+                        querystring, variables
+                    )
+            finally:
+                self._db.execute(
+                    f"DROP VIEW temp.{self._name}"
+                )
+
+        return Results(rows)
+
+    def aggregate(
+        self,
+        aggregates: Dict[str, str],
+        group_by: Optional[List[str]] = None,
+        where: Optional[str] = None,
+        variables: Optional[tuple] = None,
+    ) -> Results:
+        """
+        Compute count/sum/min/max/avg across every file.
+
+        Each aggregate is pushed down to the individual
+        files and the partial results are combined, so only
+        one row per group per file ever leaves SQLite. With
+        `workers` set, batches of files are processed in a
+        process pool:
+
+        >>> tbl.aggregate(
+                {"n": "count(*)", "mean_age": "avg(age)"},
+                group_by=["name"],
+                where="age > ?",
+                variables=(30,),
+            )
+        """
+        aggs = parse_aggregates(aggregates)
+        group_by = [col.lower() for col in group_by or []]
+        stmt = partial_statement(
+            self._name, aggs, group_by, where
+        )
+
+        if self.workers:
+            from concurrent.futures import (
+                ProcessPoolExecutor,
+            )
+
+            batches = list(self._batches())
+            task = partial(
+                _partial_aggregate,
+                table=self._name,
+                stmt=stmt,
+                variables=variables,
+            )
+            with ProcessPoolExecutor(self.workers) as pool:
+                parts = [
+                    row
+                    for rows in pool.map(task, batches)
+                    for row in rows
+                ]
+        else:
+            parts = []
+            for aliases in self._attached_batches():
+                parts += partials(
+                    self._db, aliases, stmt, variables
+                )
+
+        rows = combine(aggs, len(group_by), parts)
+        nt = nt_builder(
+            tuple(group_by + [a.alias for a in aggs])
+        )
+        return Results([nt(*row) for row in rows])
+
+    def _connect(
+        self,
+        dbname: str,
+        table: str,
+        schema: dict,
+    ) -> Database:
+        db = Database(dbname)
+        db.create_table(name=table, schema=schema)
+        return db
+
+    def _batches(self) -> Iterator[List[str]]:
+        size = self._db.attach_limit()
+        for start in range(0, len(self.paths), size):
+            end = start + size
+            yield self.paths[start:end]
+
+    def _attached_batches(self) -> Iterator[List[str]]:
+        for paths in self._batches():
+            aliases = attach_batch(
+                self._db, paths, self._name
+            )
+            try:
+                yield aliases
+            finally:
+                for alias in aliases:
+                    self._db.detach(alias)
+
+
+# ---------------------------------------------------------
+def attach_batch(
+    db: Database, paths: List[str], table: str
+) -> List[str]:
+    aliases = []
+    for idx, path in enumerate(paths):
+        alias = f"f_{idx}"
+        db.attach(path, alias)
+        aliases.append(alias)
+
+        meta = db.execute(
+            f"SELECT tablename FROM {alias}.{META_TABLE}"
+        )
+        if not meta or meta[0].tablename != table:
+            for attached in aliases:
+                db.detach(attached)
+            msg = f"Table '{table}' does not exist in '{path}'"
+            raise TableError(msg)
+
+    return aliases
+
+
+def partial_statement(
+    table: str,
+    aggregates: List[Aggregate],
+    group_by: List[str],
+    where: Optional[str],
+) -> str:
+    terms = [
+        t for agg in aggregates for t in partial_terms(agg)
+    ]
+    # aliased so the rows can be built into namedtuples
+    terms = [
+        f"{t} AS p{idx}" for idx, t in enumerate(terms)
+    ]
+    cols = ", ".join(group_by + terms)
+
+    stmt = f"SELECT {cols} FROM {{alias}}.{table}"
+    if where:
+        stmt += f" WHERE {where}"
+    if group_by:
+        stmt += f" GROUP BY {', '.join(group_by)}"
+    return stmt
+
+
+def partials(
+    db: Database,
+    aliases: List[str],
+    stmt: str,
+    variables: Optional[tuple],
+) -> List[tuple]:
+    output = []
+    for alias in aliases:
+        rows = db.execute(
+            stmt.replace("{alias}", alias), variables
+        )
+        output += [tuple(row) for row in rows]
+    return output
+
+
+def _partial_aggregate(
+    paths: List[str],
+    table: str,
+    stmt: str,
+    variables: Optional[tuple],
+) -> List[tuple]:
+    # runs in a worker process, so it opens its own database
+    db = Database()
+    aliases = attach_batch(db, paths, table)
+    return partials(db, aliases, stmt, variables)
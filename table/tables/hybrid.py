@@ -0,0 +1,146 @@
+from table.checksums import Diff
+from table.dedupe import Inserted
+from table.errors import TableError
+from table.tables.base import Dataclass
+from table.tables.in_memory import InMemoryTable
+from table.tables.persistent import MMAP_SIZE
+
+import logging
+from os import close, remove
+from os.path import exists
+from tempfile import mkstemp
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Union,
+)
+from weakref import finalize
+
+
+__all__ = ["HybridTable"]
+
+
+LOGGER = logging.getLogger(__name__)
+
+# the page cache after spilling, as a share of `spill_at`
+CACHE_SHARE = 0.25
+MIN_CACHE_KIB = 2048
+
+
+class HybridTable(InMemoryTable):
+    """
+    An in-memory table that moves itself to a temporary file
+    once the database grows past `spill_at` bytes.
+
+    The move happens between statements, using SQLite's
+    backup API, so no rows are lost and the table works the
+    same afterwards. The file is deleted when the table is
+    closed or garbage collected.
+    """
+
+    def __init__(
+        self,
+        dclass: Dataclass,
+        spill_at: int,
+    ) -> None:
+        if spill_at <= 0:
+            msg = f"`spill_at` must be a positive number of bytes, received {spill_at}"
+            raise TableError(msg)
+
+        self.spill_at = spill_at
+        self.spilled_to: Optional[str] = None
+        self._cleanup: Optional[finalize] = None
+
+        super().__init__(
+            dclass=dclass, location=":memory:"
+        )
+
+    def insert(
+        self,
+        data: Union[Dataclass, List[Dataclass]],
+        dedupe: bool = False,
+    ) -> Union[bool, Inserted]:
+        inserted = super().insert(data, dedupe)
+        self._check_size()
+        return inserted
+
+    def parallel_load(
+        self,
+        source: Iterable,
+        workers: Optional[int] = None,
+        loader: Optional[
+            Callable[[str], Iterable[Dataclass]]
+        ] = None,
+    ) -> int:
+        loaded = super().parallel_load(
+            source, workers, loader
+        )
+        self._check_size()
+        return loaded
+
+    def _apply_diff(
+        self, diff: Diff, rows: Dict[int, tuple], key: str
+    ) -> None:
+        super()._apply_diff(diff, rows, key)
+        self._check_size()
+
+    def query(
+        self,
+        querystring: str,
+        variables: Optional[tuple] = None,
+        **kwargs,
+    ) -> List[Optional[Dataclass]]:
+        # queries can write too
+        results = super().query(
+            querystring, variables, **kwargs
+        )
+        self._check_size()
+        return results
+
+    def close(self) -> bool:
+        super().close()
+        if self._cleanup is not None:
+            self._cleanup()
+            self._cleanup = None
+            self.spilled_to = None
+        return True
+
+    def _check_size(self) -> None:
+        if self.spilled_to is not None:
+            return
+        if self._db.size() >= self.spill_at:
+            self._spill()
+
+    def _spill(self) -> None:
+        fd, path = mkstemp(
+            prefix=f"{self._name}_", suffix=".db"
+        )
+        close(fd)
+        self._cleanup = finalize(
+            self, remove_database, path
+        )
+
+        self._db.move(path, MMAP_SIZE)
+        # a scratch copy: durability is pointless, and the
+        # page cache stays well within the memory budget
+        cache_kib = max(
+            int(self.spill_at * CACHE_SHARE) // 1024,
+            MIN_CACHE_KIB,
+        )
+        self._db.set_pragma("synchronous", "OFF")
+        self._db.set_pragma("cache_size", -cache_kib)
+
+        self.spilled_to = path
+        LOGGER.info(
+            f"Table '{self._name}' spilled to disk [{path}]"
+        )
+
+
+# ---------------------------------------------------------
+def remove_database(path: str) -> None:
+    for suffix in ("", "-journal", "-wal", "-shm"):
+        if exists(path + suffix):
+            remove(path + suffix)
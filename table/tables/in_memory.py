@@ -11,13 +11,13 @@ META_SCHEMA = {"tablename": str}
 
 
 class InMemoryTable(Table):
-    @staticmethod
     def _connect(
+        self,
         dbname: str,
         table: str,
         schema: dict,
     ) -> Database:
-        db = Database(dbname)
+        db = self._database_class(dbname)
         db.create_table(name=table, schema=schema)
         return db
 
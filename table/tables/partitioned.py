@@ -0,0 +1,515 @@
+from table.changes import Change
+from table.db import TYPES, Database, ddl_from_schema
+from table.dedupe import Inserted
+from table.errors import TableError
+from table.pagination import Page
+from table.results import Results
+from table.sampling import MAX_PROBES, Estimate
+from table.tables.base import Dataclass, format_insert
+from table.tables.persistent import (
+    META_SCHEMA,
+    META_TABLE,
+    PersistentTable,
+)
+
+import logging
+import re
+from collections import OrderedDict, defaultdict
+from datetime import date, datetime
+from os import listdir, makedirs, remove
+from os.path import exists, join
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Union,
+)
+
+
+__all__ = ["PartitionedTable"]
+
+
+LOGGER = logging.getLogger(__name__)
+CATALOG = "_catalog.db"
+PERIODS = {
+    "day": "%Y%m%d",
+    "month": "%Y%m",
+    "year": "%Y",
+}
+
+
+class PartitionedTable(PersistentTable):
+    """
+    A persistent table split into one database file per
+    period of a date/datetime column.
+
+    `location` is a directory holding a small catalog file
+    (which carries the schema and any indexes) alongside
+    the partition files. Every partition is itself a valid
+    persistent table, so it can be opened on its own with
+    `table(dclass, path)`.
+    """
+
+    def __init__(
+        self,
+        dclass: Dataclass,
+        location: str,
+        partition_by: str,
+        period: str = "month",
+    ) -> None:
+        if period not in PERIODS:
+            msg = f"`period` must be one of {list(PERIODS)}, received '{period}'"
+            raise TableError(msg)
+
+        self.partition_by = partition_by.lower()
+        self.period = period
+        self._attached: Dict[str, str] = OrderedDict()
+
+        super().__init__(dclass=dclass, location=location)
+
+        typ = self._schema.get(self.partition_by)
+        if typ not in (date, datetime):
+            msg = f"`partition_by` must name a date or datetime field, received '{partition_by}'"
+            raise TableError(msg)
+
+        # each partition would need its own dictionaries
+        self._check_not_encoded("partition_by")
+
+    @property
+    def partitions(self) -> List[str]:
+        """
+        List the period keys of every partition on disk
+        """
+        if not exists(self.location):
+            return []
+
+        pattern = re.compile(
+            rf"^{re.escape(self._name)}_(\d+)\.db$"
+        )
+        width = len(
+            date(2000, 1, 1).strftime(PERIODS[self.period])
+        )
+
+        keys = []
+        for fname in listdir(self.location):
+            match = pattern.match(fname)
+            if match and len(match.group(1)) == width:
+                keys.append(match.group(1))
+        return sorted(keys)
+
+    def insert(
+        self,
+        data: Union[Dataclass, List[Dataclass]],
+        dedupe: bool = False,
+    ) -> Union[bool, Inserted]:
+        """
+        Insert one or more records, routing each one to the
+        partition covering its `partition_by` value.
+
+        A record always lands in the same partition, so
+        `dedupe` only has to look within it.
+        """
+        if not isinstance(data, list):
+            data = [data]
+
+        position = list(self._schema).index(
+            self.partition_by
+        )
+
+        batches = defaultdict(list)
+        for record in data:
+            row = format_insert(self.dclass, record)
+            value = row[position]
+            if value is None:
+                msg = f"Field '{self.partition_by}' cannot be None"
+                raise TableError(msg)
+            batches[self._key(value)].append(row)
+
+        inserted = 0
+        for key, rows in batches.items():
+            alias = self._attach(key)
+            if dedupe:
+                self._hash_rows(alias)
+                inserted += self._db.insert_distinct(
+                    self._name, self._schema, rows, alias
+                )
+                continue
+            self._db.insert(
+                table=f"{alias}.{self._name}",
+                schema=self._schema,
+                data=rows,
+            )
+
+        if dedupe:
+            return Inserted(inserted, len(data) - inserted)
+        return True
+
+    def prepare(self, querystring: str):
+        # each query attaches the partitions it needs
+        msg = "`prepare` is not supported on partitioned tables, use `query`"
+        raise TableError(msg)
+
+    def publish(self, name: str) -> str:
+        msg = "`publish` is not supported on partitioned tables"
+        raise TableError(msg)
+
+    def index_range(self, columns) -> bool:
+        msg = "`index_range` is not supported on partitioned tables"
+        raise TableError(msg)
+
+    def compact(self, *args, **kwargs) -> dict:
+        msg = "`compact` is not supported on partitioned tables"
+        raise TableError(msg)
+
+    def sample(
+        self,
+        n: Optional[int] = None,
+        fraction: Optional[float] = None,
+        seed: Optional[int] = None,
+    ) -> List[Dataclass]:
+        # rowids are probed on a single table
+        msg = "`sample` is not supported on partitioned tables"
+        raise TableError(msg)
+
+    def approx(
+        self,
+        querystring: str,
+        variables: Optional[tuple] = None,
+        error: float = 0.05,
+        confidence: float = 0.95,
+        seed: Optional[int] = None,
+        max_probes: int = MAX_PROBES,
+    ) -> List[Estimate]:
+        msg = "`approx` is not supported on partitioned tables"
+        raise TableError(msg)
+
+    def paginate(
+        self,
+        order_by: Optional[List[str]] = None,
+        page_size: int = 100,
+        after: Optional[str] = None,
+        where: Optional[str] = None,
+        variables: Optional[tuple] = None,
+        descending: bool = False,
+    ) -> Page:
+        msg = "`paginate` is not supported on partitioned tables"
+        raise TableError(msg)
+
+    def track_changes(
+        self, updates: bool = True, deletes: bool = True
+    ) -> bool:
+        msg = "`track_changes` is not supported on partitioned tables"
+        raise TableError(msg)
+
+    def changes(
+        self,
+        since: Optional[int] = None,
+        batch_size: int = 1000,
+    ) -> Iterator[Change]:
+        # tokens are rowids of a single table
+        msg = "`changes` is not supported on partitioned tables"
+        raise TableError(msg)
+
+    def follow(
+        self,
+        since: Optional[int] = None,
+        poll_interval: float = 0.5,
+        timeout: Optional[float] = None,
+    ) -> Iterator[Change]:
+        msg = "`follow` is not supported on partitioned tables"
+        raise TableError(msg)
+
+    def materialize(self, name: str, sql: str) -> bool:
+        # its triggers would sit on a table no rows reach
+        msg = "`materialize` is not supported on partitioned tables"
+        raise TableError(msg)
+
+    def refresh(self, name: str) -> bool:
+        msg = "`refresh` is not supported on partitioned tables"
+        raise TableError(msg)
+
+    def index_text(
+        self,
+        column: str,
+        *columns: str,
+        tokenize: Optional[str] = None,
+    ) -> bool:
+        msg = "`index_text` is not supported on partitioned tables"
+        raise TableError(msg)
+
+    def search(
+        self,
+        term: str,
+        limit: Optional[int] = 10,
+    ) -> List[Dataclass]:
+        msg = "`search` is not supported on partitioned tables"
+        raise TableError(msg)
+
+    def _key_range(self, key: str) -> tuple:
+        # first step of `checksum`, `diff` and `sync_to`
+        msg = "Checksums are not supported on partitioned tables"
+        raise TableError(msg)
+
+    def parallel_load(
+        self,
+        source: Iterable,
+        workers: Optional[int] = None,
+        loader: Optional[
+            Callable[[str], Iterable[Dataclass]]
+        ] = None,
+    ) -> int:
+        # rows are routed to partitions one by one, so there
+        # is no single table to merge shards into
+        msg = "`parallel_load` is not supported on partitioned tables, use `insert`"
+        raise TableError(msg)
+
+    def query(
+        self,
+        querystring: str,
+        variables: Optional[tuple] = None,
+        since: Optional[date] = None,
+        until: Optional[date] = None,
+        **kwargs,
+    ) -> Results:
+        """
+        Execute a table query.
+
+        Only the partitions overlapping `since` and `until`
+        (both inclusive, either may be omitted) are attached
+        and visible to the query, so a time-bounded query
+        never touches files outside of its range:
+
+        >>> tbl.query(
+                "SELECT count(*) AS n FROM foo WHERE ts >= ?",
+                (start,),
+                since=start,
+            )
+
+        When the range covers more partitions than can be
+        attached at once, their rows are copied to a TEMP
+        table, a batch of partitions at a time, and the query
+        runs once over that copy. Narrow the range with
+        `since`/`until` to avoid the copy.
+
+        `timeout`, `max_vm_steps` and `cancel` work as they
+        do for `Table.query`.
+        """
+        keys = self._prune(since, until)
+        if not keys:
+            return super().query(
+                querystring, variables, **kwargs
+            )
+
+        limit = self._db.attach_limit()
+        if len(keys) <= limit:
+            return self._query_partitions(
+                keys, querystring, variables, **kwargs
+            )
+
+        # like the view, the copy shadows the catalog's table
+        self._db.execute(
+            ddl_from_schema(
+                f"temp.{self._name}", self._schema, TYPES
+            )
+        )
+        try:
+            for start in range(0, len(keys), limit):
+                end = start + limit
+                self._db.execute_statements(
+                    [
+                        f"INSERT INTO temp.{self._name} SELECT * FROM {self._attach(key)}.{self._name}"
+                        for key in keys[start:end]
+                    ]
+                )
+            return super().query(
+                querystring, variables, **kwargs
+            )
+        finally:
+            self._db.execute(
+                f"DROP TABLE temp.{self._name}"
+            )
+
+    def stats(self) -> dict:
+        """
+        Row count, planner statistics and indexes of the
+        table. The rows are counted across every partition,
+        the rest comes from the catalog
+        """
+        stats = super().stats()
+        stats["rows"] = sum(
+            self._db.execute(
+                f"SELECT count(*) AS n FROM {self._attach(key)}.{self._name}"
+            )[0].n
+            for key in self.partitions
+        )
+        return stats
+
+    def index_column(self, column: str) -> bool:
+        """
+        Create an "index" on a column of every partition.
+
+        Partitions created later on inherit the index too.
+        """
+        super().index_column(column)
+        for key in self.partitions:
+            self._apply_indexes(self._attach(key))
+        return True
+
+    def index_expression(self, expression: str) -> bool:
+        """
+        Create an "index" on an expression, on every
+        partition; see `index_column`
+        """
+        super().index_expression(expression)
+        for key in self.partitions:
+            self._apply_indexes(self._attach(key))
+        return True
+
+    def close(self) -> bool:
+        # closing the connection detaches every partition
+        self._attached.clear()
+        return super().close()
+
+    def drop_partitions(self, older_than: date) -> int:
+        """
+        Delete every partition whose period ends before
+        `older_than`.
+
+        This simply removes the partition files, so it is
+        effectively free no matter how many rows they hold.
+        Returns the number of partitions dropped.
+        """
+        cutoff = self._key(older_than)
+        dropped = [
+            k for k in self.partitions if k < cutoff
+        ]
+
+        for key in dropped:
+            alias = self._attached.pop(key, None)
+            if alias:
+                self._db.detach(alias)
+
+            path = self._path(key)
+            for suffix in ("", "-journal", "-wal", "-shm"):
+                if exists(path + suffix):
+                    remove(path + suffix)
+            LOGGER.debug(f"Partition dropped [{path}]")
+
+        return len(dropped)
+
+    def _query_partitions(
+        self,
+        keys: List[str],
+        querystring: str,
+        variables: Optional[tuple],
+        **kwargs,
+    ) -> Results:
+        # no more keys than can be attached at once, so
+        # attaching one never detaches another of them
+        aliases = [self._attach(key) for key in keys]
+        union = " UNION ALL ".join(
+            f"SELECT * FROM {alias}.{self._name}"
+            for alias in aliases
+        )
+        self._db.execute(
+            f"CREATE TEMP VIEW {self._name} AS {union}"
+        )
+        try:
+            return super().query(
+                querystring, variables, **kwargs
+            )
+        finally:
+            self._db.execute(
+                f"DROP VIEW temp.{self._name}"
+            )
+
+    def _connect(
+        self,
+        dbname: str,
+        table: str,
+        schema: dict,
+    ) -> Database:
+        makedirs(dbname, exist_ok=True)
+        catalog = join(dbname, CATALOG)
+        return super()._connect(catalog, table, schema)
+
+    def _key(self, value: date) -> str:
+        return value.strftime(PERIODS[self.period])
+
+    def _path(self, key: str) -> str:
+        return join(
+            self.location, f"{self._name}_{key}.db"
+        )
+
+    def _prune(
+        self,
+        since: Optional[date],
+        until: Optional[date],
+    ) -> List[str]:
+        low = self._key(since) if since else None
+        high = self._key(until) if until else None
+        return [
+            key
+            for key in self.partitions
+            if (not low or key >= low)
+            and (not high or key <= high)
+        ]
+
+    def _attach(self, key: str) -> str:
+        if key in self._attached:
+            self._attached.move_to_end(key)
+            return self._attached[key]
+
+        limit = self._db.attach_limit()
+        while len(self._attached) >= limit:
+            _, alias = self._attached.popitem(last=False)
+            # its statistics would go stale unseen otherwise
+            self._db.optimize(alias)
+            self._db.detach(alias)
+
+        path = self._path(key)
+        alias = f"p_{key}"
+        new = not exists(path)
+
+        self._db.attach(path, alias)
+        self._attached[key] = alias
+
+        if new:
+            self._create_partition(alias)
+
+        return alias
+
+    def _create_partition(self, alias: str) -> None:
+        # a partition dropped and created again starts
+        # without hashes
+        self._hashed.discard(alias)
+        meta = ddl_from_schema(
+            f"{alias}.{META_TABLE}", META_SCHEMA, TYPES
+        )
+        ddl = ddl_from_schema(
+            f"{alias}.{self._name}", self._schema, TYPES
+        )
+        self._db.execute(meta)
+        self._db.insert(
+            f"{alias}.{META_TABLE}",
+            META_SCHEMA,
+            (self._name,),
+        )
+        self._db.execute(ddl)
+        self._apply_indexes(alias)
+
+    def _apply_indexes(self, alias: str) -> None:
+        indexes = self._db.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL",
+            (self._name,),
+        )
+        for index in indexes:
+            ddl = index.sql.replace(
+                "CREATE INDEX ",
+                f"CREATE INDEX IF NOT EXISTS {alias}.",
+                1,
+            )
+            self._db.execute(ddl)
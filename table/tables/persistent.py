@@ -1,8 +1,21 @@
-from table.db import Database
+from table.db import Database, schemas_match
+from table.checksums import Diff
+from table.dedupe import Inserted
 from table.errors import TableError
-from table.tables.base import Table
+from table.tables.base import Dataclass, Table
 
+import atexit
 from os.path import exists, getsize
+from time import monotonic
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Union,
+)
+from weakref import ref
 
 
 __all__ = ["PersistentTable"]
@@ -14,28 +27,174 @@ META_SCHEMA = {"tablename": str}
 
 
 class PersistentTable(Table):
-    @staticmethod
+    def __init__(
+        self,
+        dclass: Dataclass,
+        location: str,
+        readonly: bool = False,
+        immutable: bool = False,
+        preload: bool = False,
+        write_back: Optional[float] = None,
+        checkpoint_on_exit: bool = False,
+        threadsafe: bool = False,
+    ) -> None:
+        if (readonly or immutable) and not exists(
+            location
+        ):
+            msg = f"Cannot open '{location}' read-only, it does not exist"
+            raise TableError(msg)
+
+        if (
+            write_back or checkpoint_on_exit
+        ) and not preload:
+            msg = "`write_back` and `checkpoint_on_exit` require `preload`"
+            raise TableError(msg)
+
+        self.readonly = readonly or immutable
+        self.immutable = immutable
+        self.preload = preload
+        self.write_back = write_back
+        super().__init__(
+            dclass=dclass,
+            location=location,
+            threadsafe=threadsafe,
+        )
+
+        # what was last written back, and when
+        self._synced: Optional[tuple] = None
+        self._synced_at = monotonic()
+        if checkpoint_on_exit:
+            atexit.register(sync_at_exit, ref(self))
+
+    def insert(
+        self,
+        data: Union[Dataclass, List[Dataclass]],
+        dedupe: bool = False,
+    ) -> Union[bool, Inserted]:
+        inserted = super().insert(data, dedupe)
+        self._write_back_if_due()
+        return inserted
+
+    def parallel_load(
+        self,
+        source: Iterable,
+        workers: Optional[int] = None,
+        loader: Optional[
+            Callable[[str], Iterable[Dataclass]]
+        ] = None,
+    ) -> int:
+        loaded = super().parallel_load(
+            source, workers, loader
+        )
+        self._write_back_if_due()
+        return loaded
+
+    def compact(self, *args, **kwargs) -> dict:
+        report = super().compact(*args, **kwargs)
+        self._write_back_if_due()
+        return report
+
+    def _apply_diff(
+        self, diff: Diff, rows: Dict[int, tuple], key: str
+    ) -> None:
+        super()._apply_diff(diff, rows, key)
+        self._write_back_if_due()
+
+    def query(
+        self,
+        querystring: str,
+        variables: Optional[tuple] = None,
+        **kwargs,
+    ) -> List[Optional[Dataclass]]:
+        results = super().query(
+            querystring, variables, **kwargs
+        )
+        self._write_back_if_due()
+        return results
+
+    def sync(self) -> bool:
+        """
+        Write a `preload`ed table back to its file, if it
+        changed since it was loaded (or last written back).
+        Returns whether anything was written
+        """
+        if not self.preload or self.readonly:
+            return False
+        if self._database is None:
+            return False
+
+        version = self._database.version()
+        if version == self._synced:
+            return False
+
+        self._database.backup(self.location)
+        self._synced = version
+        self._synced_at = monotonic()
+        return True
+
+    def close(self) -> bool:
+        self.sync()
+        return super().close()
+
+    def _write_back_if_due(self) -> None:
+        if self.write_back is None:
+            return
+        if (
+            monotonic() - self._synced_at
+            >= self.write_back
+        ):
+            self.sync()
+
     def _connect(
+        self,
         dbname: str,
         table: str,
         schema: dict,
     ) -> Database:
+        db = self._connect_file(dbname, table, schema)
+        if not self.preload:
+            return db
+
+        # queries are served from a copy in memory, see `sync`
+        db.close()
+        mem = self._database_class()
+        mem.restore(dbname)
+        if self.readonly:
+            mem.set_pragma("query_only", "ON")
+        self._synced = mem.version()
+        return mem
+
+    def _connect_file(
+        self,
+        dbname: str,
+        table: str,
+        schema: dict,
+    ) -> Database:
+        # a preloaded file is only opened to be copied, so
+        # there is no need to share it (and switch it to WAL)
+        database_class = (
+            Database
+            if self.preload
+            else self._database_class
+        )
+        if self.readonly:
+            # nothing is created, see `_validate` for checks
+            return database_class(
+                dbname,
+                mmap_size(dbname),
+                readonly=True,
+                immutable=self.immutable,
+            )
+
         if not exists(dbname):
-            mmap_size = MMAP_SIZE
-            db = Database(dbname, mmap_size)
+            db = database_class(dbname, MMAP_SIZE)
             db.create_table(META_TABLE, META_SCHEMA)
             db.insert(META_TABLE, META_SCHEMA, (table,))
             db.create_table(name=table, schema=schema)
             return db
 
         else:
-            dbsize = getsize(dbname)
-            mmap_size = max(
-                MMAP_SIZE,
-                round((dbsize / 1024) * 1.5) * 1024,
-            )
-
-            db = Database(dbname, mmap_size)
+            db = database_class(dbname, mmap_size(dbname))
 
             if not db.table_exists(META_TABLE):
                 db.create_table(META_TABLE, META_SCHEMA)
@@ -52,3 +211,39 @@ class PersistentTable(Table):
                     raise TableError(msg)
 
             return db
+
+    def _validate(self, db: Database) -> None:
+        if not self.readonly:
+            return
+
+        if not db.table_exists(META_TABLE):
+            msg = f"Table '{self._name}' does not exist"
+            raise TableError(msg)
+
+        tablename = db.execute(
+            "select tablename from _metadata"
+        )[0].tablename
+        if tablename != self._name:
+            msg = f"Table '{self._name}' does not exist"
+            raise TableError(msg)
+
+        if not schemas_match(
+            self._schema, db.schema(self._name)
+        ):
+            msg = f"Table '{self._name}' exists, but schemas do not match"
+            raise TableError(msg)
+
+
+# ---------------------------------------------------------
+def sync_at_exit(table: "ref[PersistentTable]") -> None:
+    # a weak reference, so tables can still be collected
+    if (tbl := table()) is not None:
+        tbl.sync()
+
+
+def mmap_size(dbname: str) -> int:
+    dbsize = getsize(dbname)
+    return max(
+        MMAP_SIZE,
+        round((dbsize / 1024) * 1.5) * 1024,
+    )
@@ -0,0 +1,127 @@
+from table.db import Database
+from table.errors import TableError
+from table.tables.base import Dataclass
+from table.tables.persistent import (
+    META_SCHEMA,
+    META_TABLE,
+    PersistentTable,
+)
+
+import logging
+from os import close, remove, replace, stat
+from os.path import isdir, join
+from tempfile import gettempdir, mkstemp
+import re
+from typing import Optional
+
+
+__all__ = ["SharedMemoryTable", "publish"]
+
+
+LOGGER = logging.getLogger(__name__)
+
+# tmpfs on Linux, so a published table lives in RAM
+SHM_DIR = "/dev/shm"
+
+
+class SharedMemoryTable(PersistentTable):
+    """
+    A read-only table `publish`ed to shared memory by
+    another process.
+
+    The file is opened `immutable` and memory mapped, so
+    every process reading it shares the same physical pages
+    rather than holding a copy each. Publishing again
+    replaces the file atomically: readers notice the new
+    inode on their next use and reopen, while a query
+    already running finishes on the old version.
+    """
+
+    def __init__(
+        self,
+        dclass: Dataclass,
+        name: str,
+        threadsafe: bool = False,
+    ) -> None:
+        self.published = name
+        self._inode: Optional[int] = None
+        super().__init__(
+            dclass=dclass,
+            location=shm_path(name),
+            immutable=True,
+            threadsafe=threadsafe,
+        )
+
+    @property
+    def _db(self) -> Database:
+        if self._database is not None:
+            if self._current_inode() != self._inode:
+                LOGGER.info(
+                    f"Table '{self.published}' was republished, reopening"
+                )
+                # not closed, as other threads may still be
+                # reading it: it closes once unreferenced
+                self._database = None
+        return super()._db
+
+    def _connect(
+        self,
+        dbname: str,
+        table: str,
+        schema: dict,
+    ) -> Database:
+        # before opening, so a swap in between is noticed
+        # (and opened again) on next use, never missed
+        self._inode = self._current_inode()
+        return super()._connect(dbname, table, schema)
+
+    def _current_inode(self) -> Optional[int]:
+        try:
+            return stat(self.location).st_ino
+        except FileNotFoundError:
+            # unpublished: carry on with what is open
+            return self._inode
+
+
+# ---------------------------------------------------------
+def shm_dir() -> str:
+    return SHM_DIR if isdir(SHM_DIR) else gettempdir()
+
+
+def shm_path(name: str) -> str:
+    if not re.fullmatch(r"[\w-]+", name):
+        msg = f"Invalid shared memory name '{name}', use letters, digits, '_' and '-'"
+        raise TableError(msg)
+    return join(shm_dir(), f"table_{name}.db")
+
+
+def publish(db: Database, table: str, name: str) -> str:
+    """
+    Copy `db` to shared memory as `name`, replacing any
+    earlier version in one atomic rename
+    """
+    path = shm_path(name)
+    fd, tmp = mkstemp(
+        dir=shm_dir(),
+        prefix=f".table_{name}_",
+        suffix=".db",
+    )
+    close(fd)
+    try:
+        db.backup(tmp)
+
+        copy = Database(tmp)
+        # readers open it immutable, which rules out WAL
+        copy.set_pragma("journal_mode", "DELETE")
+        if not copy.table_exists(META_TABLE):
+            copy.create_table(META_TABLE, META_SCHEMA)
+            copy.insert(META_TABLE, META_SCHEMA, (table,))
+        copy.close()
+
+        replace(tmp, path)
+    except BaseException:
+        remove(tmp)
+        raise
+
+    LOGGER.info(f"Table '{table}' published [{path}]")
+    return path
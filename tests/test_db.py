@@ -133,3 +133,12 @@ class TestDatabase(unittest.TestCase):
             "select name from sqlite_master where type = 'index'"
         )
         self.assertEqual(expected, actual[0].name)
+
+    def test_functions_survive_reconnect(self):
+        db = Database()
+        db.register_function("double", lambda x: x * 2, 1)
+        db._connect()
+
+        expected = [(4,)]
+        actual = db.execute("select double(2) as d")
+        self.assertEqual(actual, expected)
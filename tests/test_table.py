@@ -1,11 +1,28 @@
-from table.table import table as table_
+from table.table import (
+    federate,
+    memory_limits,
+    statement_cache,
+    table as table_,
+)
+from table.db import (
+    Cancellation,
+    DatabaseError,
+    QueryInterruptedError,
+)
+from table.checksums import combine
 from table.errors import TableError
 
+import sys
 import unittest
-from dataclasses import dataclass
-from datetime import date, datetime
-from os import remove
-from os.path import exists
+from dataclasses import astuple, dataclass, field
+from datetime import date, datetime, timedelta
+from os import makedirs, remove
+from os.path import exists, join
+from shutil import rmtree
+from subprocess import check_output
+from concurrent.futures import ThreadPoolExecutor
+from threading import Thread, Timer
+from time import monotonic
 
 
 class TestTable(unittest.TestCase):
@@ -14,6 +31,11 @@ class TestTable(unittest.TestCase):
         with self.assertRaises(TableError):
             table_(dclass, ":memory:")
 
+    def test_import_does_not_load_sqlite(self):
+        code = "import sys, table; print('sqlite3' in sys.modules)"
+        output = check_output([sys.executable, "-c", code])
+        self.assertEqual(output.strip(), b"False")
+
 
 class TestInMemoryTable(unittest.TestCase):
     def test_simple(self):
@@ -183,6 +205,7 @@ class TestPersistentTable(unittest.TestCase):
             age: int
 
         table = table_(Foo, self.TEST_DB)
+        table.insert(Foo("Joe", 30))
         del table
 
         @dataclass
@@ -190,8 +213,25 @@ class TestPersistentTable(unittest.TestCase):
             height: int
             weight: int
 
+        # tables connect lazily, so this surfaces on first use
+        table = table_(Bar, self.TEST_DB)
         with self.assertRaises(TableError):
-            table_(Bar, self.TEST_DB)
+            table.query("select * from bar")
+
+    def test_connects_on_first_use(self):
+        @dataclass
+        class Foo:
+            name: str
+            age: int
+
+        table = table_(Foo, self.TEST_DB)
+
+        with self.subTest():
+            self.assertFalse(exists(self.TEST_DB))
+
+        table.insert(Foo("Joe", 30))
+        with self.subTest():
+            self.assertTrue(exists(self.TEST_DB))
 
     def test_save_in_mem_to_persistent(self):
         @dataclass
@@ -214,3 +254,2683 @@ class TestPersistentTable(unittest.TestCase):
             self.assertEqual(actual.rows, expected)
         with self.subTest():
             self.assertTrue(exists(self.TEST_DB))
+
+    def test_close_and_reopen(self):
+        @dataclass
+        class Foo:
+            name: str
+            age: int
+
+        with table_(Foo, self.TEST_DB) as table:
+            table.insert(Foo("Joe", 30))
+
+        self.assertIsNone(table._database)
+        actual = table.query("select * from foo")
+        self.assertEqual(actual.rows, [("Joe", 30)])
+
+
+class TestPartitionedTable(unittest.TestCase):
+    TEST_DIR = ".test_partitioned_table"
+
+    def setUp(self) -> None:
+        rmtree(self.TEST_DIR, ignore_errors=True)
+
+    def tearDown(self) -> None:
+        self.setUp()
+
+    def test_routes_inserts_to_partitions(self):
+        @dataclass
+        class Foo:
+            name: str
+            day: date
+
+        table = table_(
+            Foo, self.TEST_DIR, partition_by="day"
+        )
+        table.insert(
+            [
+                Foo("Joe", date(2021, 1, 5)),
+                Foo("Bill", date(2021, 2, 5)),
+                Foo("Jane", date(2021, 2, 6)),
+            ]
+        )
+
+        with self.subTest():
+            self.assertEqual(
+                table.partitions, ["202101", "202102"]
+            )
+        with self.subTest():
+            # every partition is a regular persistent table
+            part = table_(
+                Foo, join(self.TEST_DIR, "foo_202101.db")
+            )
+            actual = part.query("select name from foo")
+            self.assertEqual(actual.rows, [("Joe",)])
+
+    def test_query_prunes_partitions(self):
+        @dataclass
+        class Foo:
+            name: str
+            day: date
+
+        table = table_(
+            Foo, self.TEST_DIR, partition_by="day"
+        )
+        table.insert(
+            [
+                Foo("Joe", date(2021, 1, 5)),
+                Foo("Bill", date(2021, 2, 5)),
+            ]
+        )
+
+        expected = [("Bill",)]
+        actual = table.query(
+            "select name from foo", since=date(2021, 2, 1)
+        )
+        with self.subTest():
+            self.assertEqual(actual.rows, expected)
+
+        expected = [("Joe",), ("Bill",)]
+        actual = table.query("select name from foo")
+        with self.subTest():
+            self.assertEqual(actual.rows, expected)
+
+    def test_drop_partitions(self):
+        @dataclass
+        class Foo:
+            name: str
+            day: date
+
+        table = table_(
+            Foo, self.TEST_DIR, partition_by="day"
+        )
+        table.insert(
+            [
+                Foo("Joe", date(2021, 1, 5)),
+                Foo("Bill", date(2021, 2, 5)),
+            ]
+        )
+        table.query("select * from foo")
+
+        dropped = table.drop_partitions(date(2021, 2, 1))
+
+        with self.subTest():
+            self.assertEqual(dropped, 1)
+        with self.subTest():
+            self.assertEqual(table.partitions, ["202102"])
+        with self.subTest():
+            actual = table.query("select name from foo")
+            self.assertEqual(actual.rows, [("Bill",)])
+
+    def test_query_more_partitions_than_attach_limit(self):
+        @dataclass
+        class Foo:
+            name: str
+            day: date
+
+        table = table_(
+            Foo,
+            self.TEST_DIR,
+            partition_by="day",
+            period="day",
+        )
+        limit = table._db.attach_limit()
+        start = date(2021, 1, 1)
+        days = [
+            start + timedelta(days=i)
+            for i in range(limit + 5)
+        ]
+        table.insert(
+            [Foo(f"n{i}", d) for i, d in enumerate(days)]
+        )
+
+        last = f"n{limit + 4}"
+        actual = table.query(
+            "select name from foo where name in (?, ?)",
+            ("n0", last),
+        )
+        self.assertEqual(actual.rows, [("n0",), (last,)])
+        actual = table.query("select * from foo")
+        self.assertEqual(len(actual.rows), limit + 5)
+
+        # one answer across every partition, not per batch
+        actual = table.query(
+            "select count(*) as n, count(distinct day) as days from foo"
+        )
+        self.assertEqual(
+            actual.rows, [(limit + 5, limit + 5)]
+        )
+
+        # counted across the partitions, not the catalog
+        self.assertEqual(table.stats()["rows"], limit + 5)
+
+    def test_new_partitions_inherit_indexes(self):
+        @dataclass
+        class Foo:
+            name: str
+            day: date
+
+        table = table_(
+            Foo, self.TEST_DIR, partition_by="day"
+        )
+        table.index_column("name")
+        table.insert(Foo("Joe", date(2021, 1, 5)))
+
+        table.index_expression("lower(name)")
+        table.insert(Foo("Bill", date(2021, 2, 5)))
+
+        for key in ["202101", "202102"]:
+            part = table_(
+                Foo, join(self.TEST_DIR, f"foo_{key}.db")
+            )
+            actual = part.query(
+                "select count(*) as n from sqlite_master where type = 'index'"
+            )
+            with self.subTest(key=key):
+                self.assertEqual(actual.rows[0].n, 2)
+            part.close()
+
+    def test_unsupported(self):
+        @dataclass
+        class Foo:
+            name: str
+            day: date
+
+        table = table_(
+            Foo, self.TEST_DIR, partition_by="day"
+        )
+        table.insert(Foo("Joe", date(2021, 1, 5)))
+
+        calls = [
+            lambda: table.sample(5),
+            lambda: table.approx(
+                "select count(*) from foo"
+            ),
+            lambda: table.paginate(["name"]),
+            lambda: table.changes(),
+            lambda: table.follow(timeout=0),
+            lambda: table.track_changes(),
+            lambda: table.materialize(
+                "n", "select count(*) as n from foo"
+            ),
+            lambda: table.index_text("name"),
+            lambda: table.search("joe"),
+        ]
+        for call in calls:
+            with self.subTest():
+                with self.assertRaises(TableError):
+                    call()
+
+    def test_partition_by_must_be_date(self):
+        @dataclass
+        class Foo:
+            name: str
+            day: date
+
+        with self.assertRaises(TableError):
+            table_(Foo, self.TEST_DIR, partition_by="name")
+
+
+class TestFederatedTable(unittest.TestCase):
+    TEST_DIR = ".test_federated_table"
+
+    def setUp(self) -> None:
+        rmtree(self.TEST_DIR, ignore_errors=True)
+        makedirs(self.TEST_DIR)
+
+    def tearDown(self) -> None:
+        rmtree(self.TEST_DIR, ignore_errors=True)
+
+    def make_files(self, dclass, count):
+        paths = []
+        for idx in range(count):
+            path = join(self.TEST_DIR, f"foo_{idx}.db")
+            table = table_(dclass, path)
+            table.insert(
+                [dclass("Joe", idx), dclass("Bill", 1)]
+            )
+            paths.append(path)
+        return paths
+
+    def test_query_spans_files(self):
+        @dataclass
+        class Foo:
+            name: str
+            age: int
+
+        paths = self.make_files(Foo, 2)
+        table = federate(Foo, paths)
+
+        expected = [("Joe", 0), ("Joe", 1)]
+        actual = table.query(
+            "select * from foo where name = 'Joe'"
+        )
+        self.assertEqual(actual.rows, expected)
+
+    def test_aggregate_more_files_than_attach_limit(self):
+        @dataclass
+        class Foo:
+            name: str
+            age: int
+
+        # 12 files is more than SQLite's default of 10
+        paths = self.make_files(Foo, 12)
+        table = federate(Foo, paths)
+
+        expected = [
+            ("Bill", 12, 12, 1, 1, 1.0),
+            ("Joe", 12, 66, 0, 11, 5.5),
+        ]
+        actual = table.aggregate(
+            {
+                "n": "count(*)",
+                "total": "sum(age)",
+                "youngest": "min(age)",
+                "oldest": "max(age)",
+                "mean": "avg(age)",
+            },
+            group_by=["name"],
+        )
+        self.assertEqual(actual.rows, expected)
+
+    def test_aggregate_in_process_pool(self):
+        @dataclass
+        class Foo:
+            name: str
+            age: int
+
+        paths = self.make_files(Foo, 3)
+        table = federate(Foo, paths, workers=2)
+
+        expected = [(3, 1.0)]
+        actual = table.aggregate(
+            {"n": "count(*)", "mean": "avg(age)"},
+            where="name = ?",
+            variables=("Joe",),
+        )
+        self.assertEqual(actual.rows, expected)
+
+    def test_unsupported(self):
+        @dataclass
+        class Foo:
+            name: str
+            age: int
+
+        table = federate(Foo, self.make_files(Foo, 2))
+
+        calls = [
+            lambda: table.sample(5),
+            lambda: table.approx(
+                "select count(*) from foo"
+            ),
+            lambda: table.paginate(["name"]),
+            lambda: table.changes(),
+            lambda: table.follow(timeout=0),
+            lambda: table.track_changes(),
+            lambda: table.materialize(
+                "n", "select count(*) as n from foo"
+            ),
+            lambda: table.index_text("name"),
+            lambda: table.search("joe"),
+            lambda: table.index_expression("lower(name)"),
+        ]
+        for call in calls:
+            with self.subTest():
+                with self.assertRaises(TableError):
+                    call()
+
+    def test_wrong_table(self):
+        @dataclass
+        class Foo:
+            name: str
+            age: int
+
+        @dataclass
+        class Bar:
+            name: str
+            age: int
+
+        paths = self.make_files(Foo, 1)
+        table = federate(Bar, paths)
+
+        with self.assertRaises(TableError):
+            table.query("select * from bar")
+
+
+class TestTextIndex(unittest.TestCase):
+    def test_search(self):
+        @dataclass
+        class Foo:
+            name: str
+            bio: str
+
+        table = table_(Foo)
+        table.insert(
+            Foo("Joe", "likes fishing and hiking")
+        )
+        table.index_text("bio")
+        table.insert(
+            [
+                Foo("Bill", "hiking hiking hiking"),
+                Foo("Jane", "likes painting"),
+            ]
+        )
+
+        expected = [
+            Foo("Bill", "hiking hiking hiking"),
+            Foo("Joe", "likes fishing and hiking"),
+        ]
+        actual = table.search("hiking")
+        self.assertEqual(actual, expected)
+
+    def test_index_kept_in_sync(self):
+        @dataclass
+        class Foo:
+            name: str
+            bio: str
+
+        table = table_(Foo)
+        table.index_text("bio")
+        table.insert(
+            [Foo("Joe", "fishing"), Foo("Bill", "hiking")]
+        )
+        table.query("delete from foo where name = 'Joe'")
+        table.query(
+            "update foo set bio = 'fishing' where name = 'Bill'"
+        )
+
+        with self.subTest():
+            actual = table.search("hiking")
+            self.assertEqual(actual, [])
+        with self.subTest():
+            actual = table.search("fishing")
+            self.assertEqual(
+                actual, [Foo("Bill", "fishing")]
+            )
+
+    def test_add_column_to_index(self):
+        @dataclass
+        class Foo:
+            name: str
+            bio: str
+
+        table = table_(Foo)
+        table.insert(Foo("Joe", "fishing"))
+        table.index_text("bio")
+        table.index_text("name")
+
+        actual = table.search("joe")
+        self.assertEqual(actual, [Foo("Joe", "fishing")])
+
+    def test_index_non_str_column(self):
+        @dataclass
+        class Foo:
+            name: str
+            age: int
+
+        table = table_(Foo)
+        with self.assertRaises(TableError):
+            table.index_text("age")
+
+    def test_search_without_index(self):
+        @dataclass
+        class Foo:
+            name: str
+
+        table = table_(Foo)
+        with self.assertRaises(TableError):
+            table.search("joe")
+
+
+class TestMaterialize(unittest.TestCase):
+    def test_incremental_aggregates(self):
+        @dataclass
+        class Foo:
+            name: str
+            age: int
+
+        table = table_(Foo)
+        table.insert([Foo("Joe", 30), Foo("Bill", 40)])
+        table.materialize(
+            "ages",
+            "select name, count(*) as n, sum(age) as total, "
+            "min(age) as youngest, avg(age) as mean "
+            "from foo group by name",
+        )
+        table.insert([Foo("Joe", 50), Foo("Jane", None)])
+
+        expected = [
+            ("Bill", 1, 40, 40, 40.0),
+            ("Jane", 1, None, None, None),
+            ("Joe", 2, 80, 30, 40.0),
+        ]
+        actual = table.query(
+            "select * from ages order by name"
+        )
+        self.assertEqual(actual.rows, expected)
+
+    def test_delete_and_update_recompute_group(self):
+        @dataclass
+        class Foo:
+            name: str
+            age: int
+
+        table = table_(Foo)
+        table.materialize(
+            "ages",
+            "select name, max(age) as oldest from foo group by name",
+        )
+        table.insert(
+            [
+                Foo("Joe", 30),
+                Foo("Joe", 50),
+                Foo("Bill", 40),
+            ]
+        )
+        table.query("delete from foo where age = 50")
+        table.query(
+            "update foo set name = 'Joe' where age = 40"
+        )
+
+        expected = [("Joe", 40)]
+        actual = table.query("select * from ages")
+        self.assertEqual(actual.rows, expected)
+
+    def test_ungrouped(self):
+        @dataclass
+        class Foo:
+            name: str
+            age: int
+
+        table = table_(Foo)
+        table.materialize(
+            "stats",
+            "select count(*) as n, sum(age) from foo",
+        )
+        table.insert([Foo("Joe", 30), Foo("Bill", 40)])
+
+        expected = [(2, 70)]
+        actual = table.query(
+            "select n, sum_age from stats"
+        )
+        self.assertEqual(actual.rows, expected)
+
+    def test_delete_and_update_ungrouped(self):
+        @dataclass
+        class Foo:
+            name: str
+            age: int
+
+        table = table_(Foo)
+        table.materialize(
+            "stats",
+            "select count(*) as n, sum(age) as total, "
+            "min(age) as youngest, avg(age) as mean from foo",
+        )
+        table.insert(
+            [
+                Foo("Joe", 30),
+                Foo("Bill", 40),
+                Foo("Jane", 50),
+            ]
+        )
+        table.query("delete from foo where age = 30")
+        table.query(
+            "update foo set age = 60 where name = 'Bill'"
+        )
+
+        with self.subTest():
+            actual = table.query("select * from stats")
+            self.assertEqual(
+                actual.rows, [(2, 110, 50, 55.0)]
+            )
+
+        # once no values are left, the sum is NULL again
+        table.query("update foo set age = NULL")
+        with self.subTest():
+            actual = table.query("select * from stats")
+            self.assertEqual(
+                actual.rows, [(2, None, None, None)]
+            )
+
+    def test_registered_with_its_tables(self):
+        @dataclass
+        class Foo:
+            name: str
+            age: int
+
+        table = table_(Foo)
+        table.materialize(
+            "ages", "select count(*) as n from foo"
+        )
+        for stmt in [
+            "drop view ages",
+            "drop table _mv_ages",
+            "drop trigger _mv_ages_ai",
+            "drop trigger _mv_ages_ad",
+            "drop trigger _mv_ages_au",
+        ]:
+            table.query(stmt)
+
+        # the name is still registered, so nothing is made
+        with self.assertRaises(DatabaseError):
+            table.materialize(
+                "ages", "select count(*) as n from foo"
+            )
+        actual = table.query(
+            "select name from sqlite_master where name = 'ages'"
+        )
+        self.assertEqual(actual.rows, [])
+
+    def test_unsupported_shape_refreshes(self):
+        @dataclass
+        class Foo:
+            name: str
+            age: int
+
+        table = table_(Foo)
+        table.insert(Foo("Joe", 30))
+        table.materialize(
+            "old",
+            "select name from foo where age > 35",
+        )
+        table.insert(Foo("Bill", 40))
+
+        with self.subTest():
+            actual = table.query("select * from old")
+            self.assertEqual(actual.rows, [])
+
+        table.refresh("old")
+        with self.subTest():
+            actual = table.query("select * from old")
+            self.assertEqual(actual.rows, [("Bill",)])
+
+
+class TestFunctions(unittest.TestCase):
+    TEST_DB = ".test_functions.db"
+
+    def setUp(self) -> None:
+        try:
+            remove(self.TEST_DB)
+        except FileNotFoundError:
+            pass
+
+    def tearDown(self) -> None:
+        self.setUp()
+
+    def test_function_backs_expression_index(self):
+        @dataclass
+        class Foo:
+            name: str
+
+        def initial(name):
+            return name[0]
+
+        table = table_(Foo)
+        table.insert([Foo("Joe"), Foo("Bill")])
+        table.register_function(initial)
+        table.index_expression("initial(name)")
+
+        with self.subTest():
+            actual = table.query(
+                "select name from foo where initial(name) = ?",
+                ("B",),
+            )
+            self.assertEqual(actual.rows, [("Bill",)])
+        with self.subTest():
+            plan = table.query(
+                "explain query plan select name from foo where initial(name) = 'B'"
+            )
+            self.assertIn(
+                "USING INDEX", plan.rows[0].detail
+            )
+
+    def test_function_in_generated_column(self):
+        @dataclass
+        class Foo:
+            name: str
+
+        table = table_(Foo)
+        table.register_function(len, name="length_of")
+        table.query(
+            "alter table foo add column size "
+            "generated always as (length_of(name)) virtual"
+        )
+        table.insert(Foo("Joe"))
+
+        actual = table.query("select size from foo")
+        self.assertEqual(actual.rows, [(3,)])
+
+    def test_aggregate(self):
+        @dataclass
+        class Foo:
+            age: int
+
+        class Product:
+            def __init__(self):
+                self.value = 1
+
+            def step(self, value):
+                self.value *= value
+
+            def finalize(self):
+                return self.value
+
+        table = table_(Foo)
+        table.insert([Foo(2), Foo(3), Foo(4)])
+        table.register_aggregate(Product)
+
+        actual = table.query(
+            "select product(age) as p from foo"
+        )
+        self.assertEqual(actual.rows, [(24,)])
+
+    def test_window(self):
+        @dataclass
+        class Foo:
+            age: int
+
+        class Total:
+            def __init__(self):
+                self.total = 0
+
+            def step(self, value):
+                self.total += value
+
+            def inverse(self, value):
+                self.total -= value
+
+            def value(self):
+                return self.total
+
+            def finalize(self):
+                return self.total
+
+        table = table_(Foo)
+        table.insert([Foo(1), Foo(2), Foo(3)])
+        table.register_window(Total, name="running")
+
+        actual = table.query(
+            "select running(age) over (order by age "
+            "rows between 1 preceding and current row) as r "
+            "from foo"
+        )
+        self.assertEqual(actual.rows, [(1,), (3,), (5,)])
+
+    def test_invalid_name(self):
+        @dataclass
+        class Foo:
+            age: int
+
+        table = table_(Foo)
+        with self.assertRaises(TableError):
+            table.register_function(lambda x: x)
+
+    def test_registered_after_reconnect(self):
+        @dataclass
+        class Foo:
+            name: str
+
+        def initial(name):
+            return name[0]
+
+        table = table_(Foo, self.TEST_DB)
+        table.register_function(initial)
+        table.index_expression("initial(name)")
+        table.close()
+
+        # the index is updated by the insert
+        table.insert(Foo("Joe"))
+        actual = table.query(
+            "select name from foo where initial(name) = ?",
+            ("J",),
+        )
+        self.assertEqual(actual.rows, [("Joe",)])
+
+
+class TestReadOnlyTable(unittest.TestCase):
+    TEST_DB = ".test_readonly_table.db"
+
+    def setUp(self) -> None:
+        try:
+            remove(self.TEST_DB)
+        except FileNotFoundError:
+            pass
+
+    def tearDown(self) -> None:
+        self.setUp()
+
+    def make_db(self):
+        @dataclass
+        class Foo:
+            name: str
+            age: int
+
+        table = table_(Foo, self.TEST_DB)
+        table.insert(Foo("Joe", 30))
+        del table
+        return Foo
+
+    def test_readonly(self):
+        Foo = self.make_db()
+
+        table = table_(Foo, self.TEST_DB, readonly=True)
+
+        with self.subTest():
+            actual = table.query("select * from foo")
+            self.assertEqual(actual.rows, [("Joe", 30)])
+        with self.subTest():
+            with self.assertRaises(DatabaseError):
+                table.insert(Foo("Bill", 40))
+
+    def test_immutable(self):
+        Foo = self.make_db()
+
+        table = table_(Foo, self.TEST_DB, immutable=True)
+
+        actual = table.query("select * from foo")
+        self.assertEqual(actual.rows, [("Joe", 30)])
+
+    def test_schema_checked_on_first_use(self):
+        self.make_db()
+
+        @dataclass
+        class Foo:
+            height: int
+
+        table = table_(Foo, self.TEST_DB, readonly=True)
+        with self.assertRaises(TableError):
+            table.query("select * from foo")
+
+    def test_missing_file(self):
+        @dataclass
+        class Foo:
+            name: str
+
+        with self.assertRaises(TableError):
+            table_(Foo, self.TEST_DB, readonly=True)
+        with self.subTest():
+            self.assertFalse(exists(self.TEST_DB))
+
+
+class TestChanges(unittest.TestCase):
+    def test_inserts_since_token(self):
+        @dataclass
+        class Foo:
+            name: str
+
+        table = table_(Foo)
+        table.insert([Foo("Joe"), Foo("Bill")])
+
+        changes = list(table.changes())
+        token = changes[-1].token
+        table.insert(Foo("Jane"))
+
+        with self.subTest():
+            actual = [c.record for c in changes]
+            self.assertEqual(
+                actual, [Foo("Joe"), Foo("Bill")]
+            )
+        with self.subTest():
+            actual = list(table.changes(since=token))
+            self.assertEqual(
+                actual, [(3, "insert", Foo("Jane"))]
+            )
+
+    def test_tracked_updates_and_deletes(self):
+        @dataclass
+        class Foo:
+            name: str
+            age: int
+
+        table = table_(Foo)
+        table.track_changes()
+        table.insert([Foo("Joe", 30), Foo("Bill", 40)])
+        table.query(
+            "update foo set age = 31 where name = 'Joe'"
+        )
+        table.query("delete from foo where name = 'Bill'")
+
+        expected = [
+            (1, "insert", Foo("Joe", 30)),
+            (2, "insert", Foo("Bill", 40)),
+            (3, "update", Foo("Joe", 31)),
+            (4, "delete", Foo("Bill", 40)),
+        ]
+        actual = list(table.changes(batch_size=3))
+        self.assertEqual(actual, expected)
+
+    def test_follow(self):
+        @dataclass
+        class Foo:
+            name: str
+
+        table = table_(Foo)
+        table.insert(Foo("Joe"))
+
+        feed = table.follow(
+            poll_interval=0.01, timeout=0.05
+        )
+        first = next(feed)
+        table.insert(Foo("Bill"))
+        second = next(feed)
+
+        with self.subTest():
+            self.assertEqual(first.record, Foo("Joe"))
+        with self.subTest():
+            self.assertEqual(second.record, Foo("Bill"))
+        with self.subTest():
+            self.assertEqual(list(feed), [])
+
+
+class TestPaginate(unittest.TestCase):
+    def make_table(self):
+        @dataclass
+        class Foo:
+            name: str
+            age: int
+
+        table = table_(Foo)
+        table.insert(
+            [
+                Foo("Joe", 30),
+                Foo("Bill", 40),
+                Foo("Jane", 30),
+                Foo("Jill", 20),
+                Foo("Jack", 50),
+            ]
+        )
+        return table
+
+    def pages(self, table, **kwargs):
+        pages = []
+        cursor = None
+        while True:
+            page = table.paginate(after=cursor, **kwargs)
+            pages.append([r.name for r in page.rows.rows])
+            cursor = page.cursor
+            if not cursor:
+                return pages
+
+    def test_insertion_order(self):
+        table = self.make_table()
+
+        expected = [
+            ["Joe", "Bill"],
+            ["Jane", "Jill"],
+            ["Jack"],
+        ]
+        actual = self.pages(table, page_size=2)
+        self.assertEqual(actual, expected)
+
+    def test_order_by_with_ties(self):
+        table = self.make_table()
+
+        expected = [
+            ["Jill", "Joe"],
+            ["Jane", "Bill"],
+            ["Jack"],
+        ]
+        actual = self.pages(
+            table, order_by=["age"], page_size=2
+        )
+        self.assertEqual(actual, expected)
+
+    def test_descending_with_filter(self):
+        table = self.make_table()
+
+        expected = [["Jack", "Bill"], ["Jane", "Joe"]]
+        actual = self.pages(
+            table,
+            order_by=["age"],
+            page_size=2,
+            where="age > ?",
+            variables=(20,),
+            descending=True,
+        )
+        self.assertEqual(actual, expected)
+
+    def test_date_keys(self):
+        @dataclass
+        class Foo:
+            name: str
+            dt: datetime
+
+        table = table_(Foo)
+        table.insert(
+            [
+                Foo(
+                    "Joe", datetime(2021, 1, 2, 3, 4, 5, 6)
+                ),
+                Foo("Bill", datetime(2021, 1, 1)),
+            ]
+        )
+
+        expected = [["Bill"], ["Joe"]]
+        actual = self.pages(
+            table, order_by=["dt"], page_size=1
+        )
+        self.assertEqual(actual, expected)
+
+    def test_cursor_for_other_order(self):
+        table = self.make_table()
+        page = table.paginate(
+            order_by=["age"], page_size=1
+        )
+
+        with self.assertRaises(TableError):
+            table.paginate(
+                order_by=["name"], after=page.cursor
+            )
+
+
+class TestSampling(unittest.TestCase):
+    def make_table(self, rows=1000):
+        @dataclass
+        class Foo:
+            num: int
+            even: int
+
+        table = table_(Foo)
+        table.insert(
+            [Foo(i, int(i % 2 == 0)) for i in range(rows)]
+        )
+        return table
+
+    def test_sample_n(self):
+        table = self.make_table()
+        table.query("DELETE FROM foo WHERE num % 3 = 0")
+
+        rows = table.sample(50, seed=1).rows
+        nums = [row.num for row in rows]
+        self.assertEqual(len(set(nums)), 50)
+        self.assertTrue(all(num % 3 for num in nums))
+
+    def test_sample_is_repeatable(self):
+        table = self.make_table()
+        first = table.sample(10, seed=7).rows
+        second = table.sample(10, seed=7).rows
+        self.assertEqual(first, second)
+
+    def test_sample_more_than_table(self):
+        table = self.make_table(rows=5)
+        rows = table.sample(10).rows
+        self.assertEqual(len(rows), 5)
+
+    def test_sample_fraction(self):
+        table = self.make_table()
+        rows = table.sample(fraction=0.1).rows
+        self.assertEqual(len(rows), 100)
+
+    def test_sample_needs_n_or_fraction(self):
+        table = self.make_table()
+        with self.assertRaises(TableError):
+            table.sample()
+        with self.assertRaises(TableError):
+            table.sample(1, fraction=0.5)
+
+    def test_approx(self):
+        table = self.make_table(rows=20000)
+        rows = table.approx(
+            "SELECT count(*), avg(num) AS mean FROM foo WHERE even = ?",
+            (1,),
+            error=0.05,
+            seed=3,
+        ).rows
+
+        expected = [10000, 9999]
+        for est, value in zip(rows, expected):
+            self.assertLessEqual(est.low, est.value)
+            self.assertLessEqual(est.value, est.high)
+            self.assertAlmostEqual(
+                est.value, value, delta=value * 0.1
+            )
+        self.assertEqual(
+            [est.name for est in rows], ["count", "mean"]
+        )
+
+    def test_approx_small_table_is_exact(self):
+        table = self.make_table(rows=100)
+        rows = table.approx(
+            "SELECT sum(num) FROM foo"
+        ).rows
+        self.assertEqual(rows[0].value, 4950)
+        self.assertEqual(rows[0].low, rows[0].high)
+
+    def test_approx_needs_enough_hits(self):
+        table = self.make_table(rows=20000)
+        # the first batch hits a row or two: too few to
+        # judge the spread by
+        rows = table.approx(
+            "SELECT avg(num) FROM foo WHERE num % 400 = 0",
+            error=0.5,
+            seed=3,
+        ).rows
+        self.assertAlmostEqual(
+            rows[0].value, 9800, delta=9800 * 0.5
+        )
+
+    def test_approx_matching_nothing(self):
+        table = self.make_table(rows=20000)
+        rows = table.approx(
+            "SELECT count(*), sum(num) FROM foo WHERE num < 0",
+            max_probes=2000,
+        ).rows
+        count, total = rows
+        self.assertEqual(count.value, 0)
+        self.assertEqual(count.low, 0)
+        # up to about 3 / 2000 of 20000 rows could match
+        self.assertGreater(count.high, 20)
+        self.assertLessEqual(count.high, 30)
+        self.assertEqual(total.value, 0)
+
+    def test_approx_unsupported(self):
+        table = self.make_table()
+        with self.assertRaises(TableError):
+            table.approx("SELECT max(num) FROM foo")
+        with self.assertRaises(TableError):
+            table.approx(
+                "SELECT even, count(*) FROM foo GROUP BY even"
+            )
+
+
+class TestStatistics(unittest.TestCase):
+    @dataclass
+    class Foo:
+        num: int
+        parity: int
+
+    def make_rows(self, count):
+        return [self.Foo(i, i % 2) for i in range(count)]
+
+    def test_not_analyzed(self):
+        table = table_(self.Foo)
+        table.insert(self.make_rows(10))
+
+        stats = table.stats()
+        with self.subTest():
+            self.assertEqual(stats["rows"], 10)
+        with self.subTest():
+            self.assertIsNone(stats["analyzed_rows"])
+        with self.subTest():
+            self.assertIsNone(stats["analyzed_at"])
+
+    def test_analyzed_after_bulk_insert(self):
+        table = table_(self.Foo)
+        table.index_column("parity")
+        table.insert(self.make_rows(1000))
+
+        stats = table.stats()
+        parity = stats["indexes"]["idx_foo_parity"]
+        with self.subTest():
+            self.assertEqual(stats["analyzed_rows"], 1000)
+        with self.subTest():
+            self.assertIsInstance(
+                stats["analyzed_at"], datetime
+            )
+        with self.subTest():
+            self.assertEqual(parity["columns"], ["parity"])
+        with self.subTest():
+            self.assertEqual(parity["selectivity"], 0.5)
+
+    def test_reanalyzed_past_threshold(self):
+        table = table_(self.Foo)
+        table.analyze_threshold = 0.5
+        table.insert(self.make_rows(2000))
+
+        table.insert(self.make_rows(999))
+        self.assertEqual(
+            table.stats()["analyzed_rows"], 2000
+        )
+
+        table.insert(self.make_rows(1))
+        self.assertEqual(
+            table.stats()["analyzed_rows"], 3000
+        )
+
+    def test_no_automatic_analyze(self):
+        table = table_(self.Foo)
+        table.analyze_threshold = None
+        table.insert(self.make_rows(1000))
+        self.assertIsNone(table.stats()["analyzed_rows"])
+
+    def test_new_index_is_analyzed(self):
+        table = table_(self.Foo)
+        table.insert(self.make_rows(1000))
+        table.index_column("num")
+
+        stats = table.stats()
+        num = stats["indexes"]["idx_foo_num"]
+        self.assertEqual(num["selectivity"], 0.001)
+
+
+class TestCompression(unittest.TestCase):
+    PAYLOAD = '{"values": [%s]}' % ", ".join(
+        str(i) for i in range(500)
+    )
+
+    def make_table(self, codec):
+        @dataclass
+        class Foo:
+            name: str
+            payload: str = field(
+                metadata={"compress": codec}
+            )
+            raw: bytes = field(
+                default=None, metadata={"compress": codec}
+            )
+
+        return Foo, table_(Foo)
+
+    def test_round_trip(self):
+        for codec in ("zlib", "lzma"):
+            Foo, table = self.make_table(codec)
+            table.insert(
+                [
+                    Foo(
+                        "Joe", self.PAYLOAD, b"\x00" * 100
+                    ),
+                    Foo("Jill", None),
+                ]
+            )
+
+            expected = [
+                ("Joe", self.PAYLOAD, b"\x00" * 100),
+                ("Jill", None, None),
+            ]
+            actual = table.query("select * from foo").rows
+            with self.subTest(codec=codec):
+                self.assertEqual(actual, expected)
+
+    def test_stored_compressed(self):
+        Foo, table = self.make_table("zlib")
+        table.insert(Foo("Joe", self.PAYLOAD))
+
+        expected = {
+            "name": "TEXT",
+            "payload": "ZTEXT",
+            "raw": "ZBLOB",
+        }
+        with self.subTest():
+            self.assertEqual(
+                table.schema["columns"], expected
+            )
+
+        row = table.query(
+            "select typeof(payload) as typ, length(payload) as size from foo"
+        ).rows[0]
+        with self.subTest():
+            self.assertEqual(row.typ, "blob")
+        with self.subTest():
+            self.assertLess(
+                row.size, len(self.PAYLOAD) / 2
+            )
+
+    def test_sql_functions(self):
+        Foo, table = self.make_table("lzma")
+        table.insert(Foo("Joe", self.PAYLOAD))
+        table.query(
+            "insert into foo (name, payload) values ('Jill', compress(?, 'zlib'))",
+            ('{"values": [4, 5, 6, 7]}',),
+        )
+
+        expected = [(3,), (7,)]
+        actual = table.query(
+            "select json_extract(decompress_text(payload), '$.values[3]') as val from foo"
+        ).rows
+        self.assertEqual(actual, expected)
+
+    def test_written_by_plain_sql(self):
+        Foo, table = self.make_table("zlib")
+        table.insert(Foo("Joe", self.PAYLOAD))
+        table.query(
+            "insert into foo values ('Jill', 'plain', x'00ff')"
+        )
+        add = table.prepare(
+            "insert into foo values (?, ?, ?)"
+        )
+        add.many([("Jack", "also plain", b"raw")])
+
+        expected = [
+            ("Joe", self.PAYLOAD, None),
+            ("Jill", "plain", b"\x00\xff"),
+            ("Jack", "also plain", b"raw"),
+        ]
+        actual = table.query("select * from foo").rows
+        with self.subTest():
+            self.assertEqual(actual, expected)
+
+        # looks compressed, but is not
+        table.query(
+            "update foo set raw = x'ff01' where name = 'Joe'"
+        )
+        with self.subTest():
+            with self.assertRaises(DatabaseError):
+                table.query("select raw from foo")
+
+    def test_invalid(self):
+        @dataclass
+        class Foo:
+            age: int = field(metadata={"compress": "zlib"})
+
+        @dataclass
+        class Bar:
+            name: str = field(metadata={"compress": "zip"})
+
+        with self.subTest():
+            with self.assertRaises(TableError):
+                table_(Foo)
+        with self.subTest():
+            with self.assertRaises(TableError):
+                table_(Bar)
+
+
+class TestDictionaryEncoding(unittest.TestCase):
+    TEST_DB = ".test_dictionary.db"
+
+    @dataclass
+    class Foo:
+        name: str
+        status: str = field(
+            metadata={"encoding": "dictionary"}
+        )
+
+    def setUp(self) -> None:
+        try:
+            remove(self.TEST_DB)
+        except FileNotFoundError:
+            pass
+
+    def tearDown(self) -> None:
+        self.setUp()
+
+    def make_table(self, location=None):
+        table = table_(self.Foo, location)
+        table.insert(
+            [
+                self.Foo("Joe", "active"),
+                self.Foo("Jill", "done"),
+                self.Foo("Jane", None),
+                self.Foo("Jack", "active"),
+            ]
+        )
+        return table
+
+    def test_decoded_on_query(self):
+        table = self.make_table()
+
+        expected = [("Joe", "active"), ("Jack", "active")]
+        actual = table.query(
+            "select * from foo where status = ?",
+            ("active",),
+        )
+        self.assertEqual(actual.rows, expected)
+
+    def test_stored_as_codes(self):
+        table = self.make_table()
+
+        expected = [(1,), (2,), (None,), (1,)]
+        actual = table.query("select status from main.foo")
+        with self.subTest():
+            self.assertEqual(actual.rows, expected)
+
+        expected = [(1, "active"), (2, "done")]
+        actual = table.query(
+            "select * from _dict_foo_status"
+        )
+        with self.subTest():
+            self.assertEqual(actual.rows, expected)
+
+    def test_closed_in_memory(self):
+        table = self.make_table()
+        table.close()
+
+        # starts over with empty dictionaries too
+        table.insert(
+            [
+                self.Foo("Bill", "new"),
+                self.Foo("Bob", "done"),
+            ]
+        )
+        actual = table.query("select * from foo")
+        self.assertEqual(
+            actual.rows, [("Bill", "new"), ("Bob", "done")]
+        )
+
+    def test_reopened(self):
+        self.make_table(self.TEST_DB).close()
+
+        table = table_(self.Foo, self.TEST_DB)
+        table.insert(
+            [
+                self.Foo("Bill", "new"),
+                self.Foo("Bob", "done"),
+            ]
+        )
+
+        expected = [
+            ("active", 2),
+            ("done", 2),
+            ("new", 1),
+        ]
+        actual = table.query(
+            "select status, count(*) as n from foo where status is not null group by status"
+        )
+        self.assertEqual(actual.rows, expected)
+
+    def test_rowid_features(self):
+        table = self.make_table()
+
+        page = table.paginate(
+            page_size=1, where="status = 'done'"
+        )
+        with self.subTest():
+            self.assertEqual(
+                page.rows.rows, [("Jill", "done")]
+            )
+
+        changes = [
+            c.record for c in table.changes(since=3)
+        ]
+        with self.subTest():
+            self.assertEqual(
+                changes, [self.Foo("Jack", "active")]
+            )
+
+    def test_unsupported(self):
+        table = self.make_table()
+
+        with self.subTest():
+            with self.assertRaises(TableError):
+                table.track_changes()
+        with self.subTest():
+            with self.assertRaises(TableError):
+                table.index_text("name")
+
+    def test_invalid(self):
+        @dataclass
+        class Bar:
+            age: int = field(
+                metadata={"encoding": "dictionary"}
+            )
+
+        with self.assertRaises(TableError):
+            table_(Bar)
+
+
+class TestMemory(unittest.TestCase):
+    @dataclass
+    class Foo:
+        num: int
+        name: str
+
+    def make_table(self):
+        table = table_(self.Foo)
+        table.insert(
+            [self.Foo(i, "x" * 100) for i in range(1000)]
+        )
+        table.index_column("num")
+        return table
+
+    def test_storage_report(self):
+        table = self.make_table()
+        report = table.storage_report()
+        objects = report["objects"]
+
+        with self.subTest():
+            self.assertEqual(
+                objects["foo"]["type"], "table"
+            )
+        with self.subTest():
+            index = objects["idx_foo_num"]
+            self.assertEqual(index["type"], "index")
+            self.assertEqual(index["table"], "foo")
+        with self.subTest():
+            self.assertGreater(
+                objects["foo"]["bytes"], 100 * 1000
+            )
+        with self.subTest():
+            total = sum(
+                o["bytes"] for o in objects.values()
+            )
+            self.assertEqual(report["bytes"], total)
+
+    def test_memory_usage(self):
+        table = self.make_table()
+        usage = table.memory_usage()
+
+        with self.subTest():
+            self.assertEqual(
+                usage["database"],
+                table.storage_report()["bytes"],
+            )
+        with self.subTest():
+            self.assertGreater(
+                usage["page_cache_limit"], 0
+            )
+        with self.subTest():
+            self.assertGreater(
+                usage["python"]["rows"]["size"], 0
+            )
+
+    def test_soft_limit(self):
+        try:
+            limits = memory_limits(soft=64 * 2 ** 20)
+            self.assertEqual(limits[0], 64 * 2 ** 20)
+        finally:
+            memory_limits(soft=0)
+
+    def test_hard_limit(self):
+        # the hard limit can never be raised again, so it is
+        # tried in a process of its own
+        code = "\n".join(
+            [
+                "from dataclasses import dataclass",
+                "from table import memory_limits, table",
+                "from table.db import MemoryLimitError",
+                "@dataclass",
+                "class Foo:",
+                "    name: str",
+                "foo = table(Foo)",
+                "memory_limits(hard=32 * 2**20)",
+                "try:",
+                "    foo.insert([Foo('x' * 10**5)] * 1000)",
+                "except MemoryLimitError:",
+                "    print('raised')",
+            ]
+        )
+        output = check_output([sys.executable, "-c", code])
+        self.assertEqual(output.strip(), b"raised")
+
+
+class TestHybridTable(unittest.TestCase):
+    @dataclass
+    class Foo:
+        num: int
+        name: str
+
+    def make_rows(self, start, count):
+        return [
+            self.Foo(i, f"name {i}")
+            for i in range(start, start + count)
+        ]
+
+    def test_stays_in_memory(self):
+        table = table_(self.Foo, spill_at=2 ** 20)
+        table.insert(self.make_rows(0, 10))
+        self.assertIsNone(table.spilled_to)
+
+    def test_spills(self):
+        table = table_(self.Foo, spill_at=2 ** 16)
+        table.register_function(
+            lambda x: x * 2, name="double"
+        )
+        table.insert(self.make_rows(0, 100))
+        self.assertIsNone(table.spilled_to)
+
+        table.insert(self.make_rows(100, 5000))
+        path = table.spilled_to
+        with self.subTest():
+            self.assertTrue(exists(path))
+
+        table.insert(self.make_rows(5100, 10))
+        expected = [(5110, 10218)]
+        actual = table.query(
+            "select count(*) as n, double(max(num)) as m from foo"
+        )
+        with self.subTest():
+            self.assertEqual(actual.rows, expected)
+
+        table.close()
+        with self.subTest():
+            self.assertFalse(exists(path))
+
+    def test_only_in_memory(self):
+        with self.assertRaises(TableError):
+            table_(self.Foo, "foo.db", spill_at=2 ** 20)
+
+
+class TestPreload(unittest.TestCase):
+    TEST_DB = ".test_preload.db"
+
+    @dataclass
+    class Foo:
+        num: int
+
+    def setUp(self) -> None:
+        try:
+            remove(self.TEST_DB)
+        except FileNotFoundError:
+            pass
+        table = table_(self.Foo, self.TEST_DB)
+        table.insert([self.Foo(i) for i in range(10)])
+        table.close()
+
+    def tearDown(self) -> None:
+        remove(self.TEST_DB)
+
+    def count(self):
+        table = table_(self.Foo, self.TEST_DB)
+        return table.query(
+            "select count(*) as n from foo"
+        ).rows
+
+    def test_served_from_memory(self):
+        table = table_(
+            self.Foo, self.TEST_DB, preload=True
+        )
+        table.insert(self.Foo(10))
+
+        with self.subTest():
+            self.assertEqual(table._db.db, ":memory:")
+        with self.subTest():
+            actual = table.query(
+                "select count(*) as n from foo"
+            )
+            self.assertEqual(actual.rows, [(11,)])
+        with self.subTest():
+            self.assertEqual(self.count(), [(10,)])
+
+    def test_sync_and_close(self):
+        table = table_(
+            self.Foo, self.TEST_DB, preload=True
+        )
+        with self.subTest():
+            self.assertFalse(table.sync())
+
+        table.insert(self.Foo(10))
+        with self.subTest():
+            self.assertTrue(table.sync())
+            self.assertEqual(self.count(), [(11,)])
+
+        table.insert(self.Foo(11))
+        table.close()
+        with self.subTest():
+            self.assertEqual(self.count(), [(12,)])
+
+    def test_write_back_interval(self):
+        table = table_(
+            self.Foo,
+            self.TEST_DB,
+            preload=True,
+            write_back=0,
+        )
+        table.insert(self.Foo(10))
+        self.assertEqual(self.count(), [(11,)])
+
+    def test_readonly(self):
+        table = table_(
+            self.Foo,
+            self.TEST_DB,
+            preload=True,
+            readonly=True,
+        )
+        with self.assertRaises(DatabaseError):
+            table.insert(self.Foo(10))
+
+    def test_only_persistent(self):
+        with self.assertRaises(TableError):
+            table_(self.Foo, preload=True)
+
+
+# module level, so worker processes can unpickle them
+@dataclass
+class Reading:
+    sensor: str
+    value: int
+    note: str = field(metadata={"compress": "zlib"})
+
+
+@dataclass
+class Tag:
+    label: str = field(metadata={"encoding": "dictionary"})
+    weight: int
+
+
+def read_tags(path: str):
+    with open(path) as f:
+        for line in f:
+            label, weight = line.split()
+            yield Tag(label, int(weight))
+
+
+class TestParallelLoad(unittest.TestCase):
+    def setUp(self) -> None:
+        self.dir = ".parallel_load"
+        rmtree(self.dir, ignore_errors=True)
+        makedirs(self.dir)
+
+    def tearDown(self) -> None:
+        rmtree(self.dir, ignore_errors=True)
+
+    def test_records(self):
+        readings = table_(Reading)
+        readings.index_column("sensor")
+        readings.insert(Reading("x", -1, "existing"))
+
+        data = [
+            Reading(f"s{i % 7}", i, f"note {i}" * 10)
+            for i in range(25000)
+        ]
+        loaded = readings.parallel_load(data, workers=3)
+        self.assertEqual(loaded, 25000)
+
+        rows = readings.query(
+            "select * from reading order by value"
+        ).rows
+        rows = [Reading(*row) for row in rows]
+        self.assertEqual(
+            rows[0], Reading("x", -1, "existing")
+        )
+        self.assertEqual(rows[1:], data)
+
+        # the index was dropped for the merge and rebuilt
+        plan = readings.query(
+            "explain query plan select * from reading where sensor = 's3'"
+        )
+        self.assertIn("USING INDEX", plan.rows[0].detail)
+
+    def test_files_with_dictionary_encoding(self):
+        paths = []
+        for idx in range(4):
+            path = join(self.dir, f"tags_{idx}.txt")
+            with open(path, "w") as f:
+                for weight in range(100):
+                    label = ["red", "green", "blue"][
+                        weight % 3
+                    ]
+                    f.write(f"{label} {weight}\n")
+            paths.append(path)
+
+        location = join(self.dir, "tags.db")
+        tags = table_(Tag, location)
+        tags.insert(Tag("blue", 1000))
+        loaded = tags.parallel_load(
+            paths, workers=2, loader=read_tags
+        )
+        self.assertEqual(loaded, 400)
+
+        output = tags.query(
+            "select label, count(*) as n from tag group by label order by label"
+        )
+        self.assertEqual(
+            [tuple(row) for row in output.rows],
+            [("blue", 133), ("green", 132), ("red", 136)],
+        )
+
+        # values are encoded once each, existing codes kept
+        codes = tags.query(
+            "select code, value from main._dict_tag_label order by code"
+        )
+        self.assertEqual(
+            [row.value for row in codes.rows],
+            ["blue", "red", "green"],
+        )
+        tags.close()
+
+    def test_worker_error(self):
+        readings = table_(Reading)
+        with self.assertRaises(TypeError):
+            readings.parallel_load(["wrong"], workers=1)
+        self.assertEqual(
+            readings.query("select * from reading").rows,
+            [],
+        )
+
+    def test_not_supported(self):
+        @dataclass
+        class Event:
+            day: date
+            value: int
+
+        events = table_(
+            Event,
+            join(self.dir, "events"),
+            partition_by="day",
+        )
+        with self.assertRaises(TableError):
+            events.parallel_load([Event(date.today(), 1)])
+        with self.assertRaises(TableError):
+            events.parallel_load(
+                [Event(date.today(), 1)], 2
+            )
+
+    def test_positional_arguments(self):
+        location = join(self.dir, "readings.db")
+        readings = table_(Reading, location)
+        data = [Reading("s", i, "") for i in range(100)]
+        # same signature as on in-memory tables
+        self.assertEqual(
+            readings.parallel_load(data, 2), 100
+        )
+        readings.close()
+
+
+class TestQueryLimits(unittest.TestCase):
+    # counts forever, unless interrupted
+    FOREVER = "with recursive c(x) as (select 1 union all select x + 1 from c) select count(*) as n from c"
+
+    def setUp(self) -> None:
+        @dataclass
+        class Foo:
+            x: int
+
+        self.Foo = Foo
+        self.table = table_(Foo)
+        self.table.insert([Foo(i) for i in range(10)])
+
+    def test_timeout(self):
+        start = monotonic()
+        with self.assertRaises(QueryInterruptedError) as e:
+            self.table.query(self.FOREVER, timeout=0.1)
+        self.assertLess(monotonic() - start, 2)
+        self.assertIn("timed out", str(e.exception))
+        self.assertIsInstance(e.exception, DatabaseError)
+
+        # the connection is still usable
+        output = self.table.query(
+            "select count(*) as n from foo", timeout=0.1
+        )
+        self.assertEqual(output.rows[0].n, 10)
+
+    def test_max_vm_steps(self):
+        with self.assertRaises(QueryInterruptedError) as e:
+            self.table.query(
+                self.FOREVER, max_vm_steps=10000
+            )
+        self.assertIn("VM steps", str(e.exception))
+
+        output = self.table.query(
+            "select * from foo", max_vm_steps=10000
+        )
+        self.assertEqual(len(output.rows), 10)
+
+    def test_table_defaults(self):
+        self.table.timeout = 0.1
+        with self.assertRaises(QueryInterruptedError):
+            self.table.query(self.FOREVER)
+
+        # a call's own limits take precedence
+        self.table.timeout = 60
+        with self.assertRaises(QueryInterruptedError):
+            self.table.query(self.FOREVER, timeout=0.1)
+
+    def test_cancel_from_another_thread(self):
+        cancel = Cancellation()
+        Timer(0.1, cancel.cancel).start()
+        with self.assertRaises(QueryInterruptedError) as e:
+            self.table.query(self.FOREVER, cancel=cancel)
+        self.assertIn("cancelled", str(e.exception))
+
+        # stays cancelled
+        with self.assertRaises(QueryInterruptedError):
+            self.table.query(
+                "select 1 as x", cancel=cancel
+            )
+
+    def test_interrupted_write_is_rolled_back(self):
+        stmt = "insert into foo with recursive c(x) as (select 100 union all select x + 1 from c) select x from c"
+        with self.assertRaises(QueryInterruptedError):
+            self.table.query(stmt, timeout=0.1)
+
+        output = self.table.query(
+            "select count(*) as n from foo"
+        )
+        self.assertEqual(output.rows[0].n, 10)
+
+
+class TestPrepare(unittest.TestCase):
+    def setUp(self) -> None:
+        @dataclass
+        class Foo:
+            name: str
+            age: int
+
+        self.Foo = Foo
+        self.table = table_(Foo)
+
+    def test_query(self):
+        self.table.insert(
+            [self.Foo(f"n{i}", i) for i in range(10)]
+        )
+        older_than = self.table.prepare(
+            "select name, age from foo where age > ? order by age"
+        )
+        first = older_than((7,))
+        self.assertEqual(
+            [tuple(row) for row in first.rows],
+            [("n8", 8), ("n9", 9)],
+        )
+        second = older_than((8,))
+        self.assertEqual(second.rows[0].name, "n9")
+        self.assertEqual(older_than((100,)).rows, [])
+
+        # the row type is resolved once
+        self.assertIs(
+            type(first.rows[0]), type(second.rows[0])
+        )
+
+    def test_many(self):
+        add = self.table.prepare(
+            "insert into foo values (?, ?)"
+        )
+        changed = add.many([("Joe", 30), ("Bob", 40)])
+        self.assertEqual(changed, 2)
+        self.assertEqual(add(("Ann", 50)).rows, [])
+
+        output = self.table.query(
+            "select count(*) as n from foo"
+        )
+        self.assertEqual(output.rows[0].n, 3)
+
+        # all or nothing
+        with self.assertRaises(DatabaseError):
+            add.many([("Kim", 20), ("Lee",)])
+        output = self.table.query(
+            "select count(*) as n from foo"
+        )
+        self.assertEqual(output.rows[0].n, 3)
+
+    def test_many_reads(self):
+        self.table.insert(
+            [self.Foo(f"n{i}", i) for i in range(10)]
+        )
+        by_age = self.table.prepare(
+            "select name from foo where age = ?"
+        )
+        output = by_age.many([(1,), (100,), (3,)])
+        self.assertEqual(
+            [result.rows for result in output],
+            [[("n1",)], [], [("n3",)]],
+        )
+
+    def test_table_limits(self):
+        self.table.max_vm_steps = 10000
+        forever = self.table.prepare(
+            TestQueryLimits.FOREVER
+        )
+        with self.assertRaises(QueryInterruptedError):
+            forever()
+
+    def test_limits_fixed_when_prepared(self):
+        self.table.max_vm_steps = 10000
+        forever = self.table.prepare(
+            TestQueryLimits.FOREVER
+        )
+        # neither lifts nor adds to the prepared limits
+        self.table.max_vm_steps = None
+        with self.assertRaises(QueryInterruptedError):
+            forever()
+
+        count = self.table.prepare(
+            "select count(*) as n from foo"
+        )
+        self.table.max_vm_steps = 1
+        self.assertEqual(count().rows[0].n, 0)
+
+    def test_survives_reconnect(self):
+        @dataclass
+        class Bar:
+            value: str
+
+        bar = table_(Bar, spill_at=64 * 1024)
+        count = bar.prepare(
+            "select count(*) as n from bar"
+        )
+        self.assertEqual(count().rows[0].n, 0)
+
+        bar.insert([Bar("x" * 1000) for _ in range(100)])
+        self.assertIsNotNone(bar.spilled_to)
+        self.assertEqual(count().rows[0].n, 100)
+        bar.close()
+
+    def test_statement_cache(self):
+        default = statement_cache()
+        try:
+            self.assertEqual(statement_cache(512), 512)
+            self.table.query("select 1 as x")
+            self.assertEqual(
+                self.table._db.cached_statements, 512
+            )
+        finally:
+            statement_cache(default)
+
+
+class TestThreadsafe(unittest.TestCase):
+    def setUp(self) -> None:
+        @dataclass
+        class Foo:
+            name: str
+            age: int
+
+        self.Foo = Foo
+        self.db = ".threadsafe.db"
+        self.tearDown()
+
+    def tearDown(self) -> None:
+        for suffix in ("", "-wal", "-shm"):
+            if exists(self.db + suffix):
+                remove(self.db + suffix)
+
+    def hammer(self, table, existing: int = 0) -> None:
+        def work(idx: int) -> int:
+            table.insert(
+                [self.Foo(f"n{idx}", i) for i in range(10)]
+            )
+            output = table.query(
+                "select count(*) as n from foo where name = ?",
+                (f"n{idx}",),
+            )
+            return output.rows[0].n
+
+        with ThreadPoolExecutor(8) as pool:
+            counts = list(pool.map(work, range(200)))
+
+        self.assertEqual(counts, [10] * 200)
+        output = table.query(
+            "select count(*) as n from foo"
+        )
+        self.assertEqual(output.rows[0].n, 2000 + existing)
+
+    def test_in_memory(self):
+        self.hammer(table_(self.Foo, threadsafe=True))
+
+    def test_persistent(self):
+        foo = table_(self.Foo, self.db, threadsafe=True)
+        self.hammer(foo)
+        mode = foo.query("pragma journal_mode").rows[0]
+        self.assertEqual(mode.journal_mode, "wal")
+        foo.close()
+
+    def test_created_in_another_thread(self):
+        foo = table_(self.Foo, threadsafe=True)
+        worker = Thread(
+            target=foo.insert, args=(self.Foo("Joe", 30),)
+        )
+        worker.start()
+        worker.join()
+        self.assertEqual(
+            foo.query("select name from foo").rows[0].name,
+            "Joe",
+        )
+
+    def test_functions_reach_every_thread(self):
+        foo = table_(self.Foo, threadsafe=True)
+        foo.insert(self.Foo("joe", 30))
+
+        # a thread connects before the function exists
+        with ThreadPoolExecutor(1) as pool:
+            pool.submit(
+                foo.query, "select 1 as x"
+            ).result()
+            foo.register_function(str.upper, name="upper2")
+            output = pool.submit(
+                foo.query,
+                "select upper2(name) as n from foo",
+            ).result()
+        self.assertEqual(output.rows[0].n, "JOE")
+
+    def test_prepared(self):
+        foo = table_(self.Foo, threadsafe=True)
+        add = foo.prepare("insert into foo values (?, ?)")
+        count = foo.prepare(
+            "select count(*) as n from foo"
+        )
+
+        with ThreadPoolExecutor(4) as pool:
+            list(
+                pool.map(
+                    lambda i: add(("x", i)), range(100)
+                )
+            )
+            output = pool.submit(count).result()
+        self.assertEqual(output.rows[0].n, 100)
+
+    def test_preload_wal_file(self):
+        foo = table_(self.Foo, self.db, threadsafe=True)
+        foo.insert(self.Foo("Joe", 30))
+        foo.close()
+
+        foo = table_(
+            self.Foo,
+            self.db,
+            preload=True,
+            threadsafe=True,
+        )
+        self.hammer(foo, existing=1)
+        self.assertTrue(foo.sync())
+        foo.close()
+
+        foo = table_(self.Foo, self.db)
+        output = foo.query("select count(*) as n from foo")
+        self.assertEqual(output.rows[0].n, 2001)
+        foo.close()
+
+    def test_not_supported(self):
+        with self.assertRaises(TableError):
+            table_(
+                self.Foo, spill_at=1024, threadsafe=True
+            )
+
+
+class TestSharedMemory(unittest.TestCase):
+    def setUp(self) -> None:
+        @dataclass
+        class Ref:
+            code: str = field(
+                metadata={"encoding": "dictionary"}
+            )
+            value: int
+
+        self.Ref = Ref
+        self.name = "test_table_shm"
+        self.path = None
+
+    def tearDown(self) -> None:
+        if self.path and exists(self.path):
+            remove(self.path)
+
+    def test_publish_and_follow(self):
+        leader = table_(self.Ref)
+        leader.insert([self.Ref("a", 1), self.Ref("b", 2)])
+        self.path = leader.publish(self.name)
+
+        reader = table_(self.Ref, shared_memory=self.name)
+        output = reader.query(
+            "select * from ref order by value"
+        )
+        self.assertEqual(
+            [tuple(row) for row in output.rows],
+            [("a", 1), ("b", 2)],
+        )
+        with self.assertRaises(DatabaseError):
+            reader.query(
+                "insert into main.ref values (1, 3)"
+            )
+
+        # a refreshed version is swapped in atomically
+        leader.insert(self.Ref("c", 3))
+        self.assertEqual(
+            leader.publish(self.name), self.path
+        )
+        output = reader.query(
+            "select count(*) as n from ref"
+        )
+        self.assertEqual(output.rows[0].n, 3)
+
+    def test_other_process(self):
+        leader = table_(self.Ref)
+        leader.insert(self.Ref("a", 1))
+        self.path = leader.publish(self.name)
+
+        code = (
+            "from dataclasses import dataclass, field; "
+            "from table import table\n"
+            "@dataclass\n"
+            "class Ref:\n"
+            "    code: str = field(metadata={'encoding': 'dictionary'})\n"
+            "    value: int\n"
+            f"t = table(Ref, shared_memory='{self.name}')\n"
+            "print(t.query('select code from ref').rows[0].code)"
+        )
+        output = check_output([sys.executable, "-c", code])
+        self.assertEqual(output.strip(), b"a")
+
+    def test_errors(self):
+        with self.assertRaises(TableError):
+            table_(self.Ref, shared_memory="not/valid")
+        with self.assertRaises(TableError):
+            table_(
+                self.Ref, shared_memory="never_published"
+            )
+        with self.assertRaises(TableError):
+            table_(
+                self.Ref,
+                "ref.db",
+                shared_memory=self.name,
+            )
+
+
+class TestChecksum(unittest.TestCase):
+    def setUp(self) -> None:
+        @dataclass
+        class Item:
+            id: int
+            kind: str = field(
+                metadata={"encoding": "dictionary"}
+            )
+            notes: str = field(
+                metadata={"compress": "zlib"}
+            )
+            price: float
+
+        self.Item = Item
+        self.items = [
+            Item(i, f"kind{i % 7}", f"note {i}" * 5, i / 4)
+            for i in range(3000)
+        ]
+
+    def copies(self):
+        first, second = table_(self.Item), table_(
+            self.Item
+        )
+        first.insert(self.items)
+        second.insert(self.items)
+        return first, second
+
+    def test_checksum(self):
+        first, second = self.copies()
+        self.assertEqual(
+            first.checksum(), second.checksum()
+        )
+
+        whole = first.checksum()[0]
+        self.assertEqual(
+            (whole.low, whole.high, whole.rows),
+            (1, 3000, 3000),
+        )
+
+        # ranges add up to the whole
+        parts = first.checksum(ranges=4)
+        self.assertEqual(len(parts), 4)
+        self.assertEqual(sum(p.rows for p in parts), 3000)
+        self.assertEqual(
+            combine([p.digest for p in parts]),
+            whole.digest,
+        )
+        self.assertEqual(
+            first.checksum(ranges=[(1, 750)])[0], parts[0]
+        )
+
+        second.query(
+            "update main.item set price = 0 where id = 10"
+        )
+        self.assertNotEqual(
+            first.checksum(ranges=4)[0],
+            second.checksum(ranges=4)[0],
+        )
+        self.assertEqual(
+            first.checksum(ranges=4)[1:],
+            second.checksum(ranges=4)[1:],
+        )
+        self.assertEqual(table_(self.Item).checksum(), [])
+
+    def test_diff_and_sync(self):
+        first, second = self.copies()
+        self.assertEqual(first.diff(second), ([], [], []))
+
+        second.query(
+            "update main.item set price = 0 where id = 10"
+        )
+        second.query(
+            "delete from main.item where id = 2500"
+        )
+        second.insert(self.Item(9999, "new", "extra", 1.0))
+        diff = first.diff(second)
+        self.assertEqual(diff.missing, [2501])
+        self.assertEqual(diff.extra, [3001])
+        self.assertEqual(diff.changed, [11])
+
+        self.assertEqual(first.sync_to(second), diff)
+        self.assertEqual(first.diff(second), ([], [], []))
+        self.assertEqual(
+            first.checksum(), second.checksum()
+        )
+        output = second.query(
+            "select * from item where id in (10, 2500) order by id"
+        )
+        self.assertEqual(
+            [tuple(row) for row in output.rows],
+            [
+                astuple(self.items[10]),
+                astuple(self.items[2500]),
+            ],
+        )
+
+    def test_key(self):
+        first, second = table_(self.Item), table_(
+            self.Item
+        )
+        first.insert(self.items)
+        second.insert(self.items[::-1])
+        self.assertNotEqual(
+            first.checksum(), second.checksum()
+        )
+        self.assertEqual(
+            first.checksum(key="id"),
+            second.checksum(key="id"),
+        )
+
+        first.query("delete from main.item where id = 5")
+        diff = first.sync_to(second, key="id")
+        self.assertEqual(diff, ([], [5], []))
+        self.assertEqual(
+            first.checksum(key="id"),
+            second.checksum(key="id"),
+        )
+
+    def test_errors(self):
+        first, second = self.copies()
+        with self.assertRaises(TableError):
+            first.checksum(key="kind")
+
+        @dataclass
+        class Other:
+            id: int
+
+        with self.assertRaises(TableError):
+            first.diff(table_(Other))
+
+
+class TestDedupe(unittest.TestCase):
+    TEST_DIR = ".test_dedupe"
+
+    def setUp(self) -> None:
+        rmtree(self.TEST_DIR, ignore_errors=True)
+        makedirs(self.TEST_DIR)
+
+        @dataclass
+        class Event:
+            source: str = field(
+                metadata={"encoding": "dictionary"}
+            )
+            body: str = field(
+                metadata={"compress": "zlib"}
+            )
+            day: date
+
+        self.Event = Event
+        self.events = [
+            Event(
+                f"feed{i % 3}",
+                f"event {i}" * 4,
+                date(2021, 1, 1 + i % 28),
+            )
+            for i in range(100)
+        ]
+
+    def tearDown(self) -> None:
+        rmtree(self.TEST_DIR, ignore_errors=True)
+
+    def count(self, tbl) -> int:
+        return (
+            tbl.query("select count(*) as n from event")
+            .rows[0]
+            .n
+        )
+
+    def test_skips_duplicates(self):
+        tbl = table_(self.Event)
+        batch = self.events[:60] + self.events[:10]
+        self.assertEqual(
+            tbl.insert(batch, dedupe=True), (60, 10)
+        )
+        # redelivered, with a few new ones
+        self.assertEqual(
+            tbl.insert(self.events[50:], dedupe=True),
+            (40, 10),
+        )
+        self.assertEqual(
+            tbl.insert(self.events[0], dedupe=True), (0, 1)
+        )
+        self.assertEqual(self.count(tbl), 100)
+
+        # kept in arrival order
+        output = tbl.query(
+            "select body from event limit 2"
+        )
+        self.assertEqual(
+            [row.body for row in output.rows],
+            [self.events[0].body, self.events[1].body],
+        )
+
+    def test_existing_rows_and_changes(self):
+        path = join(self.TEST_DIR, "event.db")
+        tbl = table_(self.Event, path)
+        tbl.insert(self.events[:10])
+        self.assertEqual(
+            tbl.insert(self.events[:20], dedupe=True),
+            (10, 10),
+        )
+
+        # the hashes follow deletes and updates
+        tbl.query("delete from main.event where rowid = 1")
+        tbl.query(
+            "update main.event set body = null where rowid = 2"
+        )
+        self.assertEqual(
+            tbl.insert(self.events[:3], dedupe=True),
+            (2, 1),
+        )
+        tbl.close()
+
+        reopened = table_(self.Event, path)
+        self.assertEqual(
+            reopened.insert(self.events, dedupe=True),
+            (80, 20),
+        )
+        # and the changed row stays
+        self.assertEqual(self.count(reopened), 101)
+
+    def test_converted_values(self):
+        @dataclass
+        class Price:
+            item: str
+            amount: float
+
+        tbl = table_(Price)
+        # stored as 2.0, and compared as stored
+        tbl.insert(Price("tea", 2))
+        self.assertEqual(
+            tbl.insert(Price("tea", 2), dedupe=True),
+            (0, 1),
+        )
+        self.assertEqual(
+            tbl.insert(
+                [Price("tea", 2.0), Price("tea", 2)],
+                dedupe=True,
+            ),
+            (0, 2),
+        )
+        self.assertEqual(
+            tbl.insert(
+                [Price("jam", 3), Price("jam", 3.0)],
+                dedupe=True,
+            ),
+            (1, 1),
+        )
+
+    def test_partitioned(self):
+        @dataclass
+        class Visit:
+            page: str
+            day: date
+
+        visits = [
+            Visit(f"page{i}", date(2021, 1 + i % 3, 1))
+            for i in range(30)
+        ]
+        tbl = table_(
+            Visit,
+            join(self.TEST_DIR, "parts"),
+            partition_by="day",
+        )
+        self.assertEqual(
+            tbl.insert(visits * 2, dedupe=True), (30, 30)
+        )
+        self.assertEqual(
+            tbl.insert(visits[:5], dedupe=True), (0, 5)
+        )
+        self.assertTrue(tbl.insert(visits[:1]))
+
+        # a dropped partition comes back without hashes
+        tbl.drop_partitions(older_than=date(2021, 2, 1))
+        self.assertEqual(
+            tbl.insert(visits[:3], dedupe=True), (1, 2)
+        )
+
+    def test_close(self):
+        tbl = table_(self.Event)
+        tbl.insert(self.events[:5], dedupe=True)
+        tbl.close()
+        # in memory, so it starts over empty
+        self.assertEqual(
+            tbl.insert(self.events[:5], dedupe=True),
+            (5, 0),
+        )
+
+
+class TestCompact(unittest.TestCase):
+    TEST_DIR = ".test_compact"
+
+    def setUp(self) -> None:
+        rmtree(self.TEST_DIR, ignore_errors=True)
+        makedirs(self.TEST_DIR)
+
+        @dataclass
+        class Purchase:
+            customer_id: int
+            note: str
+
+        self.Purchase = Purchase
+        self.orders = [
+            Purchase(i % 50, f"order {i} " + "x" * 200)
+            for i in range(2000)
+        ]
+
+    def tearDown(self) -> None:
+        rmtree(self.TEST_DIR, ignore_errors=True)
+
+    def test_compact(self):
+        tbl = table_(
+            self.Purchase,
+            join(self.TEST_DIR, "purchase.db"),
+        )
+        tbl.insert(self.orders)
+        tbl.query(
+            "delete from purchase where rowid <= 1000"
+        )
+        tbl.index_column("customer_id")
+        tbl.index_text("note")
+        tbl.track_changes()
+        tbl.insert(self.orders[1999:], dedupe=True)
+        tbl.analyze()
+
+        report = tbl.compact(order_by=["customer_id"])
+        self.assertGreater(report["before"]["free"], 0)
+        self.assertEqual(report["after"]["free"], 0)
+        self.assertLess(
+            report["after"]["pages"],
+            report["before"]["pages"],
+        )
+
+        # rows now sit in customer order
+        output = tbl.query(
+            "select customer_id from purchase order by rowid"
+        )
+        ids = [row.customer_id for row in output.rows]
+        self.assertEqual(len(ids), 1000)
+        self.assertEqual(ids, sorted(ids))
+
+        # indexes, triggers and statistics carry on
+        stats = tbl.stats()
+        self.assertEqual(
+            stats["indexes"]["idx_purchase_customer_id"][
+                "columns"
+            ],
+            ["customer_id"],
+        )
+        self.assertEqual(stats["analyzed_rows"], 1000)
+        self.assertEqual(
+            [
+                r.customer_id
+                for r in tbl.search('"order 1007"')
+            ],
+            [7],
+        )
+        self.assertEqual(
+            tbl.insert(
+                self.orders[1000:1002], dedupe=True
+            ),
+            (0, 2),
+        )
+        # compacting is not a change
+        self.assertEqual(list(tbl.changes()), [])
+        tbl.insert(self.orders[30])
+        self.assertEqual(len(list(tbl.changes())), 1)
+
+    def test_dictionary_encoded_and_online(self):
+        @dataclass
+        class Visit:
+            page: str = field(
+                metadata={"encoding": "dictionary"}
+            )
+            ms: int
+
+        tbl = table_(
+            Visit, join(self.TEST_DIR, "visit.db")
+        )
+        tbl.insert(
+            [Visit(f"page{i % 5}", i) for i in range(500)]
+        )
+        tbl.index_column("ms")
+
+        report = tbl.compact(
+            order_by=["page"], online=True
+        )
+        self.assertEqual(
+            set(report["after"]), {"pages", "free"}
+        )
+        output = tbl.query(
+            "select count(*) as n from visit where page = 'page3'"
+        )
+        self.assertEqual(output.rows[0].n, 100)
+        output = tbl.query("pragma journal_mode")
+        self.assertEqual(
+            output.rows[0].journal_mode, "wal"
+        )
+
+    def test_dictionary_encoded_vacuum(self):
+        @dataclass
+        class Visit:
+            page: str = field(
+                metadata={"encoding": "dictionary"}
+            )
+            ms: int
+
+        tbl = table_(
+            Visit, join(self.TEST_DIR, "visit.db")
+        )
+        tbl.insert(
+            [Visit(f"page{i % 5}", i) for i in range(500)]
+        )
+        tbl.index_column("ms")
+
+        report = tbl.compact(order_by=["page"])
+        self.assertEqual(report["after"]["free"], 0)
+        # decoded again afterwards
+        output = tbl.query(
+            "select ms from visit where page = 'page3' order by ms limit 2"
+        )
+        self.assertEqual(output.rows, [(3,), (8,)])
+
+    def test_errors(self):
+        tbl = table_(self.Purchase)
+        with self.assertRaises(TableError):
+            tbl.compact(order_by=["missing"])
+
+
+class TestRangeIndex(unittest.TestCase):
+    def setUp(self) -> None:
+        @dataclass
+        class Place:
+            name: str
+            lat: float
+            lon: float
+
+        @dataclass
+        class Booking:
+            guest: str
+            start: date
+            end: date
+
+        self.Place = Place
+        self.Booking = Booking
+        self.places = [
+            Place(f"p{i}_{j}", i / 10, j / 10 - 5)
+            for i in range(50)
+            for j in range(100)
+        ]
+
+    def test_points(self):
+        tbl = table_(self.Place)
+        tbl.insert(self.places)
+        tbl.index_range(["lat", "lon"])
+
+        def brute(lat, lon):
+            return [
+                p
+                for p in self.places
+                if lat[0] <= p.lat <= lat[1]
+                and lon[0] <= p.lon <= lon[1]
+            ]
+
+        box = dict(lat=(1.05, 1.35), lon=(-0.15, 0.2))
+        self.assertEqual(tbl.within(**box), brute(**box))
+        self.assertEqual(len(tbl.within(**box)), 9)
+        # open ended, and on one pair only
+        self.assertEqual(
+            len(tbl.within(lat=(None, 0.05))), 100
+        )
+
+        # kept in sync with the table
+        tbl.query(
+            "update place set lat = 99 where name = 'p11_50'"
+        )
+        tbl.query(
+            "delete from place where name = 'p12_50'"
+        )
+        tbl.insert(self.Place("new", 1.2, 0.0))
+        names = [p.name for p in tbl.within(**box)]
+        self.assertNotIn("p11_50", names)
+        self.assertNotIn("p12_50", names)
+        self.assertIn("new", names)
+        self.assertEqual(len(names), 8)
+
+        # and through compaction, which renumbers rowids
+        tbl.compact(order_by=["lon"])
+        self.assertEqual(
+            sorted(p.name for p in tbl.within(**box)),
+            sorted(names),
+        )
+
+    def test_intervals(self):
+        tbl = table_(self.Booking)
+        bookings = [
+            self.Booking(
+                f"g{i}",
+                date(2021, 1, 1) + timedelta(days=i),
+                date(2021, 1, 1)
+                + timedelta(days=i + i % 4),
+            )
+            for i in range(200)
+        ]
+        bookings.append(
+            self.Booking("open", date(2021, 3, 1), None)
+        )
+        tbl.insert(bookings)
+        tbl.index_range([("start", "end")])
+
+        low, high = date(2021, 3, 1), date(2021, 3, 3)
+        expected = [
+            b
+            for b in bookings
+            if b.end is not None
+            and b.start <= high
+            and b.end >= low
+        ]
+        self.assertEqual(
+            tbl.within(start=(low, high)), expected
+        )
+        self.assertEqual(
+            [b.guest for b in expected],
+            ["g58", "g59", "g60", "g61"],
+        )
+
+    def test_errors(self):
+        tbl = table_(self.Place)
+        with self.assertRaises(TableError):
+            tbl.within(lat=(0, 1))
+        with self.assertRaises(TableError):
+            tbl.index_range(["name"])
+        with self.assertRaises(TableError):
+            tbl.index_range([])
+
+        tbl.index_range(["lat"])
+        with self.assertRaises(TableError):
+            tbl.within(lon=(0, 1))
+
+        with self.assertRaises(TableError):
+            table_(self.Booking).index_range(
+                [("start", "start"), ("start", "end")]
+            )